@@ -0,0 +1,146 @@
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+# Concurrency sweep: N clients send /chat back to back for a few seconds while a probe
+# pages GET /emails/summary, against the async handlers and against blocking copies of
+# the same two handlers (sync def, blocking Session, blocking LLM client), which is how
+# every route worked before. Blocking handlers run in the threadpool (40 threads), so
+# once N passes that, chat throughput stops growing and the /emails probe queues behind
+# the chats. The LLM is the fake server with a fixed latency, in its own process so it
+# doesn't compete with the app for the GIL.
+#
+#   python -m backend.benchmarks.bench_concurrency [--levels 20,40,80,120] [--seconds 5]
+#       [--llm-latency 1.0] [--emails 2000]
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_concurrency.db')}")
+os.environ.setdefault("VECTOR_INDEX_PATH", os.path.join(tempfile.mkdtemp(), "vector_index.npz"))
+os.environ["LLM_CACHE"] = "0"
+os.environ["LLM_PROVIDER"] = "openai"
+
+import httpx
+from fastapi import Depends, Request
+from sqlalchemy import select
+from backend import database, models, schemas
+from backend.benchmarks import synthetic_inbox
+from backend.benchmarks.load_test import percentile
+from backend.services import mock_data
+
+QUERIES = ["What needs my attention today?", "Summarize the invoices I received.", "Draft a reply confirming the meeting."]
+
+
+def add_blocking_routes(app):
+    # The handlers as they were before the async session: sync def, blocking Session
+    from backend import main
+    from backend.services import email_query, llm_service, responses
+
+    def chat(request: schemas.ChatRequest, db=Depends(main.get_db)):
+        return {"response": llm_service.run_llm(main.build_chat_prompt(db, request))}
+
+    def summaries(request: Request, limit: int = 100, db=Depends(main.get_db)):
+        emails, next_cursor = email_query.list_email_columns(db, email_query.SUMMARY_COLUMNS, limit=limit)
+        return responses.json_response(request, emails, {"X-Next-Cursor": next_cursor} if next_cursor else None)
+
+    app.add_api_route("/blocking/chat", chat, methods=["POST"])
+    app.add_api_route("/blocking/emails/summary", summaries, methods=["GET"])
+
+
+async def chat_client(client, path: str, email_ids: list, deadline: float, rng: random.Random, latencies: list, errors: list):
+    while time.perf_counter() < deadline:
+        body = {"query": rng.choice(QUERIES)}
+        if rng.random() < 0.5:
+            body["email_id"] = rng.choice(email_ids)
+        started = time.perf_counter()
+        try:
+            ok = (await client.post(path, json=body)).status_code == 200
+        except httpx.HTTPError:
+            ok = False
+        if ok:
+            latencies.append(time.perf_counter() - started)
+        else:
+            errors.append(1)
+
+
+async def probe(client, path: str, deadline: float, latencies: list):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        await client.get(path, params={"limit": 50})
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(0.05)
+
+
+async def run(client, prefix: str, clients: int, seconds: float, email_ids: list) -> dict:
+    chat, emails, errors = [], [], []
+    deadline = time.perf_counter() + seconds
+    started = time.perf_counter()
+    await asyncio.gather(
+        probe(client, f"{prefix}/emails/summary", deadline, emails),
+        *(chat_client(client, f"{prefix}/chat", email_ids, deadline, random.Random(i), chat, errors)
+          for i in range(clients)),
+    )
+    elapsed = time.perf_counter() - started
+    return {
+        "chat_rps": len(chat) / elapsed,
+        "chat_p50": percentile(chat, 0.5),
+        "chat_p95": percentile(chat, 0.95),
+        "emails_p50": percentile(emails, 0.5),
+        "emails_p95": percentile(emails, 0.95),
+        "errors": len(errors),
+    }
+
+
+async def sweep(app, levels: list, seconds: float, email_ids: list):
+    transport = httpx.ASGITransport(app=app)
+    limits = httpx.Limits(max_connections=None)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300, limits=limits) as client:
+        # Warm-up: first-use costs (vector index load, LLM clients) out of the numbers
+        await client.post("/chat", json={"query": QUERIES[0]})
+        await client.post("/blocking/chat", json={"query": QUERIES[0]})
+        print(f"{'mode':<10}{'clients':>8}{'chat/s':>9}{'chat p50':>10}{'chat p95':>10}"
+              f"{'/emails p50':>13}{'/emails p95':>13}{'errors':>8}")
+        for clients in levels:
+            for mode, prefix in (("blocking", "/blocking"), ("async", "")):
+                r = await run(client, prefix, clients, seconds, email_ids)
+                print(f"{mode:<10}{clients:>8}{r['chat_rps']:>9.1f}{r['chat_p50'] * 1000:>8.0f}ms"
+                      f"{r['chat_p95'] * 1000:>8.0f}ms{r['emails_p50'] * 1000:>11.1f}ms"
+                      f"{r['emails_p95'] * 1000:>11.1f}ms{r['errors']:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Blocking vs async handlers under concurrent /chat load")
+    parser.add_argument("--levels", default="20,40,80,120", help="concurrent chat clients")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="fake LLM response time, seconds")
+    parser.add_argument("--emails", type=int, default=2000)
+    args = parser.parse_args()
+
+    server = subprocess.Popen(
+        [sys.executable, "-m", "backend.benchmarks.fake_llm_server", "--port", "0", "--ttft-p50", str(args.llm_latency)],
+        stdout=subprocess.PIPE, text=True,
+    )
+    # "Fake LLM server on http://host:port (...)"
+    os.environ["OPENAI_BASE_URL"] = f"{server.stdout.readline().split()[4]}/v1"
+    synthetic_inbox.populate(args.emails)
+    db = database.SessionLocal()
+    try:
+        mock_data.create_default_prompts(db)
+        email_ids = db.scalars(select(models.Email.id)).all()
+    finally:
+        db.close()
+
+    from backend.main import app
+    add_blocking_routes(app)
+    print(f"{args.emails} emails, fake LLM latency {args.llm_latency * 1000:.0f}ms, {args.seconds:.0f}s per run")
+    try:
+        asyncio.run(sweep(app, [int(level) for level in args.levels.split(",")], args.seconds, email_ids))
+    finally:
+        server.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+# Mixed read/write load against a file SQLite database: reader processes page through
+# /emails (keyset, first pages) while a writer process commits ingestion-style updates,
+# either one row per transaction or in batches that spend `think` seconds per row inside
+# the transaction the way a batched ingestion run waits on the LLM between writes. Separate processes (as
+# with several uvicorn workers) keep the GIL out of the measurement.
+#
+# Compares the bare engine database.py used to create (rollback journal, synchronous=FULL)
+# with database.create_db_engine (WAL, synchronous=NORMAL, mmap, busy_timeout).
+#
+#   python -m backend.benchmarks.bench_db_load [rows] [readers] [seconds]
+#   (default 200,000 rows, 4 readers, 5 seconds per run)
+
+from sqlalchemy import create_engine, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from backend import models
+from backend.database import create_db_engine
+from backend.services import email_query
+from backend.benchmarks.bench_emails_paging import seed
+
+CATEGORIES = ["Important", "Newsletter", "Spam", "To-Do"]
+
+
+def make_engine(config: str, url: str):
+    if config == "default":
+        return create_engine(url, connect_args={"check_same_thread": False})
+    return create_db_engine(url)
+
+
+def reader(config, url, start, seconds, n, results):
+    db = sessionmaker(bind=make_engine(config, url))()
+    categories = [None] + CATEGORIES
+    latencies, errors, i = [], 0, 0
+    while time.time() < start:
+        time.sleep(0.001)
+    while time.time() < start + seconds:
+        started = time.perf_counter()
+        try:
+            emails, cursor = email_query.list_emails(db, limit=50, category=categories[(n + i) % len(categories)])
+            if cursor:
+                email_query.list_emails(db, limit=50, cursor=cursor)
+            db.rollback()
+        except OperationalError:
+            db.rollback()
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - started)
+        i += 1
+    results.put(("read", latencies, errors))
+
+
+def writer(config, url, start, seconds, rows, write_batch, think, results):
+    db = sessionmaker(bind=make_engine(config, url))()
+    table = models.Email.__table__
+    latencies, errors, i = [], 0, 0
+    while time.time() < start:
+        time.sleep(0.001)
+    while time.time() < start + seconds:
+        started = time.perf_counter()
+        try:
+            for j in range(write_batch):
+                email_id = (i * write_batch + j) % rows + 1
+                db.execute(update(table).where(table.c.id == email_id).values(
+                    category=CATEGORIES[email_id % 4], action_items='["follow up"]'))
+                time.sleep(think)
+            db.commit()
+        except OperationalError:
+            db.rollback()
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - started)
+        i += 1
+    results.put(("write", latencies, errors))
+
+
+def run(config: str, url: str, rows: int, readers: int, seconds: float, write_batch: int = 20, think: float = 0.002):
+    results = multiprocessing.Queue()
+    start = time.time() + 1.0
+    procs = [multiprocessing.Process(target=reader, args=(config, url, start, seconds, n, results)) for n in range(readers)]
+    procs.append(multiprocessing.Process(target=writer, args=(config, url, start, seconds, rows, write_batch, think, results)))
+    for proc in procs:
+        proc.start()
+    reads, writes, errors = [], [], 0
+    for _ in procs:
+        kind, latencies, errs = results.get()
+        (reads if kind == "read" else writes).extend(latencies)
+        errors += errs
+    for proc in procs:
+        proc.join()
+
+    def p(samples, q):
+        return sorted(samples)[int(q * (len(samples) - 1))] * 1000 if samples else float("nan")
+
+    return {
+        "reads_per_s": len(reads) / seconds,
+        "read_p50_ms": p(reads, 0.5),
+        "read_p99_ms": p(reads, 0.99),
+        "writes_per_s": len(writes) * write_batch / seconds,
+        "write_p95_ms": p(writes, 0.95),
+        "errors": errors,
+    }
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    readers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 5.0
+
+    # (label, rows per transaction, seconds of "LLM time" per row inside the transaction)
+    scenarios = [("commit per row", 1, 0.0), ("batch of 20", 20, 0.002)]
+    print(f"{rows} rows, {readers} readers + 1 writer, {seconds:.0f}s per run")
+    print(f"{'writer':<16}{'engine':<10}{'reads/s':>10}{'read p50':>10}{'read p99':>10}{'rows/s':>10}{'write p95':>11}{'errors':>8}")
+    for label, write_batch, think in scenarios:
+        for config in ("default", "tuned"):
+            url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_load.db')}"
+            engine = make_engine(config, url)
+            models.Base.metadata.create_all(bind=engine)
+            seed(engine, rows)
+            engine.dispose()
+            r = run(config, url, rows, readers, seconds, write_batch, think)
+            print(f"{label:<16}{config:<10}{r['reads_per_s']:>10.0f}{r['read_p50_ms']:>10.1f}{r['read_p99_ms']:>10.1f}"
+                  f"{r['writes_per_s']:>10.0f}{r['write_p95_ms']:>11.1f}{r['errors']:>8}")
+
+if __name__ == "__main__":
+    main()
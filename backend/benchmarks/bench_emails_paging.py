@@ -0,0 +1,83 @@
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Seeds a throwaway SQLite database and compares page latency of offset paging with
+# keyset (cursor) paging at increasing depth, with and without a category filter.
+#
+#   python -m backend.benchmarks.bench_emails_paging [rows]   (default 1,000,000)
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from backend import models
+from backend.services import email_query
+
+CATEGORIES = ["Important", "Newsletter", "Spam", "To-Do", "Uncategorized"]
+PAGE_SIZE = 50
+
+
+def seed(engine, rows: int):
+    rng = random.Random(42)
+    start = datetime(2024, 1, 1)
+    table = models.Email.__table__
+    chunk = 50000
+    with engine.begin() as conn:
+        for offset in range(0, rows, chunk):
+            conn.execute(insert(table), [
+                {
+                    "sender": f"user{rng.randrange(5000)}@example.com",
+                    "subject": f"Subject {i}",
+                    "body": "Lorem ipsum dolor sit amet. " * 4,
+                    "timestamp": start + timedelta(seconds=rng.randrange(60 * 60 * 24 * 365)),
+                    "category": rng.choice(CATEGORIES),
+                    "is_read": rng.random() < 0.5,
+                    "action_items": "[]",
+                }
+                for i in range(offset, min(rows, offset + chunk))
+            ])
+
+
+def timed(fn, repeat: int = 5) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    path = os.path.join(tempfile.mkdtemp(), "bench_paging.db")
+    engine = create_engine(f"sqlite:///{path}")
+    models.Base.metadata.create_all(bind=engine)
+    started = time.perf_counter()
+    seed(engine, rows)
+    print(f"seeded {rows} rows in {time.perf_counter() - started:.1f}s ({path})")
+
+    db = sessionmaker(bind=engine)()
+    print(f"{'filter':<12}{'depth':>10}{'offset ms':>12}{'keyset ms':>12}")
+    for category in (None, "Spam"):
+        total = email_query.filter_emails(db.query(models.Email), category=category).count()
+        for depth in sorted({0, 1000, 10_000, 100_000, rows // 2}):
+            if depth >= total:
+                continue
+            # Cursor of the row just before this depth (not timed)
+            cursor = None
+            if depth:
+                before, _ = email_query.list_emails(db, limit=1, skip=depth - 1, category=category)
+                cursor = email_query.encode_cursor(before[0])
+            offset_ms = timed(lambda: email_query.list_emails(db, limit=PAGE_SIZE, skip=depth, category=category))
+            keyset_ms = timed(lambda: email_query.list_emails(db, limit=PAGE_SIZE, cursor=cursor, category=category))
+            print(f"{category or '-':<12}{depth:>10}{offset_ms:>12.2f}{keyset_ms:>12.2f}")
+    db.close()
+    engine.dispose()
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
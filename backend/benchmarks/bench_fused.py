@@ -0,0 +1,69 @@
+import os
+import sys
+import time
+
+# Compares the per-prompt ingestion path (up to three LLM calls per email) with the
+# fused single-call mode on the mock inbox, using the local fake LLM.
+#
+#   python -m backend.benchmarks.bench_fused [rounds]
+#
+# Mock bodies are one sentence long, so each run is repeated with bodies padded to
+# roughly the size of a real email, where the shared body dominates the token count.
+
+os.environ.setdefault("LLM_PROVIDER", "fake")
+os.environ["LLM_CACHE"] = "0"
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from backend import models
+from backend.services import fake_llm, ingestion_service, mock_data
+
+
+def pad_bodies(db, body_chars: int):
+    for email in db.query(models.Email):
+        email.body = (email.body + " ") * max(1, body_chars // (len(email.body) + 1))
+    db.commit()
+
+
+def run(fused: bool, rounds: int, body_chars: int = 0):
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    mock_data.create_default_prompts(db)
+
+    # 50ms per call plus 0.2ms per prompt token
+    fake = fake_llm.FakeLLM(latency=0.05, per_token=0.0002)
+    fake_llm.set_fake_llm(fake)
+
+    emails = 0
+    started = time.perf_counter()
+    for _ in range(rounds):
+        db.query(models.Email).delete()
+        db.commit()
+        mock_data.create_mock_emails(db)
+        if body_chars:
+            pad_bodies(db, body_chars)
+        emails += ingestion_service.process_all_emails(db, fused=fused)["processed"]
+    elapsed = time.perf_counter() - started
+    db.close()
+
+    tokens = (fake.prompt_chars + fake.completion_chars) / 4
+    return {
+        "calls_per_email": fake.calls / emails,
+        "tokens_per_email": tokens / emails,
+        "ms_per_email": elapsed * 1000 / emails,
+    }
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    print(f"{'body':<10}{'mode':<12}{'calls/email':>14}{'tokens/email':>14}{'ms/email':>12}")
+    for body_chars in (0, 2000):
+        label = f"{body_chars} ch" if body_chars else "mock"
+        for mode, fused in (("three-call", False), ("fused", True)):
+            r = run(fused, rounds, body_chars)
+            print(f"{label:<10}{mode:<12}{r['calls_per_email']:>14.2f}{r['tokens_per_email']:>14.1f}{r['ms_per_email']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
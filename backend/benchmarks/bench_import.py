@@ -0,0 +1,84 @@
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from email.utils import format_datetime
+
+# Generates a synthetic mbox of the requested size (with ~5% re-delivered duplicates)
+# and imports it into a throwaway SQLite database: a full import, an incremental
+# re-run (nothing new, resumes from the checkpoint) and an import after appending more
+# mail. Peak RSS shows that memory stays bounded regardless of mailbox size.
+#
+#   python -m backend.benchmarks.bench_import [megabytes]   (default 2048)
+
+from sqlalchemy.orm import sessionmaker
+from backend import models
+from backend.database import create_db_engine
+from backend.services import mail_import, search
+
+WORDS = ("meeting report deadline invoice project update review please schedule budget customer "
+         "release design feedback contract quarterly launch team offer newsletter").split()
+
+
+def message(rng, i: int) -> bytes:
+    sent = datetime(2024, 1, 1) + timedelta(seconds=i * 37)
+    body = "\n".join(" ".join(rng.choices(WORDS, k=12)) for _ in range(rng.randint(5, 60)))
+    return (
+        f"From sender{i % 3000}@example.com {sent:%a %b %d %H:%M:%S %Y}\n"
+        f"From: Sender {i % 3000} <sender{i % 3000}@example.com>\n"
+        f"To: me@example.com\n"
+        f"Subject: {' '.join(rng.choices(WORDS, k=5))}\n"
+        f"Date: {format_datetime(sent)}\n"
+        f"Message-ID: <{i}@bench.example.com>\n"
+        f"Content-Type: text/plain; charset=utf-8\n\n"
+        f"{body}\n\n"
+    ).encode("utf-8")
+
+
+def write_mbox(path: str, megabytes: float, first: int = 0, seed: int = 0) -> int:
+    rng = random.Random(seed)
+    limit = int(megabytes * 1024 * 1024)
+    written, i = 0, first
+    with open(path, "ab") as f:
+        while written < limit:
+            # Re-deliver an earlier message now and then (same Message-ID)
+            raw = message(rng, rng.randrange(first, i) if i > first and rng.random() < 0.05 else i)
+            f.write(raw)
+            written += len(raw)
+            i += 1
+    return i
+
+
+def run(db, path: str, label: str):
+    r = mail_import.import_mailbox(db, path)
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{label:<14}{r['messages']:>10}{r['imported']:>10}{r['duplicates']:>8}{r['seconds']:>9.1f}"
+          f"{r['messages_per_second'] or 0:>10.0f}{r['mb_per_second'] or 0:>8.1f}{peak_mb:>10.0f}")
+
+
+def main():
+    megabytes = float(sys.argv[1]) if len(sys.argv) > 1 else 2048
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "inbox.mbox")
+    started = time.perf_counter()
+    last = write_mbox(path, megabytes)
+    print(f"wrote {os.path.getsize(path) / 1e6:.0f} MB ({last} messages) in {time.perf_counter() - started:.0f}s")
+
+    engine = create_db_engine(f"sqlite:///{os.path.join(directory, 'bench_import.db')}")
+    models.Base.metadata.create_all(bind=engine)
+    search.install(engine)
+    db = sessionmaker(bind=engine)()
+
+    print(f"{'run':<14}{'messages':>10}{'imported':>10}{'dupes':>8}{'seconds':>9}{'msg/s':>10}{'MB/s':>8}{'peak MB':>10}")
+    run(db, path, "full")
+    run(db, path, "re-run")
+    write_mbox(path, max(1.0, megabytes / 20), first=last, seed=1)
+    run(db, path, "after append")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import os
+import sys
+import tempfile
+import time
+
+# Measures the database side of ingestion with a zero-latency fake LLM: one Prompt
+# lookup and one commit per email (process_email in a loop) against the bulk mode of
+# process_all_emails (one prompt snapshot, loaded rows reused, commit_every per commit).
+#
+#   python -m backend.benchmarks.bench_ingest_db [emails]   (default 5,000)
+
+os.environ.setdefault("LLM_PROVIDER", "fake")
+os.environ["LLM_CACHE"] = "0"
+os.environ["PRECLASSIFIER"] = "0"
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from backend import models
+from backend.services import fake_llm, ingestion_service, mock_data
+
+
+def setup(emails: int):
+    path = os.path.join(tempfile.mkdtemp(), "bench_ingest.db")
+    engine = create_engine(f"sqlite:///{path}")
+    models.Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    mock_data.create_default_prompts(db)
+    mock_data.create_mock_emails(db)
+    seeds = db.query(models.Email).all()
+    rows = [
+        {"sender": e.sender, "subject": f"{e.subject} #{i}", "body": e.body, "timestamp": e.timestamp}
+        for i in range(emails // len(seeds) + 1) for e in seeds
+    ][:emails]
+    db.query(models.Email).delete()
+    db.bulk_insert_mappings(models.Email, rows)
+    db.commit()
+    return db
+
+
+def per_email(db):
+    ids = [row.id for row in db.query(models.Email.id).filter(models.Email.category == "Uncategorized")]
+    for email_id in ids:
+        ingestion_service.process_email(db, email_id)
+    return len(ids)
+
+
+def main():
+    emails = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    fake_llm.set_fake_llm(fake_llm.FakeLLM(latency=0))
+    runs = [("per-email commit", per_email)] + [
+        (f"bulk, commit_every={n}", lambda db, n=n: ingestion_service.process_all_emails(db, commit_every=n)["processed"])
+        for n in (1, 50, 500)
+    ]
+    print(f"{'mode':<26}{'emails':>8}{'seconds':>10}{'emails/s':>12}")
+    for label, fn in runs:
+        db = setup(emails)
+        started = time.perf_counter()
+        processed = fn(db)
+        elapsed = time.perf_counter() - started
+        db.close()
+        print(f"{label:<26}{processed:>8}{elapsed:>10.2f}{processed / elapsed:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Near-duplicate reuse on a labeled synthetic inbox. Every email carries the category
+# and action items it should get; emails are processed in arrival order, a near-duplicate
+# hit reuses the matched email's results and a miss stands in for the LLM by storing the
+# truth. Per threshold it reports the dedup ratio (LLM calls saved) and the false-merge
+# rates: reused emails whose category, or action items after value rebinding, are wrong.
+#
+#   python -m backend.benchmarks.bench_near_duplicates [emails]   (default 2,000)
+#
+# The corpus mixes notification waves (JIRA assignments, invoices with amounts and
+# dates, password expiry, meeting reminders, newsletters), near-miss pairs (CI builds
+# that passed or failed with otherwise identical text), a phishing copy of the invoice
+# from another domain, and one-off personal mail.
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_near_duplicates.db')}")
+
+from sqlalchemy import insert
+from backend import database, models
+from backend.services import near_duplicates, tasks
+
+THRESHOLDS = [0.6, 0.7, 0.8, 0.9]
+
+WORDS = (
+    "project budget vendor schedule launch review roadmap hiring offsite contract renewal travel "
+    "customer onboarding migration audit forecast design proposal workshop feedback quarter "
+    "shipment container port cargo manifest customs warehouse invoice pricing partner demo"
+).split()
+PEOPLE = ["alice", "bob", "carol", "dan", "erin", "frank", "grace", "heidi", "ivan", "judy"]
+DOMAINS = ["gmail.com", "outlook.com", "acme-logistics.com", "northwind.io"]
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]
+MONTHS = ["January", "February", "March", "April", "May", "June"]
+ISSUES = ["API latency spike", "Login page timeout", "Broken CSV export", "Memory leak in worker",
+          "Wrong currency rounding", "Flaky payment webhook"]
+HEADLINES = ["Rust in production", "The state of WebAssembly", "Postgres 17 released", "Designing for failure",
+             "Why queues back up", "A tour of vector databases", "Shipping faster with feature flags",
+             "Profiling Python services", "Edge caching patterns", "Incident reviews that work"]
+
+
+def jira(rng):
+    key, day, issue = f"BE-{rng.randint(100, 999)}", rng.choice(DAYS), rng.choice(ISSUES)
+    body = (f"You have been assigned to issue {key}: {issue}. Priority: {rng.choice(['High', 'Medium'])}. "
+            f"Please review the issue and update its status by {day}. You are receiving this because "
+            "you are the assignee. Manage notifications in your profile settings.")
+    return ("jira@oceanai.com", f"[JIRA] Issue Assigned: {key}", body, "To-Do",
+            [{"task": f"Review issue {key} and update its status", "deadline": day}])
+
+
+def invoice(rng, sender="billing@cloudhost.com", category="Important"):
+    number, month = f"INV-{rng.randint(10000, 99999)}", rng.choice(MONTHS)
+    amount, due = f"${rng.randint(50, 4000)}.{rng.randint(10, 99)}", f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+    body = (f"Your invoice {number} for {month} is ready. Amount due: {amount}. Payment is due on {due}. "
+            "You can pay online from the billing dashboard or reply to this email with questions. "
+            "Thank you for choosing CloudHost.")
+    items = [{"task": f"Pay invoice {number} of {amount}", "deadline": due}] if category != "Spam" else []
+    return sender, f"Invoice {number} for {month}", body, category, items
+
+
+def phishing(rng):
+    # The invoice text, sent from a lookalike domain
+    return invoice(rng, sender="billing@cloudhost-secure.net", category="Spam")
+
+
+def password(rng):
+    days = rng.randint(2, 14)
+    body = (f"Your network password expires in {days} days. Change it from the self-service portal before "
+            "it expires to keep access to email and VPN. IT will never ask for your password.")
+    return ("it@oceanai.com", f"Your password expires in {days} days", body, "To-Do",
+            [{"task": "Change your network password", "deadline": f"in {days} days"}])
+
+
+def meeting(rng):
+    topic, day, hour = rng.choice(ISSUES), rng.choice(DAYS), rng.randint(9, 17)
+    body = (f"Reminder: {topic} sync on {day} at {hour}:00 in the main conference room. "
+            "Please review the agenda and bring your updates. Join remotely with the usual link.")
+    return ("calendar@oceanai.com", f"Reminder: {topic} sync", body, "Important",
+            [{"task": f"Attend the {topic} sync", "deadline": f"{day} at {hour}:00"}])
+
+
+def newsletter(rng):
+    picks = rng.sample(HEADLINES, 4)
+    body = ("This week in engineering: " + ". ".join(picks) + ". Read the full stories on our site. "
+            "You are receiving this because you subscribed to Tech Weekly. Unsubscribe at any time.")
+    return "news@techweekly.io", f"Tech Weekly #{rng.randint(100, 300)}", body, "Newsletter", []
+
+
+def build(rng):
+    # Passed and failed builds differ in the status word only
+    number, repo = rng.randint(1000, 9999), rng.choice(["api", "web", "worker"])
+    passed = rng.random() < 0.7
+    body = (f"Build #{number} of {repo} on branch main {'passed' if passed else 'failed'}. "
+            f"Triggered by a push from {rng.choice(PEOPLE)}. View the logs and test report in the CI dashboard. "
+            "You are receiving this because you are watching this repository. Manage notifications "
+            "in your account settings.")
+    subject = f"[{repo}] Build #{number} {'passed' if passed else 'failed'}"
+    if passed:
+        return "ci@github.com", subject, body, "Newsletter", []
+    return "ci@github.com", subject, body, "To-Do", [{"task": f"Fix the failing tests in build #{number}", "deadline": None}]
+
+
+def personal(rng):
+    words = " ".join(rng.choice(WORDS) for _ in range(rng.randint(30, 80)))
+    topic = rng.choice(WORDS)
+    category = rng.choice(["Important", "To-Do", "Important"])
+    return (f"{rng.choice(PEOPLE)}@{rng.choice(DOMAINS)}", f"About the {topic}", f"Hi, {words}.", category,
+            [{"task": f"Reply about the {topic}", "deadline": rng.choice(DAYS)}])
+
+
+FAMILIES = [(jira, 0.2), (invoice, 0.15), (phishing, 0.03), (password, 0.07), (meeting, 0.1),
+            (newsletter, 0.1), (build, 0.15), (personal, 0.2)]
+
+
+def corpus(n: int) -> list:
+    rng = random.Random(11)
+    generators, weights = zip(*FAMILIES)
+    return [rng.choices(generators, weights)[0](rng) for _ in range(n)]
+
+
+def run(rows: list, threshold: float) -> dict:
+    models.Base.metadata.drop_all(bind=database.engine)
+    models.Base.metadata.create_all(bind=database.engine)
+    start = datetime(2024, 1, 1)
+    with database.engine.begin() as conn:
+        conn.execute(insert(models.Email.__table__), [
+            {"sender": sender, "subject": subject, "body": body, "timestamp": start + timedelta(minutes=i),
+             "category": "Uncategorized"}
+            for i, (sender, subject, body, _, _) in enumerate(rows)
+        ])
+    db = database.SessionLocal()
+    emails = db.query(models.Email).order_by(models.Email.id).all()
+    merged = wrong_category = wrong_actions = 0
+    elapsed = 0.0
+    for email, (_, _, _, category, items) in zip(emails, rows):
+        truth = [(item["task"], item["deadline"]) for item in items]
+        # Timed: the lookup, including the flush of the previous email's results
+        started = time.perf_counter()
+        match = near_duplicates.find(db, email, threshold)
+        elapsed += time.perf_counter() - started
+        if match is None:
+            # Stands in for the LLM: the email gets its true results
+            email.category = category
+            tasks.set_action_items(email, json.dumps(items))
+            continue
+        near_duplicates.reuse(email, match[0])
+        merged += 1
+        wrong_category += email.category != category
+        wrong_actions += tasks.parse_items(email.action_items) != truth
+    db.commit()
+    db.close()
+    return {
+        "dedup": merged / len(rows),
+        "category_false_merge": wrong_category / merged if merged else 0.0,
+        "actions_false_merge": wrong_actions / merged if merged else 0.0,
+        "lookup_ms": elapsed * 1000 / len(rows),
+    }
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    rows = corpus(n)
+    print(f"{n} emails, {near_duplicates.PERMUTATIONS} permutations in {near_duplicates.BANDS} bands")
+    print(f"{'threshold':<12}{'dedup':>10}{'category FM':>14}{'actions FM':>13}{'lookup ms':>12}")
+    for threshold in THRESHOLDS:
+        r = run(rows, threshold)
+        print(f"{threshold:<12}{r['dedup']:>10.1%}{r['category_false_merge']:>14.2%}"
+              f"{r['actions_false_merge']:>13.2%}{r['lookup_ms']:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
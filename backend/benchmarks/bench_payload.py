@@ -0,0 +1,119 @@
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Payload size and response time for one page of the inbox: the full /emails rows as
+# they were returned before (response_model validation + FastAPI's JSON encoder), the
+# same rows through services/responses (orjson or stdlib json), the /emails/summary
+# projection, and a revalidation that comes back 304.
+#
+#   python -m backend.benchmarks.bench_payload [page size]   (default 1,000)
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_payload.db')}")
+os.environ["LLM_PROVIDER"] = "fake"
+
+from typing import List
+from fastapi import Depends
+from fastapi.testclient import TestClient
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from backend import database, migrations, models, schemas
+from backend.main import app, get_db
+from backend.services import email_query, responses
+
+REQUESTS = 30
+PARAGRAPH = (
+    "Hi team, following up on the vessel tracking rollout. The port schedule moved again and "
+    "we need the updated cargo manifest before the customs review on Thursday. "
+)
+
+
+def seed(rows: int):
+    rng = random.Random(3)
+    start = datetime(2024, 1, 1)
+    with database.engine.begin() as conn:
+        conn.execute(insert(models.Email.__table__), [
+            {
+                "sender": f"user{rng.randrange(500)}@example.com",
+                "subject": f"Re: shipment {rng.randrange(100000)} status",
+                "body": PARAGRAPH * rng.randint(4, 12),
+                "timestamp": start + timedelta(minutes=i),
+                "category": rng.choice(["Important", "Newsletter", "Spam", "To-Do"]),
+                "is_read": rng.random() < 0.5,
+                "action_items": '[{"task": "Send the updated cargo manifest", "deadline": "Thursday"}]',
+            }
+            for i in range(rows)
+        ])
+
+
+@app.get("/bench/emails-before", response_model=List[schemas.Email])
+def emails_before(limit: int = 100, db: Session = Depends(get_db)):
+    # GET /emails as it was: ORM rows serialized through response_model
+    return email_query.list_emails(db, limit=limit)[0]
+
+
+def measure(client, path: str, headers: dict = None):
+    samples, response = [], None
+    for _ in range(REQUESTS):
+        started = time.perf_counter()
+        response = client.get(path, headers=headers or {})
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return response, statistics.median(samples), samples[int(0.95 * (len(samples) - 1))]
+
+
+def serialize_only(page: int):
+    # Encoding step alone, on rows already loaded
+    db = database.SessionLocal()
+    full, _ = email_query.list_email_columns(db, email_query.EMAIL_COLUMNS, limit=page)
+    summaries, _ = email_query.list_email_columns(db, email_query.SUMMARY_COLUMNS, limit=page)
+    cases = [
+        ("full, stdlib json", lambda: responses.json.dumps(full, default=responses._default).encode()),
+        ("full, orjson", lambda: responses.orjson.dumps(full)),
+        ("summary, stdlib json", lambda: responses.json.dumps(summaries, default=responses._default).encode()),
+        ("summary, orjson", lambda: responses.orjson.dumps(summaries)),
+    ]
+    print(f"\n{'encode only':<32}{'bytes':>10}{'ms':>10}")
+    for label, fn in cases:
+        if "orjson" in label and responses.orjson is None:
+            continue
+        started = time.perf_counter()
+        for _ in range(REQUESTS):
+            body = fn()
+        print(f"{label:<32}{len(body):>10}{(time.perf_counter() - started) * 1000 / REQUESTS:>10.2f}")
+    db.close()
+
+
+def main():
+    page = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    migrations.migrate()
+    seed(page)
+    client = TestClient(app)
+    print(f"{page}-email page, {REQUESTS} requests each; orjson {'installed' if responses.orjson else 'not installed'}")
+    print(f"{'request':<32}{'bytes':>10}{'p50 ms':>10}{'p95 ms':>10}")
+
+    runs = [("before: /emails", f"/bench/emails-before?limit={page}", None)]
+    for enabled in ([True, False] if responses.orjson else [False]):
+        name = "orjson" if enabled else "stdlib"
+        runs.append((f"/emails ({name})", f"/emails?limit={page}", enabled))
+        runs.append((f"/emails/summary ({name})", f"/emails/summary?limit={page}", enabled))
+    for label, path, enabled in runs:
+        if enabled is not None:
+            responses.ORJSON_ENABLED = enabled
+        response, p50, p95 = measure(client, path)
+        print(f"{label:<32}{len(response.content):>10}{p50:>10.2f}{p95:>10.2f}")
+
+    etag = client.get(f"/emails/summary?limit={page}").headers["etag"]
+    response, p50, p95 = measure(client, f"/emails/summary?limit={page}", {"If-None-Match": etag})
+    print(f"{'/emails/summary, 304':<32}{len(response.content):>10}{p50:>10.2f}{p95:>10.2f}")
+    assert response.status_code == 304
+
+    serialize_only(page)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+# Body tokens sent per email before (raw body in every prompt) and after preprocessing
+# (HTML, quoted history and signatures stripped, per-prompt budgets), on a synthetic
+# inbox mixing short notes, long reply threads, HTML newsletters and footer-heavy mail.
+#
+#   python -m backend.benchmarks.bench_preprocess [emails]   (default 2,000)
+
+from backend.services import preprocess
+
+WORDS = ("meeting report deadline invoice project update review please schedule budget customer "
+         "release design feedback contract quarterly launch team offer friday monday").split()
+SIGNATURE = ("\n\n--\nJane Doe | Senior Manager\nOcean AI Inc. | 100 Harbor St\n+1 555 0100\n\n"
+             "CONFIDENTIALITY NOTICE: This email and any attachments are for the exclusive use of the intended "
+             "recipient(s) and may contain confidential information. " * 3)
+
+
+def sentence(rng, n=14):
+    return " ".join(rng.choices(WORDS, k=n)).capitalize() + "."
+
+
+def thread(rng):
+    body = "\n".join(sentence(rng) for _ in range(3)) + SIGNATURE
+    for depth in range(rng.randint(3, 8)):
+        quoted = "\n".join("> " * (depth + 1) + sentence(rng) for _ in range(6))
+        body += f"\n\nOn Mon, 3 Jun 2024 at 10:{depth:02d}, Person {depth} <p{depth}@example.com> wrote:\n{quoted}"
+    return body
+
+
+def newsletter(rng):
+    items = "".join(f"<tr><td style='padding:8px;font-family:Arial'><h3>{sentence(rng, 5)}</h3>"
+                    f"<p>{sentence(rng, 30)}</p><a href='https://example.com/{i}'>Read more</a></td></tr>"
+                    for i in range(rng.randint(6, 15)))
+    return (f"<html><head><style>td {{color:#333}} .x{{display:none}}</style></head><body>"
+            f"<table width='600'>{items}</table><p>Unsubscribe | Manage preferences</p></body></html>")
+
+
+def forwarded(rng):
+    return (sentence(rng) + "\n\n-----Original Message-----\nFrom: vendor@example.com\nSent: Monday\n"
+            + "\n".join(sentence(rng, 20) for _ in range(40)))
+
+
+def short(rng):
+    return sentence(rng) + "\n\nSent from my iPhone"
+
+
+KINDS = [short, thread, newsletter, forwarded]
+PROMPTS = ["categorization", "action_extraction", "auto_reply"]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    rng = random.Random(0)
+    emails = [SimpleNamespace(body=KINDS[i % len(KINDS)](rng), clean_body=None, body_tokens=None, clean_tokens=None)
+              for i in range(count)]
+
+    started = time.perf_counter()
+    for email in emails:
+        for name in PROMPTS:
+            preprocess.prompt_body(email, name)
+    elapsed = time.perf_counter() - started
+
+    stats = preprocess.stats()
+    raw = stats["raw_prompt_body_tokens"] / count
+    sent = stats["prompt_body_tokens"] / count
+    print(f"tokenizer: {stats['tokenizer']}, {count} emails x {len(PROMPTS)} prompts")
+    print(f"body tokens per email: raw {stats['body_tokens'] / count:.0f}, cleaned {stats['clean_tokens'] / count:.0f}")
+    print(f"prompt body tokens per email: before {raw:.0f}, after {sent:.0f} "
+          f"(saved {raw - sent:.0f}, {100 * (1 - sent / raw):.0f}%)")
+    for kind in KINDS:
+        sample = [e for i, e in enumerate(emails) if KINDS[i % len(KINDS)] is kind]
+        before = sum(e.body_tokens for e in sample) / len(sample)
+        after = sum(e.clean_tokens for e in sample) / len(sample)
+        print(f"  {kind.__name__:<12} raw {before:>6.0f} -> cleaned {after:>5.0f}")
+    print(f"preprocessing: {elapsed * 1000 / count:.2f} ms per email (cleaned once, cached for later prompts)")
+
+
+if __name__ == "__main__":
+    main()
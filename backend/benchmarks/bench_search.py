@@ -0,0 +1,81 @@
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Seeds a throwaway SQLite database (the FTS5 triggers index rows as they are inserted)
+# and measures /emails/search query latency for common, rare and prefix queries.
+#
+#   python -m backend.benchmarks.bench_search [rows]   (default 1,000,000)
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from backend import models
+from backend.services import search
+
+WORDS = (
+    "report invoice meeting vessel tracking schedule project update budget review deadline "
+    "client shipping port cargo container delay approval contract proposal agenda security "
+    "password newsletter offer discount team standup release deploy latency incident customer"
+).split()
+FILLER = "the a to and of for on in with is this please we you our".split()
+QUERIES = ["invoice", "vessel tracking", "deadline approval contract", "ref4242", "zebra"]
+
+
+def body(rng) -> str:
+    words = [rng.choice(WORDS) if rng.random() < 0.3 else rng.choice(FILLER) for _ in range(60)]
+    # A long tail of rare tokens keeps the vocabulary realistic
+    words.append(f"ref{rng.randrange(200000)}")
+    return " ".join(words)
+
+
+def seed(engine, rows: int):
+    rng = random.Random(7)
+    start = datetime(2024, 1, 1)
+    chunk = 20000
+    with engine.begin() as conn:
+        for offset in range(0, rows, chunk):
+            conn.execute(insert(models.Email.__table__), [
+                {
+                    "sender": f"user{rng.randrange(5000)}@example.com",
+                    "subject": " ".join(rng.sample(WORDS, 3)),
+                    "body": body(rng),
+                    "timestamp": start + timedelta(seconds=rng.randrange(60 * 60 * 24 * 365)),
+                    "category": "Uncategorized",
+                    "is_read": False,
+                    "action_items": "[]",
+                }
+                for _ in range(offset, min(rows, offset + chunk))
+            ])
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    path = os.path.join(tempfile.mkdtemp(), "bench_search.db")
+    engine = create_engine(f"sqlite:///{path}")
+    models.Base.metadata.create_all(bind=engine)
+    search.install(engine)
+    started = time.perf_counter()
+    seed(engine, rows)
+    print(f"seeded and indexed {rows} rows in {time.perf_counter() - started:.1f}s")
+
+    db = sessionmaker(bind=engine)()
+    print(f"{'query':<30}{'p50 ms':>10}{'p95 ms':>10}")
+    for query in QUERIES:
+        samples = []
+        for _ in range(20):
+            t = time.perf_counter()
+            search.search_emails(db, query, limit=20)
+            samples.append((time.perf_counter() - t) * 1000)
+        samples.sort()
+        print(f"{query:<30}{statistics.median(samples):>10.2f}{samples[int(0.95 * (len(samples) - 1))]:>10.2f}")
+    db.close()
+    engine.dispose()
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import argparse
+import http.client
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Cold start of the API: the time from spawning `uvicorn backend.main:app` to its first
+# response (interpreter start, imports, startup hooks), then the first /emails/summary
+# request, which pays for the modules its handler imports on first use. Measured with
+# the schema migrated at startup (MIGRATE_ON_STARTUP=1, the default) and migrated at
+# deploy (MIGRATE_ON_STARTUP=0, as autoscaled replicas run), over an inbox that is
+# already migrated and seeded. Followed by the import-time profile of backend.main.
+#
+#   python -m backend.benchmarks.bench_startup [--runs 5] [--emails 10000] [--target 1.5]
+#       [--profile 15]
+#
+# Exits with status 1 when the median time to first response of the deploy-migrated
+# start is above --target seconds.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+TARGET_SECONDS = 1.5
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_startup.db')}")
+os.environ.setdefault("VECTOR_INDEX_PATH", os.path.join(tempfile.mkdtemp(), "vector_index.npz"))
+os.environ["LLM_PROVIDER"] = "fake"
+os.environ["LLM_CACHE"] = "0"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _get(port: int, path: str) -> int:
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    try:
+        conn.request("GET", path)
+        response = conn.getresponse()
+        response.read()
+        return response.status
+    finally:
+        conn.close()
+
+
+def cold_start(migrate: bool, timeout: float = 60) -> dict:
+    # -> seconds to the first response and for the first /emails/summary request
+    port = _free_port()
+    env = dict(os.environ, MIGRATE_ON_STARTUP="1" if migrate else "0")
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            try:
+                _get(port, "/")
+                break
+            except OSError:
+                if server.poll() is not None or time.perf_counter() - started > timeout:
+                    raise RuntimeError("uvicorn did not start")
+                time.sleep(0.005)
+        ready = time.perf_counter() - started
+        request_started = time.perf_counter()
+        _get(port, "/emails/summary?limit=50")
+        return {"ready": ready, "first_request": time.perf_counter() - request_started}
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def import_profile(top: int):
+    # `python -X importtime`: "import time: self [us] | cumulative | <indent>module"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import backend.main"],
+        cwd=ROOT, env=dict(os.environ), capture_output=True, text=True, check=True,
+    )
+    # A module's imports are listed before it, one level deeper
+    children = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth == 1:
+            children.append((int(cumulative) / 1000, name.strip()))
+        elif depth == 0:
+            if name.strip() == "backend.main":
+                total = int(cumulative) / 1000
+                break
+            children = []
+    print(f"\nimport backend.main: {total:.0f}ms; its direct imports by cumulative time:")
+    for ms, name in sorted(children, reverse=True)[:top]:
+        print(f"  {name:<40}{ms:>8.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start time of uvicorn backend.main:app")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--emails", type=int, default=10_000)
+    parser.add_argument("--target", type=float, default=TARGET_SECONDS, help="seconds to first response")
+    parser.add_argument("--profile", type=int, default=15, help="direct imports to list, 0 for none")
+    args = parser.parse_args()
+
+    from backend import database, migrations
+    from backend.benchmarks import synthetic_inbox
+    from backend.services import mock_data
+    synthetic_inbox.populate(args.emails)
+    migrations.migrate()
+    db = database.SessionLocal()
+    try:
+        mock_data.create_default_prompts(db)
+    finally:
+        db.close()
+    # One throwaway start so every measured run finds the bytecode cached
+    cold_start(migrate=True)
+
+    print(f"{args.emails} emails, {args.runs} runs each")
+    print(f"{'schema migrated':<20}{'ready p50':>11}{'ready max':>11}{'first /emails/summary':>23}")
+    medians = {}
+    for label, migrate in (("at startup", True), ("at deploy", False)):
+        runs = [cold_start(migrate) for _ in range(args.runs)]
+        ready = [run["ready"] for run in runs]
+        medians[label] = statistics.median(ready)
+        first = statistics.median(run["first_request"] for run in runs)
+        print(f"{label:<20}{medians[label] * 1000:>9.0f}ms{max(ready) * 1000:>9.0f}ms{first * 1000:>21.1f}ms")
+
+    if args.profile:
+        import_profile(args.profile)
+    ok = medians["at deploy"] <= args.target
+    print(f"\ntarget {args.target * 1000:.0f}ms to first response: {'met' if ok else 'MISSED'}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
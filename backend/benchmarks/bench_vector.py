@@ -0,0 +1,73 @@
+import random
+import sys
+import time
+import numpy as np
+
+# Retrieval latency, recall and memory of the /chat vector index on synthetic emails.
+#
+#   python -m backend.benchmarks.bench_vector [rows]   (default 100,000)
+
+from backend.services import vector_index
+
+WORDS = (
+    "report invoice meeting vessel tracking schedule project update budget review deadline "
+    "client shipping port cargo container delay approval contract proposal agenda security "
+    "password newsletter offer discount team standup release deploy latency incident customer "
+    "dinner weekend benefits enrollment recruiter role interview bug docs sprint roadmap"
+).split()
+QUERIES = [
+    "what did the client say about vessel tracking",
+    "invoice for the cargo container",
+    "security password expiry",
+    "sprint roadmap deadline",
+]
+
+
+def synthetic_texts(n: int, seed: int = 3):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(15, 60))) for _ in range(n)]
+
+
+def latency_ms(index, queries, k=8, probes=None, repeat=10):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for q in queries:
+            if probes:
+                index.search(q, k, probes=probes)
+            else:
+                index.search(q, k)
+    return (time.perf_counter() - started) * 1000 / (repeat * len(queries))
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    texts = synthetic_texts(rows)
+
+    started = time.perf_counter()
+    vectors = vector_index.embed(texts)
+    embed_s = time.perf_counter() - started
+    print(f"embedded {rows} emails in {embed_s:.1f}s ({rows / embed_s:.0f}/s, dim {vectors.shape[1]})")
+
+    index = vector_index.VectorIndex(vectors.shape[1])
+    for start in range(0, rows, 10_000):
+        index.add(np.arange(start, min(rows, start + 10_000)), vectors[start:start + 10_000])
+    memory_mb = (index.vectors[:index.size].nbytes + index.ids[:index.size].nbytes) / 1e6
+    print(f"memory: {memory_mb:.1f} MB ({memory_mb * 100_000 / rows:.1f} MB per 100k emails)")
+
+    queries = vector_index.embed(QUERIES)
+    exact = [{i for i, _ in index.search(q, 8)} for q in queries]
+    print(f"brute force: {latency_ms(index, queries):.2f} ms/query")
+
+    started = time.perf_counter()
+    index.build_ivf()
+    print(f"ivf build ({len(index.centroids)} lists): {time.perf_counter() - started:.1f}s")
+    for probes in (4, 8, 16):
+        recall = np.mean([
+            len(exact[n] & {i for i, _ in index.search(q, 8, probes=probes)}) / 8
+            for n, q in enumerate(queries)
+        ])
+        print(f"ivf probes={probes:<3} {latency_ms(index, queries, probes=probes):.2f} ms/query, recall@8 {recall:.2f}")
+
+
+if __name__ == "__main__":
+    main()
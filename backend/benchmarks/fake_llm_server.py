@@ -0,0 +1,234 @@
+import argparse
+import json
+import math
+import random
+import socket
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local OpenAI-compatible chat completions server for load tests, so the app can be
+# driven through its real HTTP client path without spending provider quota. Serves
+# POST /v1/chat/completions (OPENAI_BASE_URL=http://host:port/v1) and the same API under
+# /openai/v1 (GROQ_BASE_URL=http://host:port, which the Groq SDK reads), streaming or not.
+# Answers come from services/fake_llm's keyword responder.
+#
+#   python -m backend.benchmarks.fake_llm_server [--port 8100] [--ttft-p50 0.3] [--ttft-p99 1.2]
+#       [--tokens-per-second 150] [--prompt-tokens-per-second 5000] [--error-rate 0.01]
+#       [--rate-limit-rate 0.01] [--seed 0]
+#
+# Latency: time to first token is log-normal with the given median and p99, plus prompt
+# tokens at the prefill rate; the completion then streams at --tokens-per-second. A
+# request's latency and outcome depend only on the seed, its prompt and how many times
+# that prompt was sent before, so two runs with the same traffic see the same server.
+# GET /stats reports what was served.
+
+from backend.services import fake_llm
+
+
+def _tokens(text: str) -> int:
+    # Same ~4 chars/token estimate as llm_service.estimate_tokens
+    return max(1, len(text) // 4)
+
+
+def _percentile(values, q: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Load tests open a few hundred connections at once
+    request_queue_size = 512
+
+
+class FakeLLMServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, ttft_p50: float = 0.3, ttft_p99: float = None,
+                 tokens_per_second: float = None, prompt_tokens_per_second: float = None, error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0, seed: int = 0, responder=None):
+        self.ttft_p50 = ttft_p50
+        self.ttft_p99 = ttft_p99
+        self.tokens_per_second = tokens_per_second
+        self.prompt_tokens_per_second = prompt_tokens_per_second
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.seed = seed
+        self.responder = responder or fake_llm.default_responder
+        self._attempts = {}
+        self._lock = threading.Lock()
+        self._latencies = []
+        self.counts = {"requests": 0, "ok": 0, "errors": 0, "rate_limited": 0, "streamed": 0,
+                       "prompt_tokens": 0, "completion_tokens": 0}
+        self._httpd = _HTTPServer((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> str:
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-llm-server", daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _plan(self, prompt: str):
+        # -> (outcome, time to first token, seconds per completion token)
+        key = zlib.crc32(prompt.encode("utf-8"))
+        with self._lock:
+            attempt = self._attempts[key] = self._attempts.get(key, 0) + 1
+        rng = random.Random(f"{self.seed}:{key}:{attempt}")
+        ttft = self.ttft_p50
+        if self.ttft_p99 and self.ttft_p99 > self.ttft_p50 > 0:
+            # 2.326 standard deviations separate the median and the p99 of a normal
+            ttft *= math.exp(rng.gauss(0, math.log(self.ttft_p99 / self.ttft_p50) / 2.326))
+        if self.prompt_tokens_per_second:
+            ttft += _tokens(prompt) / self.prompt_tokens_per_second
+        roll = rng.random()
+        outcome = "rate_limited" if roll < self.rate_limit_rate else "error" if roll < self.rate_limit_rate + self.error_rate else "ok"
+        per_token = 1 / self.tokens_per_second if self.tokens_per_second else 0.0
+        return outcome, ttft, per_token
+
+    def _record(self, outcome: str, seconds: float, prompt: str = "", completion: str = "", streamed: bool = False):
+        with self._lock:
+            self.counts["requests"] += 1
+            self.counts["errors" if outcome == "error" else outcome] += 1
+            if outcome == "ok":
+                self._latencies.append(seconds)
+                self.counts["streamed"] += streamed
+                self.counts["prompt_tokens"] += _tokens(prompt)
+                self.counts["completion_tokens"] += _tokens(completion)
+
+    def stats(self) -> dict:
+        with self._lock:
+            latencies = list(self._latencies)
+            counts = dict(self.counts)
+        return {
+            **counts,
+            **{f"p{int(q * 100)}_ms": round(_percentile(latencies, q) * 1000, 2) if latencies else None
+               for q in (0.5, 0.95, 0.99)},
+        }
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                # Headers and body are separate writes: without this, Nagle's algorithm and
+                # the client's delayed ACK add ~40ms to every keep-alive response
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def log_message(self, *args):
+                pass
+
+            def _json(self, status: int, payload: dict, headers: dict = None):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _chunk(self, data: str):
+                raw = data.encode("utf-8")
+                self.wfile.write(f"{len(raw):x}\r\n".encode() + raw + b"\r\n")
+                self.wfile.flush()
+
+            def do_GET(self):
+                if self.path.endswith("/models"):
+                    self._json(200, {"object": "list", "data": [{"id": "fake", "object": "model", "owned_by": "bench"}]})
+                elif self.path == "/stats":
+                    self._json(200, server.stats())
+                else:
+                    self._json(404, {"error": {"message": "Not found"}})
+
+            def do_POST(self):
+                if not self.path.endswith("/chat/completions"):
+                    self._json(404, {"error": {"message": "Not found"}})
+                    return
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                prompt = "\n".join(str(m.get("content") or "") for m in request.get("messages", []))
+                model = request.get("model") or "fake"
+                started = time.perf_counter()
+                outcome, ttft, per_token = server._plan(prompt)
+                if outcome == "rate_limited":
+                    server._record(outcome, 0.0)
+                    self._json(429, {"error": {"message": "Rate limit reached", "type": "rate_limit_exceeded"}},
+                               {"Retry-After": "1"})
+                    return
+                time.sleep(ttft)
+                if outcome == "error":
+                    server._record(outcome, time.perf_counter() - started)
+                    self._json(500, {"error": {"message": "Fake provider error", "type": "server_error"}})
+                    return
+
+                text = server.responder(prompt)
+                completion_id = f"chatcmpl-{zlib.crc32(prompt.encode('utf-8')):08x}"
+                if not request.get("stream"):
+                    time.sleep(per_token * _tokens(text))
+                    server._record(outcome, time.perf_counter() - started, prompt, text)
+                    self._json(200, {
+                        "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                        "usage": {"prompt_tokens": _tokens(prompt), "completion_tokens": _tokens(text),
+                                  "total_tokens": _tokens(prompt) + _tokens(text)},
+                    })
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                words = text.split(" ")
+                for i, word in enumerate(words):
+                    piece = word if i == len(words) - 1 else word + " "
+                    time.sleep(per_token * _tokens(piece))
+                    event = {"id": completion_id, "object": "chat.completion.chunk", "model": model,
+                             "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                    self._chunk(f"data: {json.dumps(event)}\n\n")
+                self._chunk("data: [DONE]\n\n")
+                self.wfile.write(b"0\r\n\r\n")
+                server._record(outcome, time.perf_counter() - started, prompt, text, streamed=True)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible LLM server for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--ttft-p50", type=float, default=0.3, help="median time to first token, seconds")
+    parser.add_argument("--ttft-p99", type=float, default=None, help="p99 time to first token, seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=None, help="completion token rate")
+    parser.add_argument("--prompt-tokens-per-second", type=float, default=None, help="prefill token rate")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with a 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of requests answered with a 429")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    server = FakeLLMServer(
+        args.host, args.port, ttft_p50=args.ttft_p50, ttft_p99=args.ttft_p99,
+        tokens_per_second=args.tokens_per_second, prompt_tokens_per_second=args.prompt_tokens_per_second,
+        error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate, seed=args.seed,
+    )
+    print(f"Fake LLM server on {server.url} (OPENAI_BASE_URL={server.url}/v1, GROQ_BASE_URL={server.url})", flush=True)
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# Scripted load test: a synthetic inbox, the fake LLM server standing in for the
+# provider (reached over HTTP through the app's OpenAI-compatible provider), and fixed
+# scenarios driven at a given concurrency. Each scenario reports its requests, errors,
+# throughput and p50/p95/p99/max latency; the report is sorted JSON so two runs on two
+# commits diff line by line, and --compare prints the deltas against an earlier report.
+#
+#   python -m backend.benchmarks.load_test [--emails 10000] [--new 500] [--concurrency 8]
+#       [--requests 200] [--scenarios emails_summary,chat,ingest] [--out report.json]
+#       [--compare baseline.json] [--ttft-p50 0.05] [--ttft-p99 0.25] [--tokens-per-second 400]
+#       [--error-rate 0] [--seed 0]
+#
+# In-process by default: a fresh database and vector index in a temp dir, the app
+# behind TestClient, LLM_CACHE=0 so every LLM call reaches the fake server. With
+# --url the requests go to a running server instead, which must use the same
+# DATABASE_URL (seeded here) and point OPENAI_BASE_URL (LLM_PROVIDER=openai) or
+# GROQ_BASE_URL at a fake_llm_server whose stats are read from --llm-url.
+#
+# Scenarios (all of them by default, in this order):
+#   emails_summary  GET /emails/summary pages of 50, each worker following X-Next-Cursor
+#   emails_full     GET /emails pages of 50, the same way
+#   chat            POST /chat, about one email or over the whole inbox
+#   drafts_create   POST /drafts
+#   drafts_list     GET /drafts, paged with the cursor
+#   ingest          one POST /ingest/process job over the --new emails, polled to the end
+
+SCENARIOS = ["emails_summary", "emails_full", "chat", "drafts_create", "drafts_list", "ingest"]
+PAGE_SIZE = 50
+CHAT_QUERIES = [
+    "What needs my attention today?",
+    "Summarize the invoices I received.",
+    "Which meetings am I invited to this week?",
+    "Draft a reply confirming the meeting.",
+    "Are there any security warnings?",
+    "List my open tasks with deadlines.",
+]
+# Compared by --compare; lower is better except for throughput
+COMPARED = ["rps", "p50_ms", "p95_ms", "p99_ms", "emails_per_second"]
+
+
+def percentile(values, q: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def summarize(latencies: list, errors: int, seconds: float) -> dict:
+    requests = len(latencies) + errors
+    return {
+        "requests": requests,
+        "errors": errors,
+        "seconds": round(seconds, 3),
+        "rps": round(requests / seconds, 2) if seconds else None,
+        **{f"p{int(q * 100)}_ms": round(percentile(latencies, q) * 1000, 2) if latencies else None
+           for q in (0.5, 0.95, 0.99)},
+        "max_ms": round(max(latencies) * 1000, 2) if latencies else None,
+    }
+
+
+def git_commit() -> str:
+    try:
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=root, capture_output=True, text=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=root,
+                               capture_output=True, text=True).stdout.strip()
+        return f"{commit}{'-dirty' if dirty else ''}" or None
+    except OSError:
+        return None
+
+
+class Scenario:
+    # A request factory: request(client, i) sends the i-th request and returns the response
+    def __init__(self, name: str, request):
+        self.name = name
+        self.request = request
+
+    def run(self, client, requests: int, concurrency: int) -> dict:
+        latencies, errors, lock = [], [0], threading.Lock()
+
+        def one(i):
+            started = time.perf_counter()
+            try:
+                response = self.request(client, i)
+                ok = response.status_code < 400
+            except Exception as e:
+                print(f"{self.name} request {i} failed: {e}")
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors[0] += 1
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(one, range(requests)))
+        return summarize(latencies, errors[0], time.perf_counter() - started)
+
+
+def paging(path: str):
+    # Every worker thread walks the list from the top, starting over at the last page
+    cursors = threading.local()
+
+    def request(client, i):
+        params = {"limit": PAGE_SIZE}
+        if getattr(cursors, "next", None):
+            params["cursor"] = cursors.next
+        response = client.get(path, params=params)
+        cursors.next = response.headers.get("X-Next-Cursor")
+        return response
+
+    return request
+
+
+def chat(email_ids: list, seed: int):
+    def request(client, i):
+        rng = random.Random(f"{seed}:chat:{i}")
+        body = {"query": rng.choice(CHAT_QUERIES)}
+        if rng.random() < 0.5:
+            body["email_id"] = rng.choice(email_ids)
+        return client.post("/chat", json=body)
+
+    return request
+
+
+def drafts_create(email_ids: list, seed: int):
+    def request(client, i):
+        rng = random.Random(f"{seed}:draft:{i}")
+        return client.post("/drafts", json={
+            "email_id": rng.choice(email_ids), "subject": f"Re: load test {i}",
+            "body": "Thanks, I will get back to you by Friday.",
+        })
+
+    return request
+
+
+def run_ingest(client, concurrency: int, timeout: float = 3600) -> dict:
+    started = time.perf_counter()
+    job = client.post("/ingest/process", params={"concurrency": concurrency}).json()
+    while job["status"] not in ("completed", "failed") and time.perf_counter() - started < timeout:
+        time.sleep(0.2)
+        job = client.get(f"/jobs/{job['id']}").json()
+    seconds = time.perf_counter() - started
+    return {
+        "status": job["status"],
+        "emails": job["processed"],
+        "errors": job["failed"],
+        "seconds": round(seconds, 3),
+        "emails_per_second": round(job["processed"] / seconds, 2) if seconds else None,
+    }
+
+
+def compare(report: dict, baseline: dict):
+    print(f"\ncompared with {baseline['meta'].get('commit')}")
+    print(f"{'scenario':<16}{'metric':<20}{'baseline':>12}{'current':>12}{'change':>10}")
+    for name, result in report["scenarios"].items():
+        before = baseline["scenarios"].get(name)
+        if not before:
+            continue
+        for metric in COMPARED:
+            old, new = before.get(metric), result.get(metric)
+            if old is None or new is None:
+                continue
+            change = f"{(new - old) / old:+.1%}" if old else ""
+            print(f"{name:<16}{metric:<20}{old:>12}{new:>12}{change:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test against the fake LLM server")
+    parser.add_argument("--emails", type=int, default=10_000, help="synthetic emails to seed (0 to skip seeding)")
+    parser.add_argument("--new", type=int, default=500, help="of which left Uncategorized for the ingest scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write the JSON report here")
+    parser.add_argument("--compare", help="an earlier JSON report to compare with")
+    parser.add_argument("--url", help="a running server instead of the app in-process")
+    parser.add_argument("--llm-url", help="with --url: the fake LLM server it uses, for its stats")
+    parser.add_argument("--ttft-p50", type=float, default=0.05)
+    parser.add_argument("--ttft-p99", type=float, default=0.25)
+    parser.add_argument("--tokens-per-second", type=float, default=400)
+    parser.add_argument("--prompt-tokens-per-second", type=float, default=None)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    llm_config = {
+        "ttft_p50": args.ttft_p50, "ttft_p99": args.ttft_p99, "tokens_per_second": args.tokens_per_second,
+        "prompt_tokens_per_second": args.prompt_tokens_per_second, "error_rate": args.error_rate,
+        "rate_limit_rate": args.rate_limit_rate, "seed": args.seed,
+    }
+    llm_server = None
+    if args.url:
+        if args.emails and not os.getenv("DATABASE_URL"):
+            parser.error("--url seeds through DATABASE_URL: set it to the server's database (or --emails 0)")
+    else:
+        # Everything below reads its settings at import time
+        workdir = tempfile.mkdtemp(prefix="load_test_")
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'load_test.db')}"
+        os.environ["VECTOR_INDEX_PATH"] = os.path.join(workdir, "vector_index.npz")
+        os.environ["LLM_CACHE"] = "0"
+        os.environ["LLM_PROVIDER"] = "openai"
+        from backend.benchmarks.fake_llm_server import FakeLLMServer
+        llm_server = FakeLLMServer(**llm_config)
+        os.environ["OPENAI_BASE_URL"] = f"{llm_server.start()}/v1"
+
+    from sqlalchemy import select
+    from backend import database, models
+    from backend.benchmarks import synthetic_inbox
+    from backend.services import mock_data
+
+    seeded = {}
+    if args.emails:
+        started = time.perf_counter()
+        seeded = synthetic_inbox.populate(args.emails, new=args.new, seed=args.seed)
+        db = database.SessionLocal()
+        try:
+            mock_data.create_default_prompts(db)
+        finally:
+            db.close()
+        seeded["seconds"] = round(time.perf_counter() - started, 3)
+        print(f"seeded {seeded}")
+    with database.engine.connect() as conn:
+        email_ids = list(conn.execute(select(models.Email.id).order_by(models.Email.id.desc()).limit(1000)).scalars())
+    if not email_ids:
+        parser.error("the database has no emails: seed it with --emails")
+
+    if args.url:
+        import httpx
+        client = httpx.Client(base_url=args.url, timeout=120, limits=httpx.Limits(max_connections=args.concurrency + 2))
+    else:
+        from fastapi.testclient import TestClient
+        from backend.main import app
+        from backend.services import vector_index
+        client = TestClient(app)
+        client.__enter__()
+        # Embedding the whole inbox happens once, on the first /chat; time it apart
+        started = time.perf_counter()
+        db = database.SessionLocal()
+        try:
+            vector_index.sync(db)
+        finally:
+            db.close()
+        seeded["vector_sync_seconds"] = round(time.perf_counter() - started, 3)
+
+    factories = {
+        "emails_summary": lambda: paging("/emails/summary"),
+        "emails_full": lambda: paging("/emails"),
+        "chat": lambda: chat(email_ids, args.seed),
+        "drafts_create": lambda: drafts_create(email_ids, args.seed),
+        "drafts_list": lambda: paging("/drafts"),
+    }
+    results = {}
+    try:
+        for name in scenarios:
+            if name == "ingest":
+                results[name] = run_ingest(client, args.concurrency)
+            else:
+                results[name] = Scenario(name, factories[name]()).run(client, args.requests, args.concurrency)
+            print(f"{name:<16}{json.dumps(results[name], sort_keys=True)}")
+    finally:
+        if args.url:
+            client.close()
+        else:
+            client.__exit__(None, None, None)
+
+    llm_stats = None
+    if llm_server:
+        llm_stats = llm_server.stats()
+        llm_server.stop()
+    elif args.llm_url:
+        import httpx
+        llm_stats = httpx.get(f"{args.llm_url.rstrip('/')}/stats").json()
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "date": datetime.utcnow().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "target": args.url or "in-process",
+            "emails": args.emails,
+            "new": args.new,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "llm": llm_config if llm_server else {"url": args.llm_url},
+        },
+        "seed": seeded,
+        "scenarios": results,
+        "llm_server": llm_stats,
+    }
+    print(f"llm_server      {json.dumps(llm_stats, sort_keys=True)}")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, sort_keys=True, indent=2)
+            f.write("\n")
+        print(f"report written to {args.out}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+import json
+import random
+import re
+import sys
+from datetime import datetime, timedelta
+from sqlalchemy import bindparam, func, insert, update
+
+# Synthetic inbox at load-test scale (10k to 1M emails) built from the mock_data shapes.
+# Every email is one of the demo emails with its sender, numbers and length varied; a
+# share of them are replies that continue a recent thread. Emails, their threads and the
+# action items of processed emails are bulk inserted in chunks, complete enough that the
+# thread and action item command line backfills find nothing left to do. The same
+# seed always produces the same inbox.
+#
+#   python -m backend.benchmarks.synthetic_inbox 100000 [--new 1000] [--seed 0]
+#
+# Inserts into DATABASE_URL. The newest --new emails are left Uncategorized for
+# ingestion; the others carry the category and action items the demo email should get.
+
+from backend import database, models
+from backend.services import mock_data, tasks, threads
+
+CHUNK = 10_000
+REPLY_RATE = 0.2
+# Replies continue one of the threads active in the last RECENT emails
+RECENT = 200
+MAX_REFERENCES = 20
+# Mean gap between two emails: 1M emails span about two years
+MEAN_GAP_SECONDS = 60
+
+# Category and action items of each demo email, by subject
+TRUTH = {
+    "Urgent: Q4 Report Due": ("Important", [("Send the Q4 report", "tomorrow EOD")]),
+    "Tech Weekly: AI Revolution": ("Newsletter", []),
+    "Open Enrollment": ("To-Do", [("Review your benefits package", None)]),
+    "Meeting Request: Project Update": ("Important", [("Confirm the meeting on Tuesday at 10 AM", "Tuesday")]),
+    "Re: Meeting Request: Project Update": ("Important", [("Confirm Tuesday or Wednesday for the meeting", "Tuesday")]),
+    "You won a cruise!": ("Spam", []),
+    "Daily Standup Notes": ("To-Do", [("Fix bug #123", None), ("Update docs", None)]),
+    "Password Expiry Warning": ("To-Do", [("Update your password", "in 3 days")]),
+    "New Job Opportunity": ("Important", []),
+    "Invoice Available": ("Important", [("Pay the October invoice", None)]),
+    "Dinner on Sunday?": ("Important", [("Reply about dinner on Sunday", "Sunday")]),
+    "[JIRA] Issue Assigned: BE-404": ("To-Do", [("Look into BE-404: API Latency Spike", None)]),
+    "Last Chance: 50% Off": ("Spam", []),
+}
+
+FILLER = [
+    "Let me know if anything here is unclear.",
+    "I have attached the latest figures for reference.",
+    "The vessel tracking rollout is still on schedule for next month.",
+    "We reviewed the numbers with finance this morning.",
+    "Happy to jump on a call if that is easier.",
+    "The customs paperwork for the Rotterdam shipment is still pending.",
+    "Please keep the rest of the team in the loop.",
+    "This came up again in the planning meeting yesterday.",
+    "The port schedule moved, so the dates below may shift.",
+    "Thanks again for the quick turnaround on the last request.",
+]
+SIGNATURE = "\n\n--\nBest regards,\n{name}\nOcean AI | Maritime Logistics"
+NAMES = ["alex", "sam", "jordan", "taylor", "morgan", "casey", "riley", "jamie", "drew", "quinn"]
+_NUMBER_RE = re.compile(r"\d+")
+
+
+def _vary_numbers(text: str, rng: random.Random) -> str:
+    # Same number of digits, different value
+    return _NUMBER_RE.sub(lambda m: str(rng.randrange(10 ** (len(m.group(0)) - 1), 10 ** len(m.group(0)))), text)
+
+
+def _sender(address: str, rng: random.Random) -> str:
+    local, _, domain = address.partition("@")
+    if rng.random() < 0.5:
+        return address
+    return f"{rng.choice(NAMES)}.{local}@{domain}"
+
+
+def _body(template: str, rng: random.Random, name: str) -> str:
+    # Mostly short, with a long tail of long emails, some signed
+    body = _vary_numbers(template, rng)
+    extra = min(int(rng.expovariate(1 / 4)), 60)
+    if extra:
+        body += " " + " ".join(rng.choice(FILLER) for _ in range(extra))
+    if rng.random() < 0.3:
+        body += SIGNATURE.format(name=name.title())
+    return body
+
+
+class _ThreadState:
+    # What the generator needs to continue a thread, and its row's final values
+    __slots__ = ("id", "subject", "participants", "message_ids", "last_timestamp", "last_email_id", "count", "root")
+
+    def __init__(self, id, subject, root):
+        self.id = id
+        self.subject = subject
+        self.root = root
+        self.participants = set()
+        self.message_ids = []
+        self.count = 0
+        self.last_timestamp = None
+        self.last_email_id = None
+
+
+def generate(n: int, new: int = 0, seed: int = 0, end: datetime = None, first_email_id: int = 1,
+             first_thread_id: int = 1):
+    # Yields (email row, new thread row or None, thread state, action item rows) per
+    # email, in arrival order (ids increase with the timestamp)
+    rng = random.Random(seed)
+    templates = mock_data.mock_emails(datetime(2025, 1, 1))
+    end = end or datetime.utcnow()
+    when = end - timedelta(seconds=MEAN_GAP_SECONDS * n)
+    active, recent = {}, []
+    thread_id = first_thread_id
+    for i in range(n):
+        email_id = first_email_id + i
+        when += timedelta(seconds=rng.expovariate(1 / MEAN_GAP_SECONDS))
+        name = rng.choice(NAMES)
+        state = None
+        if recent and rng.random() < REPLY_RATE:
+            state = active[rng.choice(recent[-RECENT:])]
+            template = state.root
+            sender = rng.choice(sorted(state.participants))
+            recipients = " ".join(sorted(state.participants - {sender})) or None
+            subject = state.subject if threads.normalize_subject(state.subject)[1] else f"Re: {state.subject}"
+        else:
+            template = rng.choice(templates)
+            sender = _sender(template["sender"], rng)
+            recipients = "me@oceanai.com"
+            subject = _vary_numbers(template["subject"], rng)
+
+        message_id = f"<synthetic-{email_id}@bench.local>"
+        row = {
+            "id": email_id,
+            "sender": sender,
+            "subject": subject,
+            "body": _body(template["body"], rng, name),
+            "timestamp": when,
+            "is_read": rng.random() < 0.6,
+            "message_id": message_id,
+            "recipients": recipients,
+            "in_reply_to": None,
+            "references": None,
+            "category": "Uncategorized",
+            "action_items": "[]",
+        }
+        thread_row = None
+        if state is None:
+            state = _ThreadState(thread_id, subject, template)
+            thread_id += 1
+            thread_row = {
+                "id": state.id,
+                "subject": subject,
+                "subject_key": threads.normalize_subject(subject)[0],
+                "first_timestamp": when,
+            }
+        else:
+            row["in_reply_to"] = state.message_ids[-1]
+            row["references"] = " ".join(state.message_ids[-MAX_REFERENCES:])
+        row["thread_id"] = state.id
+        state.participants.add(sender.lower())
+        state.participants.update((recipients or "").split())
+        state.message_ids = (state.message_ids + [message_id])[-MAX_REFERENCES:]
+        state.count += 1
+        state.last_timestamp = when
+        state.last_email_id = email_id
+        active[state.id] = state
+        recent.append(state.id)
+        if len(recent) > 10 * RECENT:
+            # Forget the threads that went quiet
+            recent = recent[-RECENT:]
+            active = {thread: active[thread] for thread in recent}
+
+        action_rows = []
+        if i < n - new:
+            category, items = TRUTH.get(template["subject"], ("Important", []))
+            row["category"] = category
+            row["action_items"] = json.dumps([{"task": task, "deadline": deadline} for task, deadline in items])
+            action_rows = [
+                {"email_id": email_id, "position": position, "task": task, "deadline_text": deadline,
+                 "deadline": tasks.parse_deadline(deadline, when), "status": "open", "created_at": when}
+                for position, (task, deadline) in enumerate(items)
+            ]
+        yield row, thread_row, state, action_rows
+
+
+def populate(n: int, new: int = 0, seed: int = 0, chunk: int = CHUNK, progress=None) -> dict:
+    # Appends n synthetic emails to the database; returns counts
+    models.Base.metadata.create_all(bind=database.engine)
+    with database.engine.connect() as conn:
+        first_email_id = (conn.execute(func.max(models.Email.id).select()).scalar() or 0) + 1
+        first_thread_id = (conn.execute(func.max(models.Thread.id).select()).scalar() or 0) + 1
+
+    thread_update = (
+        update(models.Thread.__table__)
+        .where(models.Thread.__table__.c.id == bindparam("thread_id"))
+        .values(
+            participants=bindparam("participants"), message_count=bindparam("message_count"),
+            last_timestamp=bindparam("last_timestamp"), last_email_id=bindparam("last_email_id"),
+        )
+    )
+    counts = {"emails": 0, "threads": 0, "action_items": 0}
+    emails, new_threads, touched, items = [], [], {}, []
+
+    def flush():
+        with database.engine.begin() as conn:
+            if new_threads:
+                conn.execute(insert(models.Thread.__table__), new_threads)
+            conn.execute(insert(models.Email.__table__), emails)
+            if items:
+                conn.execute(insert(models.ActionItem.__table__), items)
+            conn.execute(thread_update, [
+                {"thread_id": state.id, "participants": " ".join(sorted(state.participants)[:threads.MAX_PARTICIPANTS]),
+                 "message_count": state.count, "last_timestamp": state.last_timestamp,
+                 "last_email_id": state.last_email_id}
+                for state in touched.values()
+            ])
+        counts["emails"] += len(emails)
+        counts["threads"] += len(new_threads)
+        counts["action_items"] += len(items)
+        emails.clear()
+        new_threads.clear()
+        touched.clear()
+        items.clear()
+        if progress:
+            progress(counts)
+
+    for row, thread_row, state, action_rows in generate(
+        n, new=new, seed=seed, first_email_id=first_email_id, first_thread_id=first_thread_id
+    ):
+        emails.append(row)
+        if thread_row:
+            new_threads.append(thread_row)
+        touched[state.id] = state
+        items.extend(action_rows)
+        if len(emails) >= chunk:
+            flush()
+    if emails:
+        flush()
+    return counts
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if not args or not args[0].isdigit():
+        print("usage: python -m backend.benchmarks.synthetic_inbox EMAILS [--new N] [--seed S]")
+        sys.exit(1)
+    options = dict(zip(args[1::2], args[2::2]))
+    started = datetime.utcnow()
+    result = populate(
+        int(args[0]), new=int(options.get("--new", 0)), seed=int(options.get("--seed", 0)),
+        progress=lambda counts: print(f"\r{counts['emails']} emails", end="", flush=True),
+    )
+    print(f"\n{result} in {(datetime.utcnow() - started).total_seconds():.1f}s")
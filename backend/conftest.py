@@ -0,0 +1,72 @@
+import os
+import sys
+import tempfile
+import pytest
+
+# The tests import the app as the `backend` package, against throwaway storage and the
+# local fake LLM. Set before any backend module reads its configuration at import.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_storage = tempfile.mkdtemp(prefix="ocean_ai_tests_")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{os.path.join(_storage, 'ocean_ai.db')}",
+    "VECTOR_INDEX_PATH": os.path.join(_storage, "vector_index.npz"),
+    "PRECLASSIFIER_PATH": os.path.join(_storage, "preclassifier.json"),
+    "LLM_PROVIDER": "fake",
+    "LLM_CACHE": "0",
+    # Every email goes through the LLM stages under test
+    "PRECLASSIFIER": "0",
+    "NEAR_DUP": "0",
+})
+
+
+@pytest.fixture
+def db(tmp_path):
+    # A migrated database of its own per test
+    from backend import database, migrations
+    from backend.services import prompt_templates
+    # Compiled templates are cached by version id, which every test database reuses
+    prompt_templates._compiled.clear()
+    engine = database.create_db_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    migrations.migrate(engine)
+    session = database.SessionLocal(bind=engine)
+    yield session
+    session.close()
+    engine.dispose()
+
+
+@pytest.fixture
+def client(db, tmp_path):
+    # The API over the `db` fixture's database. Startup hooks don't run, and each
+    # request opens its own connection since every request gets a fresh event loop.
+    from fastapi.testclient import TestClient
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from sqlalchemy.pool import NullPool
+    from backend import database, main
+    engine = create_async_engine(database.async_url(f"sqlite:///{tmp_path / 'test.db'}"), poolclass=NullPool)
+    sessions = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+    async def get_async_db():
+        async with sessions() as session:
+            yield session
+
+    main.app.dependency_overrides[main.get_async_db] = get_async_db
+    yield TestClient(main.app)
+    main.app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def fake_provider():
+    # install(**FakeLLM options) -> the FakeLLM behind a fresh router, so breaker and
+    # latency state never leak between tests
+    from backend.services import fake_llm, llm_router
+    previous = llm_router._router
+
+    def install(**options):
+        llm = fake_llm.FakeLLM(**{"latency": 0.0, **options})
+        llm_router.set_router(llm_router.Router([llm_router.FakeProvider(llm=llm)], default=["fake"]))
+        return llm
+
+    yield install
+    llm_router.set_router(previous)
@@ -1,53 +1,51 @@
 import os
 import json
-import google.generativeai as genai
-from groq import Groq
+import logging
 from dotenv import load_dotenv
 from typing import List, Dict, Any
+from services.llm_cache import get_llm_cache, make_key
+from services.llm_router import Router, GeminiProvider, GroqProvider
+from services.llm_service import LLMError
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 
-# Configure Gemini
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
+GEMINI_MODEL = 'gemini-1.5-flash'
+GROQ_MODEL = "llama3-8b-8192"
 
-# Configure Groq
-groq_client = Groq(api_key=GROQ_API_KEY) if GROQ_API_KEY else None
+# Shared by every LLMService so the provider clients and latency stats persist.
+# Gemini stays the preferred provider until the router has measured both.
+router = Router([
+    GeminiProvider(GEMINI_MODEL, GEMINI_API_KEY),
+    GroqProvider(GROQ_MODEL, GROQ_API_KEY),
+])
 
 class LLMService:
     def __init__(self):
-        self.gemini_model = genai.GenerativeModel('gemini-1.5-flash') if GEMINI_API_KEY else None
-
-    def _call_gemini(self, prompt: str) -> str:
-        if not self.gemini_model:
-            raise Exception("Gemini API Key not found")
-        response = self.gemini_model.generate_content(prompt)
-        return response.text
-
-    def _call_groq(self, prompt: str, model="llama3-8b-8192") -> str:
-        if not groq_client:
-            raise Exception("Groq API Key not found")
-        chat_completion = groq_client.chat.completions.create(
-            messages=[
-                {"role": "user", "content": prompt}
-            ],
-            model=model,
-        )
-        return chat_completion.choices[0].message.content
+        self.router = router
+        self.cache = get_llm_cache()
 
     def call_llm(self, prompt: str) -> str:
-        # Fallback logic: Try Gemini, then Groq
+        keys = {name: make_key(name, provider.model, prompt) for name, provider in self.router.providers.items()}
+        if self.cache:
+            for key in keys.values():
+                cached = self.cache.get(key)
+                if cached is not None:
+                    return cached
+
+        # Fastest healthy provider first, failing over to the other. A failure is raised,
+        # never returned as if it were the model's answer
         try:
-            return self._call_gemini(prompt)
+            result = self.router.complete(prompt)
         except Exception as e:
-            print(f"Gemini failed: {e}. Trying Groq...")
-            try:
-                return self._call_groq(prompt)
-            except Exception as e2:
-                return f"Error calling LLM: {e2}"
+            raise LLMError(str(e)) from e
+        if self.cache:
+            self.cache.set(keys[result.provider], result.text)
+        return result.text
 
     def categorize_email(self, email_body: str, prompt_template: str) -> str:
         full_prompt = f"{prompt_template}\n\nEmail Body:\n{email_body}"
@@ -62,7 +60,7 @@ class LLMService:
             cleaned_text = response_text.replace("```json", "").replace("```", "").strip()
             return json.loads(cleaned_text)
         except json.JSONDecodeError:
-            print(f"Failed to parse JSON from LLM response: {response_text}")
+            logger.exception("Failed to parse JSON from LLM response: %s", response_text)
             return []
 
     def generate_draft(self, email_body: str, instructions: str, prompt_template: str) -> str:
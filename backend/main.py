@@ -1,10 +1,29 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
+import json
+import logging
+import os
+import time
+from datetime import date
 from . import models, schemas, database
+from .database import get_async_db
 
-models.Base.metadata.create_all(bind=database.engine)
+CHAT_CONTEXT_EMAILS = int(os.getenv("CHAT_CONTEXT_EMAILS", "8"))
+CHAT_CONTEXT_TOKENS = int(os.getenv("CHAT_CONTEXT_TOKENS", "1500"))
+# Log a JSON timing breakdown for every request; otherwise only for requests sent
+# with an "X-Timing: 1" header or ?timing=1
+TIMING_LOGS = os.getenv("TIMING_LOGS", "0") == "1"
+# Create/upgrade the schema when the app starts. Deployments that run
+# `python -m backend.migrations` as a release step set this to 0.
+MIGRATE_ON_STARTUP = os.getenv("MIGRATE_ON_STARTUP", "1") == "1"
+
+# The services log through logging.getLogger(__name__); request timing lines are INFO
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
 
 app = FastAPI(title="Ocean AI Email Agent")
 
@@ -14,8 +33,60 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    from .services import metrics
+    timing = TIMING_LOGS or request.headers.get("x-timing") == "1" or request.query_params.get("timing") == "1"
+    token = metrics.start_timing() if timing else None
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        # Streaming responses are timed until their headers are sent
+        elapsed = time.perf_counter() - started
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        metrics.http_request_duration.labels(method=request.method, route=path, status=str(status)).observe(elapsed)
+        if token is not None:
+            record = metrics.finish_timing(token, method=request.method, route=path, status=status, ms=round(elapsed * 1000, 2))
+    if token is not None:
+        response.headers["Server-Timing"] = ", ".join(
+            [f"total;dur={record['ms']}"] + [f"{span['name']};dur={span['ms']}" for span in record["spans"]]
+        )
+    return response
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    # Prometheus text exposition format. The service modules register their own
+    # collectors (cache, queue depth, jobs) on import.
+    from .services import metrics, llm_service, async_ingestion, jobs
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# Startup hooks run in the order they are registered: the schema comes first
+@app.on_event("startup")
+def migrate_schema():
+    if MIGRATE_ON_STARTUP:
+        from . import migrations
+        migrations.migrate()
+
+@app.on_event("startup")
+def resume_ingest_jobs():
+    # The job runner imports the whole ingestion pipeline (numpy, LLM router); only
+    # load it on startup when there is an unfinished job that may need resuming
+    db = database.SessionLocal()
+    try:
+        interrupted = db.query(models.Job.id).filter(models.Job.status.in_(["queued", "running"])).first()
+    finally:
+        db.close()
+    if interrupted:
+        from .services import jobs
+        jobs.resume_jobs()
+
 @app.get("/")
 def read_root():
     return {"message": "Ocean AI Email Agent Backend is running"}
@@ -28,73 +99,319 @@ def get_db():
     finally:
         db.close()
 
+
 @app.get("/emails", response_model=List[schemas.Email])
-def get_emails(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    emails = db.query(models.Email).offset(skip).limit(limit).all()
-    return emails
+async def get_emails(request: Request, skip: int = 0, limit: int = 100, cursor: Optional[str] = None,
+                     category: Optional[str] = None, is_read: Optional[bool] = None, sender: Optional[str] = None,
+                     thread_id: Optional[int] = None, db: AsyncSession = Depends(get_async_db)):
+    # Pass the X-Next-Cursor header back as ?cursor= to fetch the next page; unchanged
+    # pages answer If-None-Match with 304
+    from .services import email_query, responses
+    try:
+        emails, next_cursor = await db.run_sync(
+            email_query.list_email_columns, email_query.EMAIL_COLUMNS, limit=limit, cursor=cursor, skip=skip,
+            category=category, is_read=is_read, sender=sender, thread_id=thread_id,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return responses.json_response(request, emails, {"X-Next-Cursor": next_cursor} if next_cursor else None)
+
+@app.get("/emails/summary", response_model=List[schemas.EmailSummary])
+async def get_email_summaries(request: Request, skip: int = 0, limit: int = 100, cursor: Optional[str] = None,
+                              category: Optional[str] = None, is_read: Optional[bool] = None, sender: Optional[str] = None,
+                              thread_id: Optional[int] = None, db: AsyncSession = Depends(get_async_db)):
+    # The inbox list: same paging and filters as /emails without body or action items
+    from .services import email_query, responses
+    try:
+        emails, next_cursor = await db.run_sync(
+            email_query.list_email_columns, email_query.SUMMARY_COLUMNS, limit=limit, cursor=cursor, skip=skip,
+            category=category, is_read=is_read, sender=sender, thread_id=thread_id,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return responses.json_response(request, emails, {"X-Next-Cursor": next_cursor} if next_cursor else None)
+
+@app.get("/emails/search", response_model=List[schemas.EmailSearchResult])
+async def search_emails(q: str, limit: int = 20, offset: int = 0, category: Optional[str] = None, prefix: bool = False,
+                        db: AsyncSession = Depends(get_async_db)):
+    from .services import search
+    return await db.run_sync(search.search_emails, q, limit=limit, offset=offset, category=category, prefix=prefix)
+
+@app.get("/threads", response_model=List[schemas.Thread])
+async def get_threads(response: Response, limit: int = 100, cursor: Optional[str] = None, category: Optional[str] = None,
+                      db: AsyncSession = Depends(get_async_db)):
+    # Most recently active first; pass X-Next-Cursor back as ?cursor=. A thread's
+    # messages are GET /emails?thread_id=
+    from .services import threads
+    try:
+        items, next_cursor = await db.run_sync(threads.list_threads, limit=limit, cursor=cursor, category=category)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return items
+
+@app.get("/tasks", response_model=List[schemas.Task])
+async def get_tasks(response: Response, limit: int = 100, cursor: Optional[str] = None, status: Optional[str] = None,
+                    due_from: Optional[date] = None, due_to: Optional[date] = None, email_id: Optional[int] = None,
+                    category: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
+    # Ordered by deadline, undated tasks last; pass X-Next-Cursor back as ?cursor=
+    from .services import tasks
+    try:
+        items, next_cursor = await db.run_sync(
+            tasks.list_tasks, limit=limit, cursor=cursor, status=status, due_from=due_from, due_to=due_to,
+            email_id=email_id, category=category,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return items
+
+@app.patch("/tasks/{task_id}", response_model=schemas.Task)
+async def update_task(task_id: int, update: schemas.TaskUpdate, db: AsyncSession = Depends(get_async_db)):
+    from .services import tasks
+    task = await db.get(models.ActionItem, task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found")
+    task.status = update.status
+    await db.commit()
+    return await db.run_sync(tasks.get_task, task_id)
 
 @app.get("/prompts", response_model=List[schemas.Prompt])
-def get_prompts(db: Session = Depends(get_db)):
-    prompts = db.query(models.Prompt).all()
+async def get_prompts(db: AsyncSession = Depends(get_async_db)):
+    prompts = (await db.scalars(select(models.Prompt))).all()
     return prompts
 
 @app.post("/prompts", response_model=schemas.Prompt)
-def create_prompt(prompt: schemas.PromptCreate, db: Session = Depends(get_db)):
-    db_prompt = db.query(models.Prompt).filter(models.Prompt.name == prompt.name).first()
-    if db_prompt:
-        # Update existing
-        db_prompt.template = prompt.template
-        db_prompt.description = prompt.description
-        db.commit()
-        db.refresh(db_prompt)
-        return db_prompt
-    
-    db.add(new_prompt)
-    db.commit()
-    db.refresh(new_prompt)
-    return new_prompt
+async def create_prompt(prompt: schemas.PromptCreate, db: AsyncSession = Depends(get_async_db)):
+    from .services import prompt_templates
+    try:
+        db_prompt, template_changed = await db.run_sync(
+            prompt_templates.save_prompt, prompt.name, prompt.template, prompt.description
+        )
+    except prompt_templates.TemplateError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if template_changed:
+        # Responses rendered from the old template can never be hit again
+        from .services import llm_cache
+        cache = llm_cache.get_llm_cache()
+        if cache:
+            cache.invalidate_tag(prompt.name)
+            cache.invalidate_tag("fused")
+    return db_prompt
+
+@app.get("/prompts/{name}/versions", response_model=List[schemas.PromptVersion])
+async def get_prompt_versions(name: str, db: AsyncSession = Depends(get_async_db)):
+    from .services import prompt_templates
+    versions = await db.run_sync(prompt_templates.list_versions, name)
+    if not versions:
+        raise HTTPException(status_code=404, detail="Prompt not found")
+    return versions
+
+@app.get("/llm/cache")
+def get_llm_cache_stats():
+    from .services import llm_cache
+    cache = llm_cache.get_llm_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
+@app.delete("/llm/cache")
+def clear_llm_cache():
+    from .services import llm_cache
+    cache = llm_cache.get_llm_cache()
+    if cache:
+        cache.clear()
+    return {"message": "LLM cache cleared"}
+
+@app.get("/llm/providers")
+def get_llm_providers():
+    from .services import llm_router
+    return llm_router.get_router().snapshot()
 
 @app.post("/ingest/mock")
-def load_mock_data(db: Session = Depends(get_db)):
+async def load_mock_data(db: AsyncSession = Depends(get_async_db)):
     from .services import mock_data
-    mock_data.create_mock_emails(db)
-    mock_data.create_default_prompts(db)
+    await db.run_sync(mock_data.create_mock_emails)
+    await db.run_sync(mock_data.create_default_prompts)
+    from .services import vector_index
+    vector_index.sync_in_background()
     return {"message": "Mock data loaded"}
 
-@app.post("/ingest/process")
-def process_inbox(db: Session = Depends(get_db)):
+@app.post("/ingest/process", response_model=schemas.Job, status_code=202)
+async def process_inbox(concurrency: Optional[int] = None, fused: Optional[bool] = None, batch_size: Optional[int] = None,
+                        db: AsyncSession = Depends(get_async_db)):
+    # Runs in the background; poll GET /jobs/{id} for progress
+    from .services import jobs
+    job = await db.run_sync(jobs.submit_ingest_job, concurrency=concurrency, fused=fused, batch_size=batch_size)
+    return await db.run_sync(jobs.job_status, job)
+
+@app.get("/ingest/stale", response_model=schemas.StalePrompts)
+async def get_stale_results(db: AsyncSession = Depends(get_async_db)):
+    # Results produced by an older version of each prompt
     from .services import ingestion_service
-    return ingestion_service.process_all_emails(db)
+    return await db.run_sync(ingestion_service.stale_counts)
 
-@app.post("/chat", response_model=schemas.ChatResponse)
-def chat_agent(request: schemas.ChatRequest, db: Session = Depends(get_db)):
-    from .services import llm_service
-    
+@app.post("/ingest/reprocess-stale", response_model=schemas.Job, status_code=202)
+async def reprocess_stale(db: AsyncSession = Depends(get_async_db)):
+    # Re-runs only the prompts whose version changed; poll GET /jobs/{id} for progress
+    from .services import jobs
+    job = await db.run_sync(jobs.submit_reprocess_job)
+    return await db.run_sync(jobs.job_status, job)
+
+@app.get("/jobs", response_model=List[schemas.Job])
+async def list_jobs(limit: int = 20, db: AsyncSession = Depends(get_async_db)):
+    from .services import jobs
+    recent = (await db.scalars(select(models.Job).order_by(models.Job.id.desc()).limit(limit))).all()
+    return await db.run_sync(lambda session: [jobs.job_status(session, job) for job in recent])
+
+@app.get("/jobs/{job_id}", response_model=schemas.Job)
+async def get_job(job_id: int, db: AsyncSession = Depends(get_async_db)):
+    from .services import jobs
+    job = await db.get(models.Job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return await db.run_sync(jobs.job_status, job)
+
+@app.get("/preclassifier")
+def get_preclassifier_stats():
+    from .services import preclassifier
+    return preclassifier.stats()
+
+@app.post("/preclassifier/retrain")
+def retrain_preclassifier(db: Session = Depends(get_db)):
+    # CPU-bound training: left to the threadpool rather than the event loop
+    from .services import preclassifier
+    return preclassifier.retrain(db)
+
+@app.get("/near-duplicates")
+def get_near_duplicate_stats():
+    from .services import near_duplicates
+    return near_duplicates.stats()
+
+@app.get("/preprocess")
+def get_preprocess_stats():
+    from .services import preprocess
+    return preprocess.stats()
+
+def build_chat_prompt(db: Session, request: schemas.ChatRequest) -> str:
+    from .services import preprocess, threads
     context = ""
     if request.email_id:
         email = db.query(models.Email).filter(models.Email.id == request.email_id).first()
         if email:
-            context = f"Email Context:\nSender: {email.sender}\nSubject: {email.subject}\nBody: {email.body}\nCategory: {email.category}\nAction Items: {email.action_items}\n\n"
+            context = f"Email Context:\nSender: {email.sender}\nSubject: {email.subject}\nBody: {preprocess.clean_body(email)}\nCategory: {email.category}\nAction Items: {email.action_items}\n\n"
+            history = threads.history(email)
+            if history:
+                context = f"Earlier in this thread:\n{history}\n\n{context}"
     else:
-        # Simple context: list of unread emails or high priority
-        emails = db.query(models.Email).limit(5).all()
-        email_list = "\n".join([f"- [{e.id}] {e.subject} (from {e.sender})" for e in emails])
-        context = f"Recent Emails:\n{email_list}\n\n"
+        # Emails most similar to the query within the context budget, or the most recent ones
+        from .services import vector_index
+        matches = vector_index.retrieve(db, request.query, k=CHAT_CONTEXT_EMAILS, token_budget=CHAT_CONTEXT_TOKENS)
+        if matches:
+            email_list = "\n".join([f"- [{e.id}] {e.subject} (from {e.sender}, {e.category}): {preprocess.clean_body(e)}" for e in matches])
+            context = f"Relevant Emails:\n{email_list}\n\n"
+        else:
+            emails = db.query(models.Email).order_by(models.Email.timestamp.desc()).limit(5).all()
+            email_list = "\n".join([f"- [{e.id}] {e.subject} (from {e.sender})" for e in emails])
+            context = f"Recent Emails:\n{email_list}\n\n"
 
     system_prompt = "You are an intelligent Email Productivity Agent for Ocean AI. Help the user manage their inbox. Use the provided context to answer questions. If asked to draft a reply, suggest one based on the context."
-    full_prompt = f"{system_prompt}\n\n{context}User Query: {request.query}\n\nAgent Response:"
+    return f"{system_prompt}\n\n{context}User Query: {request.query}\n\nAgent Response:"
+
+@app.post("/chat", response_model=schemas.ChatResponse)
+async def chat_agent(request: schemas.ChatRequest, db: AsyncSession = Depends(get_async_db)):
+    from .services import llm_service, metrics
     
-    response_text = llm_service.run_llm(full_prompt)
+    with metrics.span("chat.context"):
+        full_prompt = await db.run_sync(build_chat_prompt, request)
+    # Hand the connection back to the pool for the LLM round-trip
+    await db.close()
+    try:
+        response_text = await llm_service.run_llm_async(full_prompt)
+    except llm_service.LLMError as e:
+        raise HTTPException(status_code=502, detail=f"LLM request failed: {e}")
     return {"response": response_text}
 
+@app.post("/chat/stream")
+async def chat_agent_stream(request: schemas.ChatRequest, db: AsyncSession = Depends(get_async_db)):
+    # Server-sent events: one "data: {"token": ...}" event per chunk, then "event: done"
+    # (or "event: error" if no provider could answer)
+    from .services import llm_service, metrics
+
+    started = time.perf_counter()
+    with metrics.span("chat.context"):
+        full_prompt = await db.run_sync(build_chat_prompt, request)
+    await db.close()
+
+    async def events():
+        first = True
+        try:
+            async for chunk in llm_service.stream_llm_async(full_prompt):
+                if first:
+                    metrics.chat_time_to_first_token.observe(time.perf_counter() - started)
+                    first = False
+                yield f"data: {json.dumps({'token': chunk})}\n\n"
+        except llm_service.LLMError as e:
+            yield f"event: error\ndata: {json.dumps({'detail': f'LLM request failed: {e}'})}\n\n"
+            return
+        metrics.chat_stream_duration.observe(time.perf_counter() - started)
+        yield "event: done\ndata: {}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/chat/metrics")
+def get_chat_metrics():
+    from .services import metrics
+    return {
+        "time_to_first_token_seconds": metrics.chat_time_to_first_token.snapshot(),
+        "stream_duration_seconds": metrics.chat_stream_duration.snapshot(),
+    }
+
 @app.get("/drafts", response_model=List[schemas.Draft])
-def get_drafts(db: Session = Depends(get_db)):
-    return db.query(models.Draft).all()
+async def get_drafts(response: Response, limit: Optional[int] = None, cursor: Optional[str] = None,
+                     status: Optional[str] = None, email_id: Optional[int] = None, db: AsyncSession = Depends(get_async_db)):
+    # Newest first. Unpaginated unless a limit or cursor is passed (the frontend lists
+    # them all); then pass X-Next-Cursor back as ?cursor=
+    from .services import drafts
+    if cursor and limit is None:
+        limit = drafts.DRAFT_PAGE_SIZE
+    try:
+        items, next_cursor = await db.run_sync(
+            drafts.list_drafts, limit=limit, cursor=cursor, status=status, email_id=email_id
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return items
+
+@app.post("/drafts/batch")
+async def create_drafts_batch(request: schemas.DraftBatchRequest, db: AsyncSession = Depends(get_async_db)):
+    # Generates reply drafts for the selected emails (e.g. category=To-Do&sender=...).
+    # Server-sent events: one "data: {processed, failed, saved, total}" event per email,
+    # then "event: done" with the totals. Drafts are committed in chunks as they finish.
+    from .services import drafts
+    try:
+        items = await db.run_sync(drafts.prepare_batch, request)
+    except LookupError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    await db.close()
+
+    async def events():
+        async for progress in drafts.generate_batch(items, request.concurrency):
+            if progress.pop("done", False):
+                yield f"event: done\ndata: {json.dumps(progress)}\n\n"
+            else:
+                yield f"data: {json.dumps(progress)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 @app.post("/drafts", response_model=schemas.Draft)
-def create_draft(draft: schemas.DraftCreate, db: Session = Depends(get_db)):
+async def create_draft(draft: schemas.DraftCreate, db: AsyncSession = Depends(get_async_db)):
     db_draft = models.Draft(**draft.dict())
     db.add(db_draft)
-    db.commit()
-    db.refresh(db_draft)
+    await db.commit()
+    await db.refresh(db_draft)
     return db_draft
@@ -0,0 +1,117 @@
+import logging
+import sys
+from sqlalchemy import inspect, literal, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import CreateColumn
+from . import database, models
+
+# Schema setup, run once per deploy (python -m backend.migrations) or by the API's
+# startup hook (MIGRATE_ON_STARTUP=1, the default), never at import. Migrations are
+# additive only: missing tables are created, and on existing tables missing columns
+# are added (existing rows get the column's scalar default, else NULL) and missing
+# indexes are built. Columns are never dropped, renamed or retyped, so constraints
+# that must reach existing databases (e.g. the importer's unique dedup keys) are
+# declared as indexes. An upgrade that adds threading or the action_items table also
+# backfills existing emails, once, here rather than on every boot.
+
+logger = logging.getLogger(__name__)
+
+
+def _column_ddl(engine, column) -> str:
+    ddl = str(CreateColumn(column).compile(dialect=engine.dialect))
+    default = column.default
+    if column.server_default is None and default is not None and default.is_scalar:
+        value = literal(default.arg, column.type).compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True})
+        ddl += f" DEFAULT {value}"
+    return ddl
+
+
+def _has_index(inspector, table_name: str, index) -> bool:
+    # By name, or a unique constraint on the same columns (databases created when the
+    # column itself was declared unique=True)
+    if index.name in {existing["name"] for existing in inspector.get_indexes(table_name)}:
+        return True
+    if index.unique:
+        columns = [column.name for column in index.columns]
+        return any(
+            constraint["column_names"] == columns for constraint in inspector.get_unique_constraints(table_name)
+        )
+    return False
+
+
+def migrate(engine=None) -> dict:
+    # Returns what was created: {"tables": [...], "columns": [...], "indexes": [...]},
+    # "failed": unique indexes that existing duplicate rows prevent, the number of
+    # emails backfilled ("threaded", "action_items") when a backfill ran, and of
+    # prompt versions added ("prompt_versions")
+    engine = engine or database.engine
+    inspector = inspect(engine)
+    existing = set(inspector.get_table_names())
+    created = {"tables": [], "columns": [], "indexes": [], "failed": []}
+
+    missing_indexes = []
+    with engine.begin() as conn:
+        for table in models.Base.metadata.sorted_tables:
+            if table.name not in existing:
+                table.create(bind=conn)
+                created["tables"].append(table.name)
+                continue
+            columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in columns:
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {_column_ddl(engine, column)}"))
+                    created["columns"].append(f"{table.name}.{column.name}")
+            missing_indexes.extend(index for index in table.indexes if not _has_index(inspector, table.name, index))
+
+    # One transaction per index: a unique index over duplicate rows fails on its own
+    for index in missing_indexes:
+        try:
+            with engine.begin() as conn:
+                index.create(bind=conn)
+            created["indexes"].append(index.name)
+        except IntegrityError as e:
+            logger.error("Could not create unique index %s, duplicate rows: %s", index.name, e.orig)
+            created["failed"].append(index.name)
+
+    # Full-text index and its triggers (SQLite only)
+    from .services import search
+    search.install(engine)
+
+    # Data backfills that only an upgrade from before the feature needs; emails
+    # stored since then are threaded and get their action item rows on insert. If
+    # one is interrupted, finish it with the module's command line.
+    if "emails" in existing:
+        db = database.SessionLocal(bind=engine)
+        try:
+            if "threads" in created["tables"] or "emails.thread_id" in created["columns"]:
+                from .services import threads
+                created["threaded"] = threads.index_emails(db)
+                db.commit()
+            if "action_items" in created["tables"]:
+                from .services import tasks
+                created["action_items"] = tasks.backfill(db)
+        finally:
+            db.close()
+
+    # Prompts saved before versioning or edited in the table directly get a version
+    # here, so reads (GET /ingest/stale) never have to write one
+    if "prompts" in existing:
+        from .services import prompt_templates
+        db = database.SessionLocal(bind=engine)
+        try:
+            versioned = prompt_templates.sync_versions(db)
+        finally:
+            db.close()
+        if versioned:
+            created["prompt_versions"] = versioned
+    return created
+
+
+if __name__ == "__main__":
+    # python -m backend.migrations
+    if sys.argv[1:]:
+        print("usage: python -m backend.migrations")
+        sys.exit(1)
+    result = migrate()
+    print(result)
+    sys.exit(1 if result["failed"] else 0)
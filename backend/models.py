@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, Date, DateTime, Boolean, ForeignKey, Index, LargeBinary
 from sqlalchemy.orm import relationship
 from .database import Base
 from datetime import datetime
@@ -14,7 +14,90 @@ class Email(Base):
     timestamp = Column(DateTime, default=datetime.utcnow)
     category = Column(String, default="Uncategorized")
     is_read = Column(Boolean, default=False)
-    action_items = Column(Text, default="[]") # JSON string of action items
+    action_items = Column(Text, default="[]") # JSON string of action items, mirrored into ActionItem rows
+    # Claimed by an ingestion job until lease_expires_at, so overlapping runs never share an email
+    lease_owner = Column(String, nullable=True, index=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    # Dedup keys for imported mail: the Message-ID header and a hash of the content
+    # (unique indexes below, so migrations can add them to existing databases)
+    message_id = Column(String, nullable=True)
+    content_hash = Column(String, nullable=True)
+    # Body with HTML, quoted replies and signatures stripped (services/preprocess.py)
+    clean_body = Column(Text, nullable=True)
+    body_tokens = Column(Integer, nullable=True)
+    clean_tokens = Column(Integer, nullable=True)
+    # Prompt versions that produced category / action_items (NULL: not produced by a prompt)
+    category_version_id = Column(Integer, ForeignKey("prompt_versions.id"), nullable=True, index=True)
+    actions_version_id = Column(Integer, ForeignKey("prompt_versions.id"), nullable=True, index=True)
+    # Conversation threading (services/threads.py): reply headers, To/Cc and the thread
+    in_reply_to = Column(String, nullable=True, index=True)
+    references = Column(Text, nullable=True) # space-separated Message-IDs, oldest first
+    recipients = Column(Text, nullable=True) # space-separated To/Cc addresses
+    thread_id = Column(Integer, ForeignKey("threads.id"), nullable=True, index=True)
+    # Near-duplicate detection (services/near_duplicates.py): MinHash signature and the
+    # processed email whose category and action items were reused for this one
+    minhash = Column(LargeBinary, nullable=True)
+    duplicate_of = Column(Integer, ForeignKey("emails.id"), nullable=True)
+
+    thread = relationship("Thread")
+    tasks = relationship("ActionItem", back_populates="email", cascade="all, delete-orphan", order_by="ActionItem.position")
+
+    # Keyset pagination for GET /emails, newest first, optionally filtered
+    __table_args__ = (
+        Index("ix_emails_timestamp_id", "timestamp", "id"),
+        Index("ix_emails_category_timestamp_id", "category", "timestamp", "id"),
+        Index("ix_emails_is_read_timestamp_id", "is_read", "timestamp", "id"),
+        Index("ix_emails_sender_timestamp_id", "sender", "timestamp", "id"),
+        Index("ix_emails_message_id", "message_id", unique=True),
+        Index("ix_emails_content_hash", "content_hash", unique=True),
+    )
+
+class Thread(Base):
+    # A conversation, maintained incrementally as emails arrive (services/threads.py)
+    __tablename__ = "threads"
+
+    id = Column(Integer, primary_key=True, index=True)
+    subject = Column(String) # first message's subject without Re:/Fwd: prefixes
+    subject_key = Column(String) # normalized subject for the header-less fallback
+    participants = Column(Text, default="") # space-separated addresses
+    message_count = Column(Integer, default=0)
+    first_timestamp = Column(DateTime)
+    last_timestamp = Column(DateTime)
+    last_email_id = Column(Integer, nullable=True) # newest message, the only one sent to the LLM
+
+    # GET /threads pages newest first; the fallback looks up recent threads by subject
+    __table_args__ = (
+        Index("ix_threads_last_timestamp_id", "last_timestamp", "id"),
+        Index("ix_threads_subject_key_last_timestamp", "subject_key", "last_timestamp"),
+    )
+
+class MinhashBand(Base):
+    # LSH bucket membership: one row per signature band of each indexed email
+    __tablename__ = "minhash_bands"
+
+    band = Column(Integer, primary_key=True) # 63-bit hash of the band number and its rows
+    email_id = Column(Integer, ForeignKey("emails.id"), primary_key=True)
+
+class ActionItem(Base):
+    # One row per extracted action item (services/tasks.py), queried by GET /tasks
+    __tablename__ = "action_items"
+
+    id = Column(Integer, primary_key=True, index=True)
+    email_id = Column(Integer, ForeignKey("emails.id"), index=True)
+    position = Column(Integer, default=0) # order within the email's action items
+    task = Column(Text)
+    deadline = Column(Date, nullable=True) # normalized from deadline_text when possible
+    deadline_text = Column(String, nullable=True) # as the LLM wrote it
+    status = Column(String, default="open") # open, done
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    email = relationship("Email", back_populates="tasks")
+
+    # GET /tasks orders by deadline (undated last) then id, optionally per status
+    __table_args__ = (
+        Index("ix_action_items_deadline_id", "deadline", "id"),
+        Index("ix_action_items_status_deadline_id", "status", "deadline", "id"),
+    )
 
 class Prompt(Base):
     __tablename__ = "prompts"
@@ -23,14 +106,67 @@ class Prompt(Base):
     name = Column(String, unique=True, index=True)
     template = Column(Text)
     description = Column(String)
+    version_id = Column(Integer, ForeignKey("prompt_versions.id"), nullable=True) # current version
+
+class PromptVersion(Base):
+    # Immutable: editing a prompt adds a version instead of changing this row
+    __tablename__ = "prompt_versions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    prompt_name = Column(String, index=True)
+    version = Column(Integer)
+    template = Column(Text)
+    variables = Column(Text, default="[]") # JSON list of the template's variables
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_prompt_versions_name_version", "prompt_name", "version", unique=True),
+    )
 
 class Draft(Base):
     __tablename__ = "drafts"
 
     id = Column(Integer, primary_key=True, index=True)
-    email_id = Column(Integer, ForeignKey("emails.id"), nullable=True)
+    email_id = Column(Integer, ForeignKey("emails.id"), nullable=True, index=True)
     subject = Column(String)
     body = Column(Text)
     status = Column(String, default="draft") # draft, sent (simulated)
+    prompt_version_id = Column(Integer, ForeignKey("prompt_versions.id"), nullable=True, index=True)
     
     email = relationship("Email")
+
+    __table_args__ = (
+        # GET /drafts?status= pages by id within a status
+        Index("ix_drafts_status_id", "status", "id"),
+    )
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, default="ingest") # ingest, reprocess
+    status = Column(String, default="queued", index=True) # queued, running, completed, failed
+    params = Column(Text, default="{}") # JSON string of job options
+    processed = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    # Process running the job and its last heartbeat; another process takes the job over
+    # only once the heartbeat is older than JOB_STALE_SECONDS (services/jobs.py)
+    owner = Column(String, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+
+class ImportCheckpoint(Base):
+    __tablename__ = "import_checkpoints"
+
+    id = Column(Integer, primary_key=True, index=True)
+    source = Column(String, unique=True, index=True) # absolute path of the mbox/Maildir/JSONL
+    format = Column(String)
+    position = Column(Integer, default=0) # byte offset (mbox, jsonl) or mtime_ns watermark (maildir)
+    fingerprint = Column(String, nullable=True) # hash of the file head, detects a replaced file
+    messages = Column(Integer, default=0)
+    imported = Column(Integer, default=0)
+    duplicates = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
@@ -1,6 +1,6 @@
 from pydantic import BaseModel
-from typing import List, Optional, Any
-from datetime import datetime
+from typing import List, Optional, Any, Literal
+from datetime import date, datetime
 
 class EmailBase(BaseModel):
     sender: str
@@ -16,10 +16,47 @@ class EmailCreate(EmailBase):
 
 class Email(EmailBase):
     id: int
+    body_tokens: Optional[int] = None
+    clean_tokens: Optional[int] = None
+    category_version_id: Optional[int] = None
+    actions_version_id: Optional[int] = None
+    thread_id: Optional[int] = None
 
     class Config:
         orm_mode = True
 
+class EmailSummary(BaseModel):
+    # Inbox list row (GET /emails/summary)
+    id: int
+    sender: str
+    subject: str
+    timestamp: Optional[datetime] = None
+    category: Optional[str] = "Uncategorized"
+    is_read: Optional[bool] = False
+    thread_id: Optional[int] = None
+
+class Thread(BaseModel):
+    # GET /threads row; category, is_read and last_sender are the newest message's
+    id: int
+    subject: Optional[str] = None
+    participants: List[str] = []
+    message_count: int
+    first_timestamp: Optional[datetime] = None
+    last_timestamp: Optional[datetime] = None
+    last_email_id: Optional[int] = None
+    last_sender: Optional[str] = None
+    category: Optional[str] = None
+    is_read: Optional[bool] = None
+
+class EmailSearchResult(BaseModel):
+    id: int
+    sender: str
+    subject: str
+    timestamp: Optional[datetime] = None
+    category: Optional[str] = None
+    snippet: str
+    rank: float
+
 class PromptBase(BaseModel):
     name: str
     template: str
@@ -30,10 +67,25 @@ class PromptCreate(PromptBase):
 
 class Prompt(PromptBase):
     id: int
+    version_id: Optional[int] = None
 
     class Config:
         orm_mode = True
 
+class PromptVersion(BaseModel):
+    id: int
+    prompt_name: str
+    version: int
+    template: str
+    variables: List[str] = []
+    created_at: Optional[datetime] = None
+
+class StalePrompts(BaseModel):
+    categorization: int = 0
+    action_extraction: int = 0
+    auto_reply: int = 0
+    emails: int = 0
+
 class DraftBase(BaseModel):
     email_id: Optional[int] = None
     subject: str
@@ -45,13 +97,65 @@ class DraftCreate(DraftBase):
 
 class Draft(DraftBase):
     id: int
+    prompt_version_id: Optional[int] = None
 
     class Config:
         orm_mode = True
 
+class DraftBatchRequest(BaseModel):
+    # Which emails get a generated reply: explicit ids and/or the /emails filters,
+    # newest first, at most `limit`
+    email_ids: Optional[List[int]] = None
+    category: Optional[str] = None
+    sender: Optional[str] = None
+    is_read: Optional[bool] = None
+    thread_id: Optional[int] = None
+    # Leave out emails that already have a draft
+    skip_existing: bool = True
+    limit: int = 100
+    concurrency: Optional[int] = None
+
+class Job(BaseModel):
+    id: int
+    kind: str
+    status: str
+    processed: int = 0
+    failed: int = 0
+    remaining: Optional[int] = None
+    emails_per_second: Optional[float] = None
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
 class ChatRequest(BaseModel):
     query: str
     email_id: Optional[int] = None
 
 class ChatResponse(BaseModel):
     response: str
+
+class ActionItem(BaseModel):
+    task: str
+    deadline: Optional[str] = None
+
+class Task(BaseModel):
+    # An action item row, with just enough of its email to display it
+    id: int
+    email_id: int
+    task: str
+    deadline: Optional[date] = None
+    deadline_text: Optional[str] = None
+    status: str
+    email_subject: Optional[str] = None
+    email_sender: Optional[str] = None
+    email_category: Optional[str] = None
+
+class TaskUpdate(BaseModel):
+    status: Literal["open", "done"]
+
+class FusedResult(BaseModel):
+    # Structured output of the single-call "fused" ingestion mode
+    category: Literal["Important", "Newsletter", "Spam", "To-Do"]
+    action_items: List[ActionItem] = []
+    draft: Optional[str] = None
@@ -0,0 +1,310 @@
+import asyncio
+import logging
+import os
+import time
+from sqlalchemy.orm import Session, selectinload
+from .. import models
+from . import llm_service, metrics
+from . import ingestion_service, batch_categorizer, near_duplicates, preclassifier, tasks, threads
+from .ingestion_service import render_prompt, parse_category, parse_action_items, build_draft, DRAFT_CATEGORIES
+
+# Concurrent ingestion engine: categorization -> action extraction -> draft generation,
+# connected by bounded queues. LLM calls share one concurrency limit (the router applies
+# each provider's rate limits); all DB work stays on the event loop thread.
+
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "8"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "32"))
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+# Queues of the pipelines currently running, exported as ingest_queue_depth{stage}
+_active_queues = []
+
+
+def _queue_depth() -> dict:
+    depth = {"categorize": 0, "action_extraction": 0, "auto_reply": 0}
+    for queues in list(_active_queues):
+        for stage, queue in queues.items():
+            depth[stage] += queue.qsize()
+    return depth
+
+
+metrics.register(metrics.Gauge("ingest_queue_depth", "Items waiting per ingestion pipeline stage", _queue_depth, "stage"))
+
+
+class _WorkItem:
+    def __init__(self, email):
+        self.email = email
+        self.category = email.category
+        self.action_items = email.action_items
+        self.draft_body = None
+        self.preclassified = False
+        self.versions = {}  # prompt name -> PromptVersion id behind each result
+        self.duplicate_of = None
+        self.followers = []  # near-duplicates in this run that reuse this item's results
+
+
+async def _run_stage(inbox: asyncio.Queue, handler, workers: int, outbox: asyncio.Queue = None, next_workers: int = 0):
+    async def worker():
+        while True:
+            item = await inbox.get()
+            if item is _DONE:
+                return
+            result = await handler(item)
+            if outbox is None or result is None:
+                continue
+            # Batch handlers fan back out into single emails
+            for out in (result if isinstance(result, list) else [result]):
+                await outbox.put(out)
+
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    if outbox is not None:
+        for _ in range(next_workers):
+            await outbox.put(_DONE)
+
+
+async def process_all_emails_async(db: Session, concurrency: int = None, queue_size: int = None, provider: str = None,
+                                   fused: bool = None, batch_size: int = None, emails=None, commit_every: int = None):
+    # emails: process exactly these rows (e.g. a job's claimed batch) instead of the
+    # Uncategorized newest message of every thread
+    concurrency = concurrency or INGEST_CONCURRENCY
+    fused = ingestion_service.INGEST_FUSED if fused is None else fused
+    batch_size = batch_categorizer.INGEST_BATCH_SIZE if batch_size is None else batch_size
+    queue_size = queue_size or INGEST_QUEUE_SIZE
+    provider = provider or llm_service.LLM_PROVIDER
+
+    prompts = ingestion_service.load_prompts(db)
+    if emails is None:
+        emails = (
+            db.query(models.Email)
+            .options(selectinload(models.Email.tasks), selectinload(models.Email.thread))
+            .filter(models.Email.category == "Uncategorized", threads.is_latest())
+            .all()
+        )
+    batched = batch_size > 1 and not fused and "categorization" in prompts
+
+    semaphore = asyncio.Semaphore(concurrency)
+    commit_every = commit_every or ingestion_service.INGEST_COMMIT_EVERY
+    pending_writes = [0]
+    stats = {
+        "processed": 0, "failed": 0, "llm_calls": 0, "preclassified": 0, "near_duplicates": 0,
+        "fused_fallbacks": 0, "batch_fallbacks": 0,
+    }
+    started = time.perf_counter()
+    # Draft and retry tasks started for near-duplicates outside the stage queues
+    spawned = []
+
+    async def call_llm(prompt_text: str, cache_tag: str) -> str:
+        async with semaphore:
+            stats["llm_calls"] += 1
+            return await llm_service.run_llm_async(prompt_text, provider, cache_tag=cache_tag)
+
+    def stage_timer(stage: str):
+        return metrics.span(f"ingest.{stage}", metrics.ingest_stage_duration.labels(stage=stage))
+
+    def finish(item):
+        # Results are applied only once every stage for the email succeeded
+        email = item.email
+        email.category = item.category
+        email.category_version_id = item.versions.get("categorization")
+        tasks.set_action_items(email, item.action_items)
+        email.actions_version_id = item.versions.get("action_extraction")
+        email.duplicate_of = item.duplicate_of
+        if item.draft_body is not None:
+            db.add(build_draft(email, item.draft_body, item.versions.get("auto_reply")))
+        stats["processed"] += 1
+        pending_writes[0] += 1
+        if pending_writes[0] >= commit_every:
+            with stage_timer("commit"):
+                db.commit()
+            pending_writes[0] = 0
+        for follower in item.followers:
+            reuse(follower, email)
+
+    def fail(item, error):
+        logger.error("Failed to process email %s: %s", item.email.id, error)
+        stats["failed"] += 1
+        # Its near-duplicates have nothing to reuse, they go through the LLM on their own
+        for follower in item.followers:
+            spawned.append(asyncio.ensure_future(process_alone(follower)))
+
+    def reuse(item, source):
+        # Takes the category and action items of a processed email; drafts are still generated
+        results = near_duplicates.reused_results(source, item.email)
+        item.category = results["category"]
+        item.action_items = results["action_items"]
+        item.versions = {"categorization": results["category_version_id"], "action_extraction": results["actions_version_id"]}
+        item.duplicate_of = results["duplicate_of"]
+        stats["near_duplicates"] += 1
+        if item.category in DRAFT_CATEGORIES and "auto_reply" in prompts:
+            spawned.append(asyncio.ensure_future(generate_draft(item)))
+        else:
+            finish(item)
+
+    # 1. Categorization
+    async def categorize(item):
+        if isinstance(item, list):
+            return await categorize_batch(item)
+        if item.preclassified:
+            return item
+        try:
+            if fused:
+                with stage_timer("fused"):
+                    text = await call_llm(ingestion_service.render_fused_prompt(prompts, item.email), "fused")
+                result = ingestion_service.parse_fused(text)
+                if result:
+                    item.category = result.category
+                    item.action_items = ingestion_service.fused_action_items(result)
+                    if result.category in DRAFT_CATEGORIES and result.draft:
+                        item.draft_body = result.draft
+                    item.versions = {name: prompt.version_id for name, prompt in prompts.items()}
+                    finish(item)
+                    return None
+                # Fall back to one request per prompt
+                stats["fused_fallbacks"] += 1
+            if "categorization" in prompts:
+                with stage_timer("categorization"):
+                    text = await call_llm(render_prompt(prompts["categorization"], item.email, "categorization"), "categorization")
+                item.category = parse_category(text.strip())
+                item.versions["categorization"] = prompts["categorization"].version_id
+            return item
+        except Exception as e:
+            fail(item, e)
+
+    # 1b. Batched categorization: one request per packed group of emails
+    async def categorize_batch(items):
+        try:
+            with stage_timer("batch_categorization"):
+                categories = await batch_categorizer.categorize_emails_async(
+                    [item.email for item in items], prompts["categorization"], call_llm
+                )
+        except Exception as e:
+            logger.warning("Batch categorization failed: %s", e)
+            categories = {}
+        done = []
+        for item in items:
+            if item.email.id in categories:
+                item.category = categories[item.email.id]
+                item.versions["categorization"] = prompts["categorization"].version_id
+                done.append(item)
+            else:
+                # Still missing after the batch retries, categorize it on its own
+                stats["batch_fallbacks"] += 1
+                result = await categorize(item)
+                if result is not None:
+                    done.append(result)
+        return done
+
+    # 2. Action Extraction
+    async def extract_actions(item):
+        try:
+            if "action_extraction" in prompts:
+                with stage_timer("action_extraction"):
+                    text = await call_llm(render_prompt(prompts["action_extraction"], item.email, "action_extraction"), "action_extraction")
+                item.action_items = parse_action_items(text)
+                item.versions["action_extraction"] = prompts["action_extraction"].version_id
+            if item.category in DRAFT_CATEGORIES and "auto_reply" in prompts:
+                return item
+            finish(item)
+        except Exception as e:
+            fail(item, e)
+
+    # 3. Draft Generation (for Important or To-Do emails)
+    async def generate_draft(item):
+        try:
+            with stage_timer("auto_reply"):
+                item.draft_body = await call_llm(render_prompt(prompts["auto_reply"], item.email, "auto_reply"), "auto_reply")
+            item.versions["auto_reply"] = prompts["auto_reply"].version_id
+            finish(item)
+        except Exception as e:
+            fail(item, e)
+
+    async def process_alone(item):
+        item = await categorize(item)
+        if item is not None:
+            item = await extract_actions(item)
+        if item is not None:
+            await generate_draft(item)
+
+    categorize_queue = asyncio.Queue(maxsize=queue_size)
+    action_queue = asyncio.Queue(maxsize=queue_size)
+    draft_queue = asyncio.Queue(maxsize=queue_size)
+    queues = {"categorize": categorize_queue, "action_extraction": action_queue, "auto_reply": draft_queue}
+
+    def reuse_processed(item) -> bool:
+        # True when a processed near-duplicate answered for the item
+        with stage_timer("near_duplicate"):
+            match = near_duplicates.find(db, item.email)
+        if match:
+            reuse(item, match[0])
+        return match is not None
+
+    async def produce():
+        # 0. Local pre-classifier: resolved emails never reach the LLM queues
+        pending = []
+        for email in emails:
+            item = _WorkItem(email)
+            with stage_timer("preclassify"):
+                prediction = preclassifier.preclassify(email)
+            if prediction is None:
+                pending.append(item)
+                continue
+            stats["preclassified"] += 1
+            item.category = prediction.category
+            item.preclassified = True
+            if item.category in preclassifier.NO_LLM_CATEGORIES:
+                item.action_items = "[]"
+                finish(item)
+            else:
+                pending.append(item)
+
+        # 0b. Near-duplicates: of an already processed email, or of an earlier email in
+        # this run (only that one goes through the LLM, the rest follow its results)
+        if near_duplicates.NEAR_DUP_ENABLED:
+            pending = [item for item in pending if not reuse_processed(item)]
+            with stage_timer("near_duplicate"):
+                followers = near_duplicates.cluster([item.email for item in pending])
+            by_id = {item.email.id: item for item in pending}
+            for item in pending:
+                if item.email.id in followers:
+                    by_id[followers[item.email.id]].followers.append(item)
+            pending = [item for item in pending if item.email.id not in followers]
+
+        for item in pending:
+            if item.preclassified:
+                await categorize_queue.put(item)
+        pending = [item for item in pending if not item.preclassified]
+        if batched:
+            by_id = {item.email.id: item for item in pending}
+            for batch in batch_categorizer.pack_batches([item.email for item in pending], batch_size):
+                await categorize_queue.put([by_id[email.id] for email in batch])
+        else:
+            for item in pending:
+                await categorize_queue.put(item)
+        for _ in range(concurrency):
+            await categorize_queue.put(_DONE)
+
+    # Rows still in flight are read by later stages; don't reload them after each commit
+    expire_on_commit, db.expire_on_commit = db.expire_on_commit, False
+    _active_queues.append(queues)
+    try:
+        await asyncio.gather(
+            produce(),
+            _run_stage(categorize_queue, categorize, concurrency, action_queue, concurrency),
+            _run_stage(action_queue, extract_actions, concurrency, draft_queue, concurrency),
+            _run_stage(draft_queue, generate_draft, concurrency),
+        )
+        while spawned:
+            await spawned.pop()
+        threads.inherit(db, [email.thread_id for email in emails])
+        with stage_timer("commit"):
+            db.commit()
+    finally:
+        _active_queues.remove(queues)
+        db.expire_on_commit = expire_on_commit
+    elapsed = time.perf_counter() - started
+    stats["elapsed_seconds"] = round(elapsed, 3)
+    stats["emails_per_second"] = round(stats["processed"] / elapsed, 2) if elapsed else None
+    return stats
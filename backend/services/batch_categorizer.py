@@ -0,0 +1,99 @@
+import json
+import logging
+import os
+import re
+from . import llm_service, preprocess
+from .ingestion_service import prompt_instructions, parse_category
+
+# Packs several emails into one categorization request. Each email is tagged with its
+# id and the model answers with an {id: category} map; ids that come back missing or
+# malformed are retried in a smaller batch instead of re-sending the whole group.
+
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "0"))
+INGEST_BATCH_TOKENS = int(os.getenv("INGEST_BATCH_TOKENS", "3000"))
+INGEST_BATCH_RETRIES = int(os.getenv("INGEST_BATCH_RETRIES", "2"))
+
+logger = logging.getLogger(__name__)
+
+_LINE_RE = re.compile(r'"?(\d+)"?\s*[:=\-]\s*"?([A-Za-z\-]+)')
+
+
+def _email_block(email) -> str:
+    return f'<email id="{email.id}">\n{preprocess.prompt_body(email, "batch")}\n</email>'
+
+
+def pack_batches(emails, batch_size: int, token_budget: int = INGEST_BATCH_TOKENS):
+    batch, tokens = [], 0
+    for email in emails:
+        cost = preprocess.body_cost(email, "batch") + 10
+        if batch and (len(batch) >= batch_size or tokens + cost > token_budget):
+            yield batch
+            batch, tokens = [], 0
+        batch.append(email)
+        tokens += cost
+    if batch:
+        yield batch
+
+
+def render_batch_prompt(template, emails) -> str:
+    blocks = "\n\n".join(_email_block(email) for email in emails)
+    return (
+        f"{prompt_instructions(template)}\n\n"
+        "Categorize each of the emails below independently. Answer with ONE JSON object mapping "
+        'every email id to its category, e.g. {"12": "Spam", "13": "To-Do"}, and nothing else.\n\n'
+        f"{blocks}"
+    )
+
+
+def parse_batch_response(text: str, ids) -> dict:
+    ids = {str(i): i for i in ids}
+    raw = {}
+    start, end = text.find('{'), text.rfind('}') + 1
+    if start != -1 and end > start:
+        try:
+            raw = json.loads(text[start:end])
+        except json.JSONDecodeError:
+            raw = {}
+    if not isinstance(raw, dict) or not raw:
+        # Some models ignore the JSON instruction and answer "12: Spam" per line
+        raw = dict(_LINE_RE.findall(text))
+
+    categories = {}
+    for key, value in raw.items():
+        key = str(key).strip()
+        if key in ids and isinstance(value, str):
+            category = parse_category(value)
+            if category != "Uncategorized":
+                categories[ids[key]] = category
+    return categories
+
+
+def categorize_emails(emails, template, batch_size: int, provider: str = None) -> dict:
+    results = {}
+    for batch in pack_batches(emails, batch_size):
+        pending = batch
+        for _ in range(1 + INGEST_BATCH_RETRIES):
+            try:
+                text = llm_service.run_llm(render_batch_prompt(template, pending), provider, cache_tag="categorization")
+            except llm_service.LLMError as e:
+                # Whatever is left gets categorized one email at a time
+                logger.warning("Batch categorization failed: %s", e)
+                break
+            results.update(parse_batch_response(text, [e.id for e in pending]))
+            pending = [e for e in pending if e.id not in results]
+            if not pending:
+                break
+    return results
+
+
+async def categorize_emails_async(emails, template, call_llm) -> dict:
+    # call_llm(prompt_text, cache_tag) is the pipeline's rate-limited LLM call
+    results = {}
+    pending = emails
+    for _ in range(1 + INGEST_BATCH_RETRIES):
+        text = await call_llm(render_batch_prompt(template, pending), "categorization")
+        results.update(parse_batch_response(text, [e.id for e in pending]))
+        pending = [e for e in pending if e.id not in results]
+        if not pending:
+            break
+    return results
@@ -0,0 +1,116 @@
+import asyncio
+import base64
+import os
+from sqlalchemy import exists, insert
+from sqlalchemy.orm import Session
+from .. import database, models
+from . import email_query, ingestion_service, llm_service
+
+# Draft listing and batch reply generation. A batch renders the auto_reply prompt for
+# every selected email up front, runs the LLM calls concurrently under a cap (the
+# router applies the provider's rate limits), and writes the finished drafts with bulk
+# inserts, one commit per DRAFT_BATCH_COMMIT_EVERY drafts. Progress is yielded per
+# email so the endpoint can stream it.
+
+DRAFT_BATCH_MAX = int(os.getenv("DRAFT_BATCH_MAX", "1000"))
+DRAFT_BATCH_CONCURRENCY = int(os.getenv("DRAFT_BATCH_CONCURRENCY", "8"))
+DRAFT_BATCH_COMMIT_EVERY = int(os.getenv("DRAFT_BATCH_COMMIT_EVERY", "50"))
+# Page size for GET /drafts when a cursor is passed without a limit
+DRAFT_PAGE_SIZE = int(os.getenv("DRAFT_PAGE_SIZE", "100"))
+
+
+def encode_cursor(draft) -> str:
+    return base64.urlsafe_b64encode(str(draft.id).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def list_drafts(db: Session, limit: int = None, cursor: str = None, status: str = None, email_id: int = None):
+    # Returns (drafts, next_cursor), newest first; every match in one list when no limit is given
+    query = db.query(models.Draft)
+    if status is not None:
+        query = query.filter(models.Draft.status == status)
+    if email_id is not None:
+        query = query.filter(models.Draft.email_id == email_id)
+    if cursor:
+        query = query.filter(models.Draft.id < decode_cursor(cursor))
+    query = query.order_by(models.Draft.id.desc())
+    if limit is None:
+        return query.all(), None
+    limit = max(1, limit)
+    rows = query.limit(limit + 1).all()
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def prepare_batch(db: Session, request) -> list:
+    # -> [(email_id, subject, prompt text, prompt version id)] for the emails a
+    # DraftBatchRequest selects, newest first. LookupError if there is no auto_reply prompt.
+    prompts = ingestion_service.load_prompts(db)
+    if "auto_reply" not in prompts:
+        raise LookupError("No auto_reply prompt")
+    template = prompts["auto_reply"]
+    query = email_query.filter_emails(
+        db.query(models.Email), category=request.category, is_read=request.is_read, sender=request.sender,
+        thread_id=request.thread_id,
+    )
+    if request.email_ids is not None:
+        query = query.filter(models.Email.id.in_(request.email_ids))
+    if request.skip_existing:
+        query = query.filter(~exists().where(models.Draft.email_id == models.Email.id))
+    limit = max(1, min(request.limit, DRAFT_BATCH_MAX))
+    emails = query.order_by(models.Email.timestamp.desc(), models.Email.id.desc()).limit(limit).all()
+    return [
+        (email.id, email.subject, ingestion_service.render_prompt(template, email, "auto_reply"), template.version_id)
+        for email in emails
+    ]
+
+
+async def generate_batch(items: list, concurrency: int = None, provider: str = None, commit_every: int = None):
+    # Async generator over progress dicts, one per finished email; the last one has
+    # done=True. Uses its own session: it outlives the request's.
+    concurrency = max(1, min(concurrency or DRAFT_BATCH_CONCURRENCY, DRAFT_BATCH_CONCURRENCY))
+    provider = provider or llm_service.LLM_PROVIDER
+    commit_every = commit_every or DRAFT_BATCH_COMMIT_EVERY
+    semaphore = asyncio.Semaphore(concurrency)
+    progress = {"total": len(items), "processed": 0, "failed": 0, "saved": 0}
+    rows = []
+
+    async def generate(item):
+        email_id, subject, prompt_text, version_id = item
+        async with semaphore:
+            body = await llm_service.run_llm_async(prompt_text, provider, cache_tag="auto_reply")
+        return {"email_id": email_id, "subject": f"Re: {subject}", "body": body, "status": "draft",
+                "prompt_version_id": version_id}
+
+    async with database.AsyncSessionLocal() as db:
+
+        async def flush():
+            if rows:
+                await db.execute(insert(models.Draft), rows)
+                await db.commit()
+                progress["saved"] += len(rows)
+                rows.clear()
+
+        tasks = [asyncio.ensure_future(generate(item)) for item in items]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                try:
+                    rows.append(await finished)
+                except llm_service.LLMError:
+                    progress["failed"] += 1
+                progress["processed"] += 1
+                if len(rows) >= commit_every:
+                    await flush()
+                yield dict(progress)
+            await flush()
+        finally:
+            # Client went away: stop the calls still waiting
+            for task in tasks:
+                task.cancel()
+    yield {**progress, "done": True}
@@ -0,0 +1,91 @@
+import base64
+from datetime import datetime
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session
+from .. import models
+
+# Keyset pagination over emails, newest first. The cursor encodes the (timestamp, id) of
+# the last row on the previous page, so every page is an index range scan regardless
+# of depth (see the composite indexes on models.Email). Emails without a timestamp
+# (imported without a usable Date header) sort after all the others, newest id first;
+# their cursors carry an empty timestamp.
+
+
+def encode_cursor(email) -> str:
+    timestamp = email.timestamp.isoformat() if email.timestamp is not None else ""
+    raw = f"{timestamp}|{email.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    # -> (timestamp or None, id)
+    try:
+        timestamp, email_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return (datetime.fromisoformat(timestamp) if timestamp else None), int(email_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def filter_emails(query, category: str = None, is_read: bool = None, sender: str = None, thread_id: int = None):
+    if category is not None:
+        query = query.filter(models.Email.category == category)
+    if is_read is not None:
+        query = query.filter(models.Email.is_read == is_read)
+    if sender is not None:
+        query = query.filter(models.Email.sender == sender)
+    if thread_id is not None:
+        query = query.filter(models.Email.thread_id == thread_id)
+    return query
+
+
+# Column projections served without loading whole rows: the fields of schemas.Email
+# (keep in sync) and the ones the inbox list shows
+EMAIL_COLUMNS = (
+    "sender", "subject", "body", "timestamp", "category", "is_read", "action_items",
+    "id", "body_tokens", "clean_tokens", "category_version_id", "actions_version_id", "thread_id",
+)
+SUMMARY_COLUMNS = ("id", "sender", "subject", "timestamp", "category", "is_read", "thread_id")
+
+
+def _page(query, limit: int, cursor: str = None, skip: int = 0):
+    # Returns (rows, next_cursor); next_cursor is None on the last page
+    limit = max(1, limit)
+    # Undated rows go last explicitly rather than by the backend's NULL ordering; on
+    # SQLite this matches the index order, so it is still served by the index
+    ordered = query.order_by(models.Email.timestamp.desc().nulls_last(), models.Email.id.desc())
+    undated = query.filter(models.Email.timestamp.is_(None)).order_by(models.Email.id.desc())
+    if cursor:
+        timestamp, email_id = decode_cursor(cursor)
+        if timestamp is None:
+            rows = undated.filter(models.Email.id < email_id).limit(limit + 1).all()
+        else:
+            # A row comparison is NULL for undated rows, so they follow as a second
+            # range rather than an OR, which would turn the range into a full scan
+            rows = ordered.filter(tuple_(models.Email.timestamp, models.Email.id) < (timestamp, email_id))
+            rows = rows.limit(limit + 1).all()
+            if len(rows) <= limit:
+                rows += undated.limit(limit + 1 - len(rows)).all()
+    elif skip:
+        # Legacy offset paging, still served but linear in depth
+        rows = ordered.offset(skip).limit(limit + 1).all()
+    else:
+        rows = ordered.limit(limit + 1).all()
+
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def list_emails(db: Session, limit: int = 100, cursor: str = None, skip: int = 0,
+                category: str = None, is_read: bool = None, sender: str = None, thread_id: int = None):
+    query = filter_emails(db.query(models.Email), category, is_read, sender, thread_id)
+    return _page(query, limit, cursor, skip)
+
+
+def list_email_columns(db: Session, columns=SUMMARY_COLUMNS, limit: int = 100, cursor: str = None, skip: int = 0,
+                       category: str = None, is_read: bool = None, sender: str = None, thread_id: int = None):
+    # Same page as list_emails, as plain dicts of just `columns` (must include timestamp and id)
+    query = filter_emails(
+        db.query(*[getattr(models.Email, name) for name in columns]), category, is_read, sender, thread_id
+    )
+    rows, next_cursor = _page(query, limit, cursor, skip)
+    return [row._asdict() for row in rows], next_cursor
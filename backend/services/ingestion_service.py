@@ -1,65 +1,358 @@
-from sqlalchemy.orm import Session
-from .. import models
-from . import llm_service
+from sqlalchemy import and_, false, or_, select
+from sqlalchemy.orm import Session, selectinload
+from .. import models, schemas
+from . import llm_service, metrics, near_duplicates, preclassifier, preprocess, prompt_templates, tasks, threads
 import json
+import logging
+import os
 
-def process_email(db: Session, email_id: int):
-    email = db.query(models.Email).filter(models.Email.id == email_id).first()
-    if not email:
-        return
-    
-    # 1. Categorization
-    cat_prompt = db.query(models.Prompt).filter(models.Prompt.name == "categorization").first()
-    if cat_prompt:
-        prompt_text = cat_prompt.template.replace("{email_body}", email.body)
-        category = llm_service.run_llm(prompt_text).strip()
-        # Basic cleanup if LLM is chatty
-        if "Important" in category: email.category = "Important"
-        elif "Newsletter" in category: email.category = "Newsletter"
-        elif "Spam" in category: email.category = "Spam"
-        elif "To-Do" in category: email.category = "To-Do"
-        else: email.category = "Uncategorized"
+# Opt-in single-call mode: one structured-output request instead of one per prompt
+INGEST_FUSED = os.getenv("INGEST_FUSED", "0") == "1"
+# Emails written per transaction by process_all_emails / the async pipeline
+INGEST_COMMIT_EVERY = int(os.getenv("INGEST_COMMIT_EVERY", "50"))
+
+CATEGORIES = ["Important", "Newsletter", "Spam", "To-Do"]
+DRAFT_CATEGORIES = ["Important", "To-Do"]
+
+logger = logging.getLogger(__name__)
+
+def email_body(email, name: str = None) -> str:
+    # The body as prompts see it: cleaned and budgeted, after the earlier messages of
+    # its thread when there are any
+    body = preprocess.prompt_body(email, name)
+    history = threads.history(email)
+    if history:
+        return f"Earlier in this thread:\n{history}\n\nLatest message:\n{body}"
+    return body
+
+def render_prompt(template, email, name: str = None) -> str:
+    # template is a prompt_templates.CompiledTemplate; name selects the body token
+    # budget (see preprocess.BODY_TOKEN_BUDGETS) and defaults to the prompt's own name
+    return template.render(
+        email_body=email_body(email, name or template.name) if "email_body" in template.variables else "",
+        subject=email.subject or "",
+        sender=email.sender or "",
+        date=str(email.timestamp or ""),
+    )
+
+def parse_category(text: str) -> str:
+    # Basic cleanup if LLM is chatty
+    for category in CATEGORIES:
+        if category in text:
+            return category
+    return "Uncategorized"
+
+def parse_action_items(text: str) -> str:
+    # Find JSON substring if wrapped in markdown, store as string
+    start = text.find('[')
+    end = text.rfind(']') + 1
+    if start != -1 and end > start:
+        return text[start:end]
+    return "[]"
+
+def prompt_instructions(template) -> str:
+    text = template.template.replace("{email_body}", "").strip()
+    if text.endswith("Email Body:"):
+        text = text[:-len("Email Body:")].strip()
+    return text
+
+def render_fused_prompt(prompts: dict, email) -> str:
+    sections = []
+    if "categorization" in prompts:
+        sections.append(f"### category\n{prompt_instructions(prompts['categorization'])}")
+    if "action_extraction" in prompts:
+        sections.append(f"### action_items\n{prompt_instructions(prompts['action_extraction'])}")
+    if "auto_reply" in prompts:
+        sections.append(
+            f"### draft\nOnly if the category is {' or '.join(DRAFT_CATEGORIES)}, otherwise null.\n"
+            f"{prompt_instructions(prompts['auto_reply'])}"
+        )
+    return (
+        "Process the email below. Complete every task and answer with ONE JSON object only, "
+        "no markdown or extra text, shaped like:\n"
+        '{"category": "<category>", "action_items": [{"task": "...", "deadline": "..."}], "draft": "<reply or null>"}\n\n'
+        + "\n\n".join(sections)
+        + f"\n\nEmail Body:\n{email_body(email, 'fused')}"
+    )
+
+def parse_fused(text: str):
+    start = text.find('{')
+    end = text.rfind('}') + 1
+    if start == -1 or end <= start:
+        return None
+    try:
+        return schemas.FusedResult(**json.loads(text[start:end]))
+    except Exception:
+        return None
+
+def fused_action_items(result) -> str:
+    return json.dumps([item.dict() for item in result.action_items])
+
+def build_draft(email, draft_body: str, prompt_version_id: int = None):
+    return models.Draft(
+        email_id=email.id,
+        subject=f"Re: {email.subject}",
+        body=draft_body,
+        status="draft",
+        prompt_version_id=prompt_version_id
+    )
+
+def load_prompts(db: Session):
+    # Snapshot of the compiled prompt templates, loaded once per ingestion run. Results
+    # record the version that produced them, so unversioned templates get one first.
+    prompt_templates.sync_versions(db)
+    return prompt_templates.load_prompts(db)
+
+def _stage(stage: str):
+    # Per-stage timing: ingest_stage_duration_seconds{stage} and the request timing log
+    return metrics.span(f"ingest.{stage}", metrics.ingest_stage_duration.labels(stage=stage))
+
+def _version_id(prompts, name: str):
+    return prompts[name].version_id if name in prompts else None
+
+def categorize(email, prompts):
+    with _stage("categorization"):
+        prompt_text = render_prompt(prompts["categorization"], email, "categorization")
+        category = llm_service.run_llm(prompt_text, cache_tag="categorization").strip()
+    email.category = parse_category(category)
+    email.category_version_id = prompts["categorization"].version_id
+
+def extract_actions(email, prompts):
+    with _stage("action_extraction"):
+        prompt_text = render_prompt(prompts["action_extraction"], email, "action_extraction")
+        actions_json_str = llm_service.run_llm(prompt_text, cache_tag="action_extraction")
+    tasks.set_action_items(email, parse_action_items(actions_json_str))
+    email.actions_version_id = prompts["action_extraction"].version_id
+
+def generate_draft(db: Session, email, prompts):
+    with _stage("auto_reply"):
+        prompt_text = render_prompt(prompts["auto_reply"], email, "auto_reply")
+        draft_body = llm_service.run_llm(prompt_text, cache_tag="auto_reply")
+    db.add(build_draft(email, draft_body, prompts["auto_reply"].version_id))
+
+def apply_prompts(db: Session, email, prompts, fused: bool = None, category: str = None, preclassify: bool = True,
+                  category_version_id: int = None, reuse_duplicates: bool = True):
+    # Runs the prompts against an already loaded email; the caller commits.
+    # category_version_id is the categorization version behind a given category
+    # (None when it came from the local pre-classifier).
+    email.duplicate_of = None
+    # 0. Local pre-classifier (obvious Spam/Newsletter never reach the LLM)
+    if category is None and preclassify:
+        with _stage("preclassify"):
+            prediction = preclassifier.preclassify(email)
+        if prediction:
+            category = prediction.category
+    if category in preclassifier.NO_LLM_CATEGORIES:
+        email.category = category
+        email.category_version_id = category_version_id
+        tasks.set_action_items(email, "[]")
+        email.actions_version_id = None
+        return email
+
+    # 0b. Near-duplicate of an already processed email: reuse its category and action items
+    if reuse_duplicates and near_duplicates.NEAR_DUP_ENABLED:
+        with _stage("near_duplicate"):
+            match = near_duplicates.find(db, email)
+        if match:
+            near_duplicates.reuse(email, match[0])
+            if email.category in DRAFT_CATEGORIES and "auto_reply" in prompts:
+                generate_draft(db, email, prompts)
+            return email
+
+    if category is None and (INGEST_FUSED if fused is None else fused):
+        with _stage("fused"):
+            result = parse_fused(llm_service.run_llm(render_fused_prompt(prompts, email), cache_tag="fused"))
+        if result:
+            email.category = result.category
+            email.category_version_id = _version_id(prompts, "categorization")
+            tasks.set_action_items(email, fused_action_items(result))
+            email.actions_version_id = _version_id(prompts, "action_extraction")
+            if result.category in DRAFT_CATEGORIES and result.draft:
+                db.add(build_draft(email, result.draft, _version_id(prompts, "auto_reply")))
+            return email
+        # Fall back to one request per prompt
+
+    # 1. Categorization (skipped when the batch categorizer already answered)
+    if category:
+        email.category = category
+        email.category_version_id = category_version_id
+    elif "categorization" in prompts:
+        categorize(email, prompts)
 
     # 2. Action Extraction
-    action_prompt = db.query(models.Prompt).filter(models.Prompt.name == "action_extraction").first()
-    if action_prompt:
-        prompt_text = action_prompt.template.replace("{email_body}", email.body)
-        actions_json_str = llm_service.run_llm(prompt_text)
-        # Try to parse JSON, store as string
-        try:
-            # Find JSON substring if wrapped in markdown
-            start = actions_json_str.find('[')
-            end = actions_json_str.rfind(']') + 1
-            if start != -1 and end != -1:
-                clean_json = actions_json_str[start:end]
-                email.action_items = clean_json
-            else:
-                email.action_items = "[]"
-        except:
-            email.action_items = "[]"
+    if "action_extraction" in prompts:
+        extract_actions(email, prompts)
 
     # 3. Draft Generation (for Important or To-Do emails)
-    if email.category in ["Important", "To-Do"]:
-        reply_prompt = db.query(models.Prompt).filter(models.Prompt.name == "auto_reply").first()
-        if reply_prompt:
-            prompt_text = reply_prompt.template.replace("{email_body}", email.body)
-            draft_body = llm_service.run_llm(prompt_text)
-            
-            # Create Draft object
-            new_draft = models.Draft(
-                email_id=email.id,
-                subject=f"Re: {email.subject}",
-                body=draft_body,
-                status="draft"
-            )
-            db.add(new_draft)
-
-    db.commit()
+    if email.category in DRAFT_CATEGORIES and "auto_reply" in prompts:
+        generate_draft(db, email, prompts)
+    return email
+
+def process_email(db: Session, email_id: int, fused: bool = None, category: str = None):
+    email = db.query(models.Email).filter(models.Email.id == email_id).first()
+    if not email:
+        return
+    apply_prompts(db, email, load_prompts(db), fused=fused, category=category)
+    threads.inherit(db, [email.thread_id])
+    with _stage("commit"):
+        db.commit()
     db.refresh(email)
     return email
 
-def process_all_emails(db: Session):
-    emails = db.query(models.Email).filter(models.Email.category == "Uncategorized").all()
+def _mark_failed(email, error):
+    # Its savepoint was rolled back: nothing of the email changed, it stays
+    # Uncategorized and the next run retries it
+    logger.error("Failed to process email %s: %s", email.id, error)
+
+def process_all_emails(db: Session, fused: bool = None, batch_size: int = None, commit_every: int = None):
+    from . import batch_categorizer
+    batch_size = batch_categorizer.INGEST_BATCH_SIZE if batch_size is None else batch_size
+    commit_every = commit_every or INGEST_COMMIT_EVERY
+
+    prompts = load_prompts(db)
+    # One email per thread: older messages wait for their thread's newest one
+    emails = (
+        db.query(models.Email)
+        .options(selectinload(models.Email.tasks), selectinload(models.Email.thread))
+        .filter(models.Email.category == "Uncategorized", threads.is_latest())
+        .all()
+    )
+    categories = {}
     for email in emails:
-        process_email(db, email.id)
-    return {"processed": len(emails)}
+        with _stage("preclassify"):
+            prediction = preclassifier.preclassify(email)
+        if prediction:
+            categories[email.id] = prediction.category
+
+    # Near-duplicates of an email earlier in this run reuse its results in the loop below,
+    # so they are left out of the batch categorization
+    followers = {}
+    if near_duplicates.NEAR_DUP_ENABLED:
+        with _stage("near_duplicate"):
+            followers = near_duplicates.cluster([email for email in emails if email.id not in categories])
+
+    batched = {}
+    if batch_size > 1 and "categorization" in prompts and not (INGEST_FUSED if fused is None else fused):
+        pending = [email for email in emails if email.id not in categories and email.id not in followers]
+        with _stage("batch_categorization"):
+            batched = batch_categorizer.categorize_emails(pending, prompts["categorization"], batch_size)
+        categories.update(batched)
+
+    # Reuse the loaded rows and write them back commit_every emails per transaction.
+    # Expiring every loaded row on each commit would make the loop quadratic.
+    expire_on_commit, db.expire_on_commit = db.expire_on_commit, False
+    failed = 0
+    try:
+        for n, email in enumerate(emails, 1):
+            try:
+                # One SAVEPOINT per email: a failed LLM call rolls back what the earlier
+                # prompts already applied (category, action item rows, duplicate_of)
+                with db.begin_nested():
+                    apply_prompts(
+                        db, email, prompts, fused=fused, category=categories.get(email.id), preclassify=False,
+                        category_version_id=_version_id(prompts, "categorization") if email.id in batched else None,
+                    )
+            except llm_service.LLMError as e:
+                _mark_failed(email, e)
+                failed += 1
+            if n % commit_every == 0:
+                with _stage("commit"):
+                    db.commit()
+        threads.inherit(db, [email.thread_id for email in emails])
+        with _stage("commit"):
+            db.commit()
+    finally:
+        db.expire_on_commit = expire_on_commit
+    reused = sum(1 for email in emails if email.duplicate_of is not None)
+    return {"processed": len(emails) - failed, "failed": failed, "near_duplicates": reused}
+
+def _stale(column, current_id):
+    # Results produced by an older prompt version. NULL means no prompt was involved
+    # (pre-classified, hand-written or predating versioning) and is never stale.
+    if current_id is None:
+        return false()
+    return and_(column.isnot(None), column != current_id)
+
+def _stale_filters(prompts):
+    draft_ids = select(models.Draft.email_id).where(
+        models.Draft.status == "draft", _stale(models.Draft.prompt_version_id, _version_id(prompts, "auto_reply"))
+    )
+    return (
+        _stale(models.Email.category_version_id, _version_id(prompts, "categorization")),
+        _stale(models.Email.actions_version_id, _version_id(prompts, "action_extraction")),
+        models.Email.id.in_(draft_ids),
+    )
+
+def stale_counts(db: Session, prompts=None) -> dict:
+    # Read-only, for GET /ingest/stale: a template not versioned yet counts nothing stale
+    prompts = prompt_templates.load_prompts(db) if prompts is None else prompts
+    categories, actions, drafts = _stale_filters(prompts)
+    return {
+        "categorization": db.query(models.Email).filter(categories).count(),
+        "action_extraction": db.query(models.Email).filter(actions).count(),
+        "auto_reply": db.query(models.Draft).filter(
+            models.Draft.status == "draft", _stale(models.Draft.prompt_version_id, _version_id(prompts, "auto_reply"))
+        ).count(),
+        "emails": db.query(models.Email).filter(or_(categories, actions, drafts)).count(),
+    }
+
+def reprocess_stale(db: Session, commit_every: int = None, progress=None) -> dict:
+    # Re-runs only the prompts whose version changed since an email was processed:
+    # a new categorization version re-runs everything for the email, otherwise just
+    # the action extraction and/or the unsent generated drafts are redone.
+    commit_every = commit_every or INGEST_COMMIT_EVERY
+    prompts = load_prompts(db)
+    categories, actions, drafts = _stale_filters(prompts)
+    ids = [email_id for (email_id,) in db.query(models.Email.id).filter(or_(categories, actions, drafts)).order_by(models.Email.id)]
+    versions = {name: _version_id(prompts, name) for name in ("categorization", "action_extraction", "auto_reply")}
+    stats = {"processed": 0, "failed": 0, "categorization": 0, "action_extraction": 0, "auto_reply": 0}
+
+    for start in range(0, len(ids), commit_every):
+        chunk = ids[start:start + commit_every]
+        emails = (
+            db.query(models.Email)
+            .options(selectinload(models.Email.tasks), selectinload(models.Email.thread))
+            .filter(models.Email.id.in_(chunk))
+            .order_by(models.Email.id)
+            .all()
+        )
+        generated = {}
+        for draft in db.query(models.Draft).filter(
+            models.Draft.email_id.in_(chunk), models.Draft.status == "draft", models.Draft.prompt_version_id.isnot(None)
+        ):
+            generated.setdefault(draft.email_id, []).append(draft)
+
+        for email in emails:
+            # Each email runs in a SAVEPOINT: one that fails part way (e.g. the draft call
+            # after a new category was applied) is rolled back whole, keeps its stale
+            # results and old drafts, and is picked up again next run
+            email_drafts = generated.get(email.id, [])
+            redone = []
+            try:
+                with db.begin_nested():
+                    if email.category_version_id is not None and email.category_version_id != versions["categorization"]:
+                        apply_prompts(db, email, prompts, fused=False, preclassify=False, reuse_duplicates=False)
+                        for draft in email_drafts:
+                            db.delete(draft)
+                        redone.append("categorization")
+                    else:
+                        if email.actions_version_id is not None and email.actions_version_id != versions["action_extraction"]:
+                            extract_actions(email, prompts)
+                            redone.append("action_extraction")
+                        stale = [draft for draft in email_drafts if draft.prompt_version_id != versions["auto_reply"]]
+                        if stale and versions["auto_reply"] is not None:
+                            if email.category in DRAFT_CATEGORIES:
+                                generate_draft(db, email, prompts)
+                            for draft in stale:
+                                db.delete(draft)
+                            redone.append("auto_reply")
+                for name in redone:
+                    stats[name] += 1
+                stats["processed"] += 1
+            except llm_service.LLMError as e:
+                logger.error("Failed to reprocess email %s: %s", email.id, e)
+                stats["failed"] += 1
+        db.commit()
+        if progress:
+            progress(stats)
+    return stats
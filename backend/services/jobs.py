@@ -0,0 +1,297 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import or_, select
+from sqlalchemy.orm import Session, selectinload
+from .. import models, database
+from . import async_ingestion, ingestion_service, metrics, threads, vector_index
+
+# Ingestion runs as persisted jobs on an in-process worker pool. Each job repeatedly
+# claims a batch of Uncategorized emails (the newest of each thread) by stamping a lease on them in a single
+# conditional UPDATE, processes the batch and releases the lease. Two jobs (or two
+# processes) therefore never work on the same email, and a crashed worker's leases
+# simply expire. A job itself is claimed the same way: the process running it records
+# itself as the job's owner and heartbeats every JOB_HEARTBEAT_SECONDS (extending its
+# emails' leases), and a queued/running job is only taken over, at startup or by the
+# watcher thread, once no live process owns it. Reprocess jobs instead re-run the
+# prompts whose version changed (see ingestion_service.reprocess_stale); they are
+# idempotent, so resuming one is safe.
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_CLAIM_BATCH = int(os.getenv("JOB_CLAIM_BATCH", "50"))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "600"))
+JOB_HEARTBEAT_SECONDS = int(os.getenv("JOB_HEARTBEAT_SECONDS", "30"))
+# An owner that missed this many seconds of heartbeats is presumed dead
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", str(3 * JOB_HEARTBEAT_SECONDS)))
+
+# Job.owner of the jobs this process runs
+PROCESS_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+# Job ids submitted to the pool that haven't started running yet
+_waiting = set()
+_watcher = None
+_watcher_lock = threading.Lock()
+
+metrics.register(metrics.Gauge("ingest_jobs_waiting", "Jobs queued for a free worker", lambda: len(_waiting)))
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="ingest-job")
+        _start_watcher()
+    return _executor
+
+
+def _lease_prefix(job_id: int) -> str:
+    return f"job:{job_id}:"
+
+
+def _lease_available(now: datetime):
+    return or_(models.Email.lease_owner.is_(None), models.Email.lease_expires_at < now)
+
+
+def claim_emails(db: Session, owner: str, limit: int):
+    now = datetime.utcnow()
+    candidates = (
+        select(models.Email.id)
+        .where(models.Email.category == "Uncategorized", threads.is_latest(), _lease_available(now))
+        .order_by(models.Email.id)
+        .limit(limit)
+    )
+    # The lease condition is re-checked by the UPDATE itself, so a row claimed
+    # concurrently by someone else is skipped rather than stolen
+    db.query(models.Email).filter(models.Email.id.in_(candidates), _lease_available(now)).update(
+        {models.Email.lease_owner: owner, models.Email.lease_expires_at: now + timedelta(seconds=JOB_LEASE_SECONDS)},
+        synchronize_session=False,
+    )
+    db.commit()
+    return (
+        db.query(models.Email)
+        .options(selectinload(models.Email.tasks), selectinload(models.Email.thread))
+        .filter(models.Email.lease_owner == owner)
+        .order_by(models.Email.id)
+        .all()
+    )
+
+
+def release_emails(db: Session, owner: str, keep_failed: bool = True):
+    # Failed emails keep their lease until it expires so this job doesn't spin on them
+    query = db.query(models.Email).filter(models.Email.lease_owner == owner)
+    if keep_failed:
+        query = query.filter(models.Email.category != "Uncategorized")
+    query.update({models.Email.lease_owner: None, models.Email.lease_expires_at: None}, synchronize_session=False)
+    db.commit()
+
+
+def _owner_gone(now: datetime):
+    # SQL condition: no live process owns the job
+    return or_(
+        models.Job.owner.is_(None),
+        models.Job.heartbeat_at.is_(None),
+        models.Job.heartbeat_at < now - timedelta(seconds=JOB_STALE_SECONDS),
+    )
+
+
+def claim_job(db: Session, job_id: int) -> bool:
+    # Makes this process the job's owner unless a live process already is. A dead
+    # owner's email leases are released so the new run can claim those emails.
+    now = datetime.utcnow()
+    previous = db.query(models.Job.owner).filter(models.Job.id == job_id).scalar()
+    claimed = db.query(models.Job).filter(
+        models.Job.id == job_id, models.Job.status.in_(["queued", "running"]), _owner_gone(now)
+    ).update(
+        {models.Job.owner: PROCESS_ID, models.Job.heartbeat_at: now, models.Job.status: "running"},
+        synchronize_session=False,
+    )
+    if claimed and previous:
+        db.query(models.Email).filter(models.Email.lease_owner.like(f"{_lease_prefix(job_id)}%")).update(
+            {models.Email.lease_owner: None, models.Email.lease_expires_at: None}, synchronize_session=False
+        )
+    db.commit()
+    return bool(claimed)
+
+
+def heartbeat(db: Session, job_id: int):
+    now = datetime.utcnow()
+    db.query(models.Job).filter(models.Job.id == job_id, models.Job.owner == PROCESS_ID).update(
+        {models.Job.heartbeat_at: now}, synchronize_session=False
+    )
+    # A batch may take longer than the lease; keep it while this process is alive
+    db.query(models.Email).filter(models.Email.lease_owner.like(f"{_lease_prefix(job_id)}%")).update(
+        {models.Email.lease_expires_at: now + timedelta(seconds=JOB_LEASE_SECONDS)}, synchronize_session=False
+    )
+    db.commit()
+
+
+def _heartbeat_loop(job_id: int, stop: threading.Event):
+    while not stop.wait(JOB_HEARTBEAT_SECONDS):
+        db = database.SessionLocal()
+        try:
+            heartbeat(db, job_id)
+        except Exception:
+            logger.exception("Heartbeat of job %s failed", job_id)
+        finally:
+            db.close()
+
+
+def _submit(job_id: int):
+    _waiting.add(job_id)
+    get_executor().submit(run_job, job_id)
+
+
+def submit_ingest_job(db: Session, **params) -> models.Job:
+    job = models.Job(kind="ingest", status="queued", params=json.dumps(params))
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    _submit(job.id)
+    return job
+
+
+def submit_reprocess_job(db: Session) -> models.Job:
+    job = models.Job(kind="reprocess", status="queued", params="{}")
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    _submit(job.id)
+    return job
+
+
+def _run_ingest(db: Session, job: models.Job, params: dict):
+    # One event loop for the whole job: the async LLM clients are bound to the loop
+    # they were created on
+    async def run():
+        while True:
+            owner = f"{_lease_prefix(job.id)}{uuid.uuid4().hex[:12]}"
+            emails = claim_emails(db, owner, JOB_CLAIM_BATCH)
+            if not emails:
+                break
+            stats = await async_ingestion.process_all_emails_async(db, emails=emails, **params)
+            release_emails(db, owner)
+            job.processed += stats["processed"]
+            job.failed += stats["failed"]
+            db.commit()
+
+    asyncio.run(run())
+
+
+def _run_reprocess(db: Session, job: models.Job, params: dict):
+    def progress(stats):
+        job.processed = stats["processed"]
+        job.failed = stats["failed"]
+        db.commit()
+    ingestion_service.reprocess_stale(db, commit_every=JOB_CLAIM_BATCH, progress=progress)
+
+
+RUNNERS = {"ingest": _run_ingest, "reprocess": _run_reprocess}
+
+
+def run_job(job_id: int):
+    _waiting.discard(job_id)
+    db = database.SessionLocal()
+    stop = threading.Event()
+    try:
+        if not claim_job(db, job_id):
+            # Finished, or running in another live process
+            return
+        job = db.query(models.Job).filter(models.Job.id == job_id).first()
+        params = json.loads(job.params or "{}")
+        job.started_at = job.started_at or datetime.utcnow()
+        db.commit()
+        threading.Thread(target=_heartbeat_loop, args=(job_id, stop), daemon=True, name=f"job-{job_id}-heartbeat").start()
+
+        RUNNERS[job.kind](db, job, params)
+
+        job.status = "completed"
+        job.finished_at = datetime.utcnow()
+        db.commit()
+        # Keep /chat retrieval current with mail that arrived since the last sync
+        vector_index.sync_in_background()
+    except Exception as e:
+        logger.exception("Job %s failed", job_id)
+        db.rollback()
+        job = db.query(models.Job).filter(models.Job.id == job_id).first()
+        if job:
+            job.status = "failed"
+            job.error = str(e)
+            job.finished_at = datetime.utcnow()
+            db.commit()
+    finally:
+        stop.set()
+        db.close()
+
+
+def orphaned_jobs(db: Session) -> list:
+    # Ids of queued/running jobs that no live process owns
+    rows = (
+        db.query(models.Job.id)
+        .filter(models.Job.status.in_(["queued", "running"]), _owner_gone(datetime.utcnow()))
+        .order_by(models.Job.id)
+        .all()
+    )
+    return [job_id for (job_id,) in rows]
+
+
+def resume_jobs() -> int:
+    # Called on startup, then periodically by the watcher: submits the jobs no live
+    # process owns (interrupted by a restart or a replica that died). run_job claims
+    # each one atomically, so a job submitted by two processes still runs once.
+    db = database.SessionLocal()
+    try:
+        job_ids = [job_id for job_id in orphaned_jobs(db) if job_id not in _waiting]
+    finally:
+        db.close()
+    for job_id in job_ids:
+        _submit(job_id)
+    return len(job_ids)
+
+
+def _watch():
+    while True:
+        time.sleep(JOB_HEARTBEAT_SECONDS)
+        try:
+            resume_jobs()
+        except Exception:
+            logger.exception("Resuming orphaned jobs failed")
+
+
+def _start_watcher():
+    global _watcher
+    with _watcher_lock:
+        if _watcher is None:
+            _watcher = threading.Thread(target=_watch, daemon=True, name="job-watcher")
+            _watcher.start()
+
+
+def job_status(db: Session, job: models.Job) -> dict:
+    if job.kind == "reprocess":
+        remaining = ingestion_service.stale_counts(db)["emails"]
+    else:
+        remaining = db.query(models.Email).filter(models.Email.category == "Uncategorized", threads.is_latest()).count()
+    elapsed = None
+    if job.started_at:
+        elapsed = ((job.finished_at or datetime.utcnow()) - job.started_at).total_seconds()
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "processed": job.processed,
+        "failed": job.failed,
+        "remaining": remaining,
+        "emails_per_second": round(job.processed / elapsed, 2) if elapsed else None,
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
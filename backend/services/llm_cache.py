@@ -0,0 +1,191 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from . import metrics
+
+# Content-addressed cache of LLM responses: an in-memory LRU in front of a SQLite file.
+# Keys hash (provider, model, rendered prompt), so an edited template never hits stale
+# entries; entries are also tagged with the prompt name so they can be dropped eagerly.
+# Recency (last_used, which picks the rows evicted past the size cap) is recorded in
+# memory on every hit and written in batches, so cache reads don't turn into writes.
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE", "1") != "0"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "./llm_cache.db")
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "50000"))
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "2000"))
+# Write pending last_used updates once this many keys were hit, or this many seconds
+# after the previous write
+LLM_CACHE_TOUCH_BATCH = int(os.getenv("LLM_CACHE_TOUCH_BATCH", "256"))
+LLM_CACHE_TOUCH_INTERVAL = float(os.getenv("LLM_CACHE_TOUCH_INTERVAL", "30"))
+
+
+def make_key(provider: str, model: str, prompt_text: str) -> str:
+    digest = hashlib.sha256()
+    for part in (provider or "", model or "", prompt_text):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class LLMCache:
+    def __init__(self, path: str = LLM_CACHE_PATH, ttl: float = LLM_CACHE_TTL,
+                 max_entries: int = LLM_CACHE_MAX_ENTRIES, memory_entries: int = LLM_CACHE_MEMORY_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()  # key -> (response, tag, created_at)
+        self._touched = {}  # key -> last use not yet written to last_used
+        self._touched_written = time.monotonic()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, tag TEXT, response TEXT, created_at REAL, last_used REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_cache_tag ON llm_cache (tag)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_cache_last_used ON llm_cache (last_used)")
+        self._conn.commit()
+        self._disk_entries = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl > 0 and now - created_at > self.ttl
+
+    def _remember(self, key, response, tag, created_at):
+        self._memory[key] = (response, tag, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _touch(self, key: str, now: float):
+        # Caller holds _lock
+        self._touched[key] = now
+        if len(self._touched) >= LLM_CACHE_TOUCH_BATCH or time.monotonic() - self._touched_written >= LLM_CACHE_TOUCH_INTERVAL:
+            self._write_touches()
+            self._conn.commit()
+
+    def _write_touches(self):
+        # Caller holds _lock and commits
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE llm_cache SET last_used = ? WHERE key = ?", [(used, key) for key, used in self._touched.items()]
+            )
+            self._touched.clear()
+        self._touched_written = time.monotonic()
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._expired(entry[2], now):
+                    self._memory.move_to_end(key)
+                    self._touch(key, now)
+                    self.memory_hits += 1
+                    return entry[0]
+                del self._memory[key]
+
+            row = self._conn.execute(
+                "SELECT response, tag, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            response, tag, created_at = row
+            if self._expired(created_at, now):
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                self._touched.pop(key, None)
+                self._disk_entries -= 1
+                self.misses += 1
+                return None
+            self._touch(key, now)
+            self._remember(key, response, tag, created_at)
+            self.disk_hits += 1
+            return response
+
+    def set(self, key: str, response: str, tag: str = None):
+        now = time.time()
+        with self._lock:
+            self._remember(key, response, tag, now)
+            self._touched.pop(key, None)
+            exists = self._conn.execute("SELECT 1 FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, tag, response, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, tag, response, now, now),
+            )
+            if not exists:
+                self._disk_entries += 1
+            if self._disk_entries > self.max_entries:
+                # Evict least recently used rows down to the size cap
+                self._write_touches()
+                overflow = self._disk_entries - self.max_entries
+                self._conn.execute(
+                    "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY last_used LIMIT ?)",
+                    (overflow,),
+                )
+                self._disk_entries -= overflow
+            self._conn.commit()
+
+    def invalidate_tag(self, tag: str) -> int:
+        with self._lock:
+            for key in [k for k, entry in self._memory.items() if entry[1] == tag]:
+                del self._memory[key]
+            removed = self._conn.execute("DELETE FROM llm_cache WHERE tag = ?", (tag,)).rowcount
+            self._conn.commit()
+            self._disk_entries -= removed
+            return removed
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._touched.clear()
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+            self._disk_entries = 0
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "disk_entries": self._disk_entries,
+        }
+
+
+_llm_cache = None
+
+
+def get_llm_cache():
+    global _llm_cache
+    if not LLM_CACHE_ENABLED:
+        return None
+    if _llm_cache is None:
+        _llm_cache = LLMCache()
+    return _llm_cache
+
+
+def _cache_lookups():
+    cache = _llm_cache if LLM_CACHE_ENABLED else None
+    if cache is None:
+        return None
+    return {"memory_hit": cache.memory_hits, "disk_hit": cache.disk_hits, "miss": cache.misses}
+
+
+def _cache_hit_ratio():
+    cache = _llm_cache if LLM_CACHE_ENABLED else None
+    return cache.stats()["hit_rate"] if cache is not None else None
+
+
+metrics.register(metrics.Gauge("llm_cache_lookups_total", "LLM cache lookups by result", _cache_lookups, "result", "counter"))
+metrics.register(metrics.Gauge("llm_cache_hit_ratio", "LLM cache hits / lookups since start", _cache_hit_ratio))
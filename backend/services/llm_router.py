@@ -0,0 +1,606 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout, as_completed
+from . import fake_llm, metrics, rate_limiter
+from .metrics import Histogram
+
+# Routes LLM requests across providers. Every provider keeps one persistent client and
+# a rolling window of latencies and outcomes; requests go to the fastest healthy
+# provider (p50 weighted by error rate) and fail over down the list. Repeated failures
+# trip a per-provider circuit breaker, and with LLM_HEDGE_AFTER_MS a request that is
+# still pending after the delay is raced against the next provider.
+
+LLM_ROUTER_PROVIDERS = [p.strip() for p in os.getenv("LLM_ROUTER_PROVIDERS", "groq,gemini").split(",") if p.strip()]
+LLM_ROUTER_WINDOW = int(os.getenv("LLM_ROUTER_WINDOW", "200"))
+LLM_ROUTER_MIN_SAMPLES = int(os.getenv("LLM_ROUTER_MIN_SAMPLES", "5"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+# 0 disables hedging; "p95" hedges once the primary is slower than its own p95
+LLM_HEDGE_AFTER_MS = os.getenv("LLM_HEDGE_AFTER_MS", "0")
+
+Completion = namedtuple("Completion", ["text", "provider", "model"])
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderUnavailable(Exception):
+    pass
+
+
+class Provider:
+    name = None
+
+    def __init__(self, model: str):
+        self.model = model
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._aclients = weakref.WeakKeyDictionary()
+
+    @property
+    def configured(self) -> bool:
+        return True
+
+    def client(self):
+        # Created once and reused, so connections are kept alive between requests
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = self.create_client()
+        return self._client
+
+    def create_client(self):
+        return None
+
+    def aclient(self):
+        # One async client per event loop: their connections belong to the loop that
+        # opened them, and every ingest job runs its own loop
+        loop = asyncio.get_running_loop()
+        client = self._aclients.get(loop)
+        if client is None:
+            client = self._aclients[loop] = self.create_aclient()
+        return client
+
+    def create_aclient(self):
+        return None
+
+    def complete(self, prompt: str) -> str:
+        raise NotImplementedError
+
+    async def acomplete(self, prompt: str) -> str:
+        # Providers without an async client: keep the blocking SDK off the event loop
+        return await asyncio.to_thread(self.complete, prompt)
+
+    def stream(self, prompt: str):
+        yield self.complete(prompt)
+
+    async def astream(self, prompt: str):
+        chunks = iter(self.stream(prompt))
+        done = object()
+        while True:
+            chunk = await asyncio.to_thread(next, chunks, done)
+            if chunk is done:
+                return
+            yield chunk
+
+
+class GroqProvider(Provider):
+    name = "groq"
+
+    def __init__(self, model: str = "llama-3.1-8b-instant", api_key: str = None):
+        super().__init__(model)
+        self.api_key = api_key or os.getenv("GROQ_API_KEY")
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.api_key)
+
+    def create_client(self):
+        from groq import Groq
+        return Groq(api_key=self.api_key)
+
+    def create_aclient(self):
+        from groq import AsyncGroq
+        return AsyncGroq(api_key=self.api_key)
+
+    def complete(self, prompt: str) -> str:
+        chat_completion = self.client().chat.completions.create(
+            messages=[{"role": "user", "content": prompt}],
+            model=self.model,
+        )
+        return chat_completion.choices[0].message.content
+
+    def stream(self, prompt: str):
+        stream = self.client().chat.completions.create(
+            messages=[{"role": "user", "content": prompt}],
+            model=self.model,
+            stream=True,
+        )
+        for chunk in stream:
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+
+    async def acomplete(self, prompt: str) -> str:
+        chat_completion = await self.aclient().chat.completions.create(
+            messages=[{"role": "user", "content": prompt}],
+            model=self.model,
+        )
+        return chat_completion.choices[0].message.content
+
+    async def astream(self, prompt: str):
+        stream = await self.aclient().chat.completions.create(
+            messages=[{"role": "user", "content": prompt}],
+            model=self.model,
+            stream=True,
+        )
+        async for chunk in stream:
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+
+
+class GeminiProvider(Provider):
+    name = "gemini"
+
+    def __init__(self, model: str = "gemini-pro", api_key: str = None):
+        super().__init__(model)
+        self.api_key = api_key or os.getenv("GEMINI_API_KEY")
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.api_key)
+
+    def create_client(self):
+        import google.generativeai as genai
+        genai.configure(api_key=self.api_key)
+        return genai.GenerativeModel(self.model)
+
+    def complete(self, prompt: str) -> str:
+        return self.client().generate_content(prompt).text
+
+    def stream(self, prompt: str):
+        for chunk in self.client().generate_content(prompt, stream=True):
+            if chunk.text:
+                yield chunk.text
+
+    async def acomplete(self, prompt: str) -> str:
+        return (await self.client().generate_content_async(prompt)).text
+
+    async def astream(self, prompt: str):
+        async for chunk in await self.client().generate_content_async(prompt, stream=True):
+            if chunk.text:
+                yield chunk.text
+
+
+class OpenAIProvider(Provider):
+    # Any OpenAI-compatible chat completions endpoint (vLLM, Ollama, a proxy, or the
+    # fake server in backend/benchmarks/fake_llm_server.py), enabled by OPENAI_BASE_URL
+    name = "openai"
+
+    def __init__(self, model: str = None, base_url: str = None, api_key: str = None):
+        super().__init__(model or os.getenv("OPENAI_MODEL", "gpt-4o-mini"))
+        self.base_url = (base_url or os.getenv("OPENAI_BASE_URL") or "").rstrip("/")
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        self.timeout = float(os.getenv("OPENAI_TIMEOUT", "60"))
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.base_url)
+
+    def _headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+
+    def create_client(self):
+        import httpx
+        return httpx.Client(base_url=self.base_url, headers=self._headers(), timeout=self.timeout)
+
+    def create_aclient(self):
+        import httpx
+        return httpx.AsyncClient(base_url=self.base_url, headers=self._headers(), timeout=self.timeout)
+
+    def _request(self, prompt: str, stream: bool = False) -> dict:
+        return {"model": self.model, "messages": [{"role": "user", "content": prompt}], "stream": stream}
+
+    def complete(self, prompt: str) -> str:
+        response = self.client().post("/chat/completions", json=self._request(prompt))
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+
+    def stream(self, prompt: str):
+        with self.client().stream("POST", "/chat/completions", json=self._request(prompt, stream=True)) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    return
+                delta = json.loads(data)["choices"][0]["delta"].get("content")
+                if delta:
+                    yield delta
+
+    async def acomplete(self, prompt: str) -> str:
+        response = await self.aclient().post("/chat/completions", json=self._request(prompt))
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+
+    async def astream(self, prompt: str):
+        async with self.aclient().stream("POST", "/chat/completions", json=self._request(prompt, stream=True)) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    return
+                delta = json.loads(data)["choices"][0]["delta"].get("content")
+                if delta:
+                    yield delta
+
+
+class FakeProvider(Provider):
+    # Local stand-in for tests and benchmarks. Without an explicit FakeLLM it uses the
+    # shared one from fake_llm.get_fake_llm() (so set_fake_llm() still applies).
+    def __init__(self, name: str = "fake", llm: fake_llm.FakeLLM = None, model: str = "fake"):
+        super().__init__(model)
+        self.name = name
+        self.llm = llm
+
+    def _llm(self) -> fake_llm.FakeLLM:
+        return self.llm or fake_llm.get_fake_llm()
+
+    def complete(self, prompt: str) -> str:
+        return self._llm().complete(prompt)
+
+    async def acomplete(self, prompt: str) -> str:
+        return await self._llm().acomplete(prompt)
+
+    def stream(self, prompt: str):
+        yield from self._llm().stream(prompt)
+
+    async def astream(self, prompt: str):
+        async for chunk in self._llm().astream(prompt):
+            yield chunk
+
+
+class CircuitBreaker:
+    # closed -> open after `failures` consecutive errors; after `cooldown` seconds one
+    # trial request is let through (half-open) and its outcome closes or re-opens it
+    def __init__(self, failures: int = LLM_BREAKER_FAILURES, cooldown: float = LLM_BREAKER_COOLDOWN):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trips = 0
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.cooldown else "open"
+
+    def available(self) -> bool:
+        state = self.state
+        return state == "closed" or (state == "half_open" and not self._trial)
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record(self, ok: bool = None):
+        # ok=None: the request was abandoned (hedge loser, closed stream), no verdict
+        with self._lock:
+            self._trial = False
+            if ok is None:
+                return
+            if ok:
+                self.consecutive_failures = 0
+                self.opened_at = None
+                return
+            self.consecutive_failures += 1
+            state = self.state
+            if state == "half_open" or (state == "closed" and self.consecutive_failures >= self.failures):
+                self.trips += 1
+                self.opened_at = time.monotonic()
+
+
+class ProviderStats:
+    def __init__(self, name: str, window: int = LLM_ROUTER_WINDOW):
+        self.latency = Histogram(f"llm_{name}_latency_seconds", f"{name} completion latency", window=window)
+        self.outcomes = deque(maxlen=window)
+        self.requests = 0
+        self.errors = 0
+
+    def record(self, ok: bool, seconds: float):
+        self.requests += 1
+        self.outcomes.append(ok)
+        if ok:
+            self.latency.observe(seconds)
+        else:
+            self.errors += 1
+
+    def error_rate(self) -> float:
+        return 1 - sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+
+class Router:
+    def __init__(self, providers, default=None, hedge_after_ms=LLM_HEDGE_AFTER_MS,
+                 min_samples: int = LLM_ROUTER_MIN_SAMPLES, breaker_failures: int = LLM_BREAKER_FAILURES,
+                 breaker_cooldown: float = LLM_BREAKER_COOLDOWN):
+        self.providers = {p.name: p for p in providers}
+        # Providers eligible when a request isn't pinned to one, in preference order
+        self.default = list(default) if default is not None else [p.name for p in providers if p.configured]
+        self.hedge_after_ms = str(hedge_after_ms)
+        self.min_samples = min_samples
+        self.breakers = {name: CircuitBreaker(breaker_failures, breaker_cooldown) for name in self.providers}
+        self.stats = {name: ProviderStats(name) for name in self.providers}
+        self.hedged = 0
+        self.hedge_wins = 0
+        self._executor = None
+
+    def _score(self, name: str) -> float:
+        stats = self.stats[name]
+        if stats.latency.count < self.min_samples:
+            # Unmeasured providers are tried first (in preference order) to get samples
+            return 0.0
+        return stats.latency.percentile(0.5) * (1 + 10 * stats.error_rate())
+
+    def candidates(self, providers=None):
+        names = [providers] if isinstance(providers, str) else (providers or self.default)
+        unknown = [name for name in names if name not in self.providers]
+        if unknown:
+            raise ProviderUnavailable(f"Unknown LLM provider: {', '.join(unknown)}")
+        healthy = [name for name in names if self.breakers[name].available()]
+        # sorted() is stable, so ties keep the configured preference order
+        return sorted(healthy, key=self._score)
+
+    def _hedge_delay(self, name: str):
+        if self.hedge_after_ms in ("", "0"):
+            return None
+        if self.hedge_after_ms == "p95":
+            p95 = self.stats[name].latency.percentile(0.95)
+            return p95 if p95 is not None else 1.0
+        return float(self.hedge_after_ms) / 1000
+
+    def _start(self, name: str):
+        if not self.breakers[name].allow():
+            raise ProviderUnavailable(f"{name} circuit breaker is open")
+        return time.perf_counter()
+
+    def _finish(self, name: str, started: float, ok: bool = None, prompt_chars: int = 0, completion_chars: int = 0):
+        elapsed = time.perf_counter() - started
+        if ok is not None:
+            self.stats[name].record(ok, elapsed)
+        self.breakers[name].record(ok)
+        # Exported metrics; tokens are estimated at ~4 chars/token
+        model = self.providers[name].model
+        outcome = "cancelled" if ok is None else "ok" if ok else "error"
+        metrics.llm_requests.inc(provider=name, model=model, outcome=outcome)
+        if ok:
+            metrics.llm_request_duration.labels(provider=name, model=model).observe(elapsed)
+        metrics.llm_tokens.inc(prompt_chars // 4, provider=name, model=model, direction="prompt")
+        metrics.llm_tokens.inc(completion_chars // 4, provider=name, model=model, direction="completion")
+        metrics.record_span(f"llm.{name}", elapsed, outcome=outcome)
+
+    def _tokens(self, prompt: str) -> int:
+        # Estimated prompt tokens (~4 chars each) for the provider's tokens/min limit
+        return max(1, len(prompt) // 4)
+
+    def _attempt(self, name: str, prompt: str) -> Completion:
+        provider = self.providers[name]
+        # The limits of the provider this request goes to, however it was picked;
+        # waiting for them is not part of the measured latency
+        rate_limiter.get_rate_limiter(name).acquire_blocking(self._tokens(prompt))
+        started, ok, text = self._start(name), None, ""
+        try:
+            text = provider.complete(prompt)
+            ok = True
+        except Exception:
+            ok = False
+            raise
+        finally:
+            self._finish(name, started, ok, len(prompt), len(text or ""))
+        return Completion(text, name, provider.model)
+
+    async def _aattempt(self, name: str, prompt: str) -> Completion:
+        provider = self.providers[name]
+        await rate_limiter.get_rate_limiter(name).acquire(self._tokens(prompt))
+        started, ok, text = self._start(name), None, ""
+        try:
+            text = await provider.acomplete(prompt)
+            ok = True
+        except Exception:
+            ok = False
+            raise
+        finally:
+            # Cancelled hedge losers land here with ok=None
+            self._finish(name, started, ok, len(prompt), len(text or ""))
+        return Completion(text, name, provider.model)
+
+    def _failover(self, prompt: str, names, error: Exception = None) -> Completion:
+        for name in names:
+            try:
+                return self._attempt(name, prompt)
+            except Exception as e:
+                logger.warning("LLM provider %s failed: %s", name, e)
+                error = e
+        raise error or ProviderUnavailable("No healthy LLM provider")
+
+    async def _afailover(self, prompt: str, names, error: Exception = None) -> Completion:
+        for name in names:
+            try:
+                return await self._aattempt(name, prompt)
+            except Exception as e:
+                logger.warning("LLM provider %s failed: %s", name, e)
+                error = e
+        raise error or ProviderUnavailable("No healthy LLM provider")
+
+    def complete(self, prompt: str, providers=None) -> Completion:
+        names = self.candidates(providers)
+        delay = self._hedge_delay(names[0]) if len(names) > 1 else None
+        if delay is None:
+            return self._failover(prompt, names)
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm-hedge")
+        first = self._executor.submit(self._attempt, names[0], prompt)
+        try:
+            return first.result(timeout=delay)
+        except FutureTimeout:
+            pass
+        except Exception as e:
+            return self._failover(prompt, names[1:], e)
+        # Still pending: race the next provider, first success wins
+        self.hedged += 1
+        second = self._executor.submit(self._failover, prompt, names[1:])
+        error = None
+        for future in as_completed([first, second]):
+            try:
+                result = future.result()
+            except Exception as e:
+                error = e
+                continue
+            if future is second:
+                self.hedge_wins += 1
+            return result
+        raise error
+
+    async def acomplete(self, prompt: str, providers=None) -> Completion:
+        names = self.candidates(providers)
+        delay = self._hedge_delay(names[0]) if len(names) > 1 else None
+        if delay is None:
+            return await self._afailover(prompt, names)
+
+        first = asyncio.ensure_future(self._aattempt(names[0], prompt))
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            try:
+                return first.result()
+            except Exception as e:
+                return await self._afailover(prompt, names[1:], e)
+        self.hedged += 1
+        second = asyncio.ensure_future(self._afailover(prompt, names[1:]))
+        pending, error = {first, second}, None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for loser in pending:
+                        loser.cancel()
+                    if future is second:
+                        self.hedge_wins += 1
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def stream(self, prompt: str, providers=None):
+        # Fails over only until the first chunk has been sent; no hedging
+        error = None
+        for name in self.candidates(providers):
+            rate_limiter.get_rate_limiter(name).acquire_blocking(self._tokens(prompt))
+            try:
+                started = self._start(name)
+            except ProviderUnavailable as e:
+                error = e
+                continue
+            sent, ok, chars = False, None, 0
+            try:
+                for chunk in self.providers[name].stream(prompt):
+                    sent = True
+                    chars += len(chunk)
+                    yield chunk
+                ok = True
+            except Exception as e:
+                ok = False
+                if sent:
+                    raise
+                logger.warning("LLM provider %s failed: %s", name, e)
+                error = e
+                continue
+            finally:
+                # ok=None when the consumer stopped reading (GeneratorExit)
+                self._finish(name, started, ok, len(prompt), chars)
+            return
+        raise error or ProviderUnavailable("No healthy LLM provider")
+
+    async def astream(self, prompt: str, providers=None):
+        # stream() for the event loop
+        error = None
+        for name in self.candidates(providers):
+            await rate_limiter.get_rate_limiter(name).acquire(self._tokens(prompt))
+            try:
+                started = self._start(name)
+            except ProviderUnavailable as e:
+                error = e
+                continue
+            sent, ok, chars = False, None, 0
+            try:
+                async for chunk in self.providers[name].astream(prompt):
+                    sent = True
+                    chars += len(chunk)
+                    yield chunk
+                ok = True
+            except Exception as e:
+                ok = False
+                if sent:
+                    raise
+                logger.warning("LLM provider %s failed: %s", name, e)
+                error = e
+                continue
+            finally:
+                self._finish(name, started, ok, len(prompt), chars)
+            return
+        raise error or ProviderUnavailable("No healthy LLM provider")
+
+    def snapshot(self) -> dict:
+        return {
+            "default": self.default,
+            "order": self.candidates(),
+            "hedge_after_ms": self.hedge_after_ms,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "providers": {
+                name: {
+                    "model": provider.model,
+                    "configured": provider.configured,
+                    "state": self.breakers[name].state,
+                    "trips": self.breakers[name].trips,
+                    "requests": self.stats[name].requests,
+                    "errors": self.stats[name].errors,
+                    "error_rate": round(self.stats[name].error_rate(), 4),
+                    "latency": self.stats[name].latency.snapshot(),
+                }
+                for name, provider in self.providers.items()
+            },
+        }
+
+
+_router = None
+
+
+def get_router() -> Router:
+    global _router
+    if _router is None:
+        providers = [GroqProvider(), GeminiProvider(), OpenAIProvider(), FakeProvider()]
+        configured = {p.name for p in providers if p.configured}
+        _router = Router(providers, default=[name for name in LLM_ROUTER_PROVIDERS if name in configured])
+    return _router
+
+
+def set_router(router: Router):
+    global _router
+    _router = router
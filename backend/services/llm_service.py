@@ -1,34 +1,110 @@
+import logging
 import os
-import google.generativeai as genai
-from groq import Groq
 from dotenv import load_dotenv
+from . import llm_cache, llm_router
 
 load_dotenv()
 
-# Configure Gemini
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+# auto (default) lets the router pick the fastest healthy provider from
+# LLM_ROUTER_PROVIDERS and fail over between them; groq | gemini | fake pin every
+# request to that one provider
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "auto")
 
-# Configure Groq
-groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+logger = logging.getLogger(__name__)
 
-def run_llm(prompt_text: str, model_provider: str = "groq"):
+class LLMError(Exception):
+    # Raised when no provider could answer; callers must not store the message as a result
+    pass
+
+def estimate_tokens(text: str) -> int:
+    # Rough heuristic (~4 chars per token), good enough for rate limiting
+    return max(1, len(text) // 4)
+
+def _providers(model_provider: str):
+    return None if model_provider == "auto" else model_provider
+
+def _model(model_provider: str) -> str:
+    router = llm_router.get_router()
+    if model_provider == "auto":
+        return ",".join(router.providers[name].model for name in router.default)
+    provider = router.providers.get(model_provider)
+    return provider.model if provider else None
+
+def _cache_key(prompt_text: str, model_provider: str, cache_tag: str = None):
+    # Only prompt calls (tagged with the prompt's name) are cached: untagged calls such
+    # as /chat answer from the current inbox and must not be replayed
+    cache = llm_cache.get_llm_cache() if cache_tag else None
+    if cache is None:
+        return None, None
+    return cache, llm_cache.make_key(model_provider, _model(model_provider), prompt_text)
+
+def run_llm(prompt_text: str, model_provider: str = None, cache_tag: str = None):
+    model_provider = model_provider or LLM_PROVIDER
+    cache, key = _cache_key(prompt_text, model_provider, cache_tag)
+    if cache:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+    try:
+        text = llm_router.get_router().complete(prompt_text, _providers(model_provider)).text
+    except Exception as e:
+        logger.error("LLM error: %s", e)
+        raise LLMError(str(e)) from e
+    if cache:
+        cache.set(key, text, tag=cache_tag)
+    return text
+
+async def run_llm_async(prompt_text: str, model_provider: str = None, cache_tag: str = None):
+    model_provider = model_provider or LLM_PROVIDER
+    cache, key = _cache_key(prompt_text, model_provider, cache_tag)
+    if cache:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+    try:
+        text = (await llm_router.get_router().acomplete(prompt_text, _providers(model_provider))).text
+    except Exception as e:
+        logger.error("LLM error: %s", e)
+        raise LLMError(str(e)) from e
+    if cache:
+        cache.set(key, text, tag=cache_tag)
+    return text
+
+def stream_llm(prompt_text: str, model_provider: str = None, cache_tag: str = None):
+    # Yields text chunks as the provider produces them
+    model_provider = model_provider or LLM_PROVIDER
+    cache, key = _cache_key(prompt_text, model_provider, cache_tag)
+    if cache:
+        cached = cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+    chunks = []
+    try:
+        for chunk in llm_router.get_router().stream(prompt_text, _providers(model_provider)):
+            chunks.append(chunk)
+            yield chunk
+    except Exception as e:
+        logger.error("LLM error: %s", e)
+        raise LLMError(str(e)) from e
+    if cache:
+        cache.set(key, "".join(chunks), tag=cache_tag)
+
+async def stream_llm_async(prompt_text: str, model_provider: str = None, cache_tag: str = None):
+    model_provider = model_provider or LLM_PROVIDER
+    cache, key = _cache_key(prompt_text, model_provider, cache_tag)
+    if cache:
+        cached = cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+    chunks = []
     try:
-        if model_provider == "gemini":
-            model = genai.GenerativeModel('gemini-pro')
-            response = model.generate_content(prompt_text)
-            return response.text
-        else:
-            # Default to Groq (Llama 3 usually faster/cheaper for this)
-            chat_completion = groq_client.chat.completions.create(
-                messages=[
-                    {
-                        "role": "user",
-                        "content": prompt_text,
-                    }
-                ],
-                model="llama-3.1-8b-instant",
-            )
-            return chat_completion.choices[0].message.content
+        async for chunk in llm_router.get_router().astream(prompt_text, _providers(model_provider)):
+            chunks.append(chunk)
+            yield chunk
     except Exception as e:
-        print(f"LLM Error: {e}")
-        return f"Error processing request: {str(e)}"
+        logger.error("LLM error: %s", e)
+        raise LLMError(str(e)) from e
+    if cache:
+        cache.set(key, "".join(chunks), tag=cache_tag)
@@ -0,0 +1,346 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import time
+from datetime import datetime, timezone
+from email import policy
+from email.header import decode_header, make_header
+from email.parser import BytesParser
+from email.utils import getaddresses, parseaddr, parsedate_to_datetime
+from sqlalchemy.orm import Session
+from .. import models
+from . import threads
+
+# Streaming importer for mbox files, Maildir directories and JSONL exports. Messages
+# are parsed one at a time (memory stays bounded by IMPORT_BATCH_SIZE messages),
+# deduplicated on the Message-ID / content-hash unique columns and inserted in batches.
+# Each batch commits together with an ImportCheckpoint row, so an interrupted or
+# repeated import resumes where the last one stopped instead of re-reading the source.
+# In-Reply-To / References / To / Cc are kept for threading (services/threads.py).
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+IMPORT_MAX_BODY_CHARS = int(os.getenv("IMPORT_MAX_BODY_CHARS", "200000"))
+
+FINGERPRINT_BYTES = 64 * 1024
+# Only the nearest ancestors matter for threading; long References chains are cut
+MAX_REFERENCES = 20
+
+logger = logging.getLogger(__name__)
+
+_MESSAGE_ID_RE = re.compile(r"<[^<>\s]+>")
+# compat32 defers header parsing; policy.default parses every header into objects and
+# is several times slower for the handful of fields stored here
+_parser = BytesParser(policy=policy.compat32)
+
+
+def detect_format(path: str) -> str:
+    if os.path.isdir(path):
+        return "maildir"
+    if path.endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    return "mbox"
+
+
+def content_hash(sender: str, subject: str, body: str, timestamp) -> str:
+    key = "\x1f".join([sender or "", subject or "", timestamp.isoformat() if timestamp else "", body or ""])
+    return hashlib.sha256(key.encode("utf-8", "replace")).hexdigest()
+
+
+def _utc_naive(value):
+    if value is None:
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _parse_date(value):
+    if not value:
+        return None
+    try:
+        return _utc_naive(parsedate_to_datetime(str(value)))
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def _header(message, name: str) -> str:
+    value = message.get(name)
+    if value is None:
+        return ""
+    value = str(value)
+    if "=?" in value:
+        # RFC 2047 encoded words, e.g. =?utf-8?q?...?=
+        try:
+            return str(make_header(decode_header(value)))
+        except (LookupError, UnicodeError, ValueError):
+            pass
+    return value
+
+
+def _message_ids(value) -> list:
+    # "<a@x> <b@y>" (or a list of ids, from JSONL) -> ["<a@x>", "<b@y>"]
+    if isinstance(value, (list, tuple)):
+        value = " ".join(str(item) for item in value)
+    if not value:
+        return []
+    value = str(value)
+    return _MESSAGE_ID_RE.findall(value) or value.split()
+
+
+def _addresses(values) -> str:
+    # Lowercased, de-duplicated addresses from To/Cc style header values
+    if isinstance(values, str):
+        values = [values]
+    found = dict.fromkeys(address.lower() for _, address in getaddresses([str(v) for v in values or []]) if address)
+    return " ".join(found) or None
+
+
+def _as_list(value) -> list:
+    if value is None:
+        return []
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+def _threading(in_reply_to, references, recipients) -> dict:
+    parents = _message_ids(in_reply_to)
+    return {
+        "in_reply_to": parents[0] if parents else None,
+        "references": " ".join(_message_ids(references)[-MAX_REFERENCES:]) or None,
+        "recipients": _addresses(recipients),
+    }
+
+
+def _decode_part(part) -> str:
+    payload = part.get_payload(decode=True) or b""
+    try:
+        return payload.decode(part.get_content_charset() or "utf-8", "replace")
+    except LookupError:
+        return payload.decode("utf-8", "replace")
+
+
+def _message_body(message) -> str:
+    # First inline text/plain part, else the first text/html one
+    html = None
+    for part in message.walk():
+        if part.is_multipart() or part.get("Content-Disposition", "").lower().startswith("attachment"):
+            continue
+        content_type = part.get_content_type()
+        if content_type == "text/plain":
+            return _decode_part(part)
+        if content_type == "text/html" and html is None:
+            html = part
+    return _decode_part(html) if html is not None else ""
+
+
+def parse_message(raw: bytes) -> dict:
+    message = _parser.parsebytes(raw)
+    return {
+        "sender": parseaddr(_header(message, "From"))[1].lower(),
+        "subject": _header(message, "Subject").strip(),
+        "body": _message_body(message)[:IMPORT_MAX_BODY_CHARS],
+        "timestamp": _parse_date(message.get("Date")),
+        "message_id": _header(message, "Message-ID").strip() or None,
+        **_threading(
+            message.get("In-Reply-To"), message.get("References"),
+            (message.get_all("To") or []) + (message.get_all("Cc") or []),
+        ),
+    }
+
+
+def parse_json_record(line: bytes) -> dict:
+    record = json.loads(line)
+    timestamp = record.get("timestamp") or record.get("date")
+    if isinstance(timestamp, str):
+        try:
+            timestamp = _utc_naive(datetime.fromisoformat(timestamp))
+        except ValueError:
+            timestamp = _parse_date(timestamp)
+    return {
+        "sender": parseaddr(record.get("sender") or record.get("from") or "")[1].lower(),
+        "subject": (record.get("subject") or "").strip(),
+        "body": (record.get("body") or "")[:IMPORT_MAX_BODY_CHARS],
+        "timestamp": timestamp,
+        "message_id": record.get("message_id") or record.get("Message-ID"),
+        **_threading(
+            record.get("in_reply_to") or record.get("In-Reply-To"),
+            record.get("references") or record.get("References"),
+            [value for key in ("to", "cc", "recipients") for value in _as_list(record.get(key))],
+        ),
+    }
+
+
+def _fingerprint(path: str, position: int) -> str:
+    # Hash of the already imported head of the file, so appends keep the checkpoint
+    # but a rewritten file does not
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read(min(FINGERPRINT_BYTES, position))).hexdigest()
+
+
+def iter_mbox(path: str, start: int = 0):
+    # Yields (raw message bytes, offset just past it). Messages start at a "From " line
+    # preceded by a blank line; ">From " lines are unescaped (mboxrd).
+    with open(path, "rb") as f:
+        f.seek(start)
+        offset, message_start, lines, previous_blank = start, start, [], True
+        for line in f:
+            if line.startswith(b"From ") and previous_blank:
+                if lines:
+                    yield b"".join(lines), offset
+                message_start, lines = offset, []
+            elif line.startswith(b">") and line.lstrip(b">").startswith(b"From "):
+                lines.append(line[1:])
+            else:
+                lines.append(line)
+            previous_blank = line in (b"\n", b"\r\n")
+            offset += len(line)
+        if lines and offset > message_start:
+            yield b"".join(lines), offset
+
+
+def iter_jsonl(path: str, start: int = 0):
+    with open(path, "rb") as f:
+        f.seek(start)
+        offset = start
+        for line in f:
+            offset += len(line)
+            if line.strip():
+                yield line, offset
+
+
+def iter_maildir(path: str, start: int = 0):
+    # Yields (raw message bytes, mtime_ns). Delivery moves files into new/, so mtime is a
+    # usable watermark; files sharing the watermark's mtime are re-read and deduplicated.
+    entries = []
+    for sub in ("new", "cur"):
+        directory = os.path.join(path, sub)
+        if not os.path.isdir(directory):
+            continue
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.is_file() and not entry.name.startswith("."):
+                    mtime = entry.stat().st_mtime_ns
+                    if mtime >= start:
+                        entries.append((mtime, entry.path))
+    entries.sort()
+    for mtime, file_path in entries:
+        with open(file_path, "rb") as f:
+            yield f.read(), mtime
+
+
+READERS = {
+    "mbox": (iter_mbox, parse_message),
+    "jsonl": (iter_jsonl, parse_json_record),
+    "maildir": (iter_maildir, parse_message),
+}
+
+
+def _new_rows(db: Session, rows):
+    # Drops rows whose Message-ID or content hash is already stored or repeated in the batch
+    ids = [row["message_id"] for row in rows if row["message_id"]]
+    hashes = [row["content_hash"] for row in rows]
+    seen_ids = {value for (value,) in db.query(models.Email.message_id).filter(models.Email.message_id.in_(ids))} if ids else set()
+    seen_hashes = {value for (value,) in db.query(models.Email.content_hash).filter(models.Email.content_hash.in_(hashes))}
+    fresh = []
+    for row in rows:
+        if row["content_hash"] in seen_hashes or (row["message_id"] and row["message_id"] in seen_ids):
+            continue
+        seen_hashes.add(row["content_hash"])
+        if row["message_id"]:
+            seen_ids.add(row["message_id"])
+        fresh.append(row)
+    return fresh
+
+
+def import_mailbox(db: Session, path: str, format: str = None, batch_size: int = None, progress=None) -> dict:
+    path = os.path.abspath(path)
+    format = format or detect_format(path)
+    if format not in READERS:
+        raise ValueError(f"Unsupported mailbox format: {format}")
+    batch_size = batch_size or IMPORT_BATCH_SIZE
+    iterate, parse = READERS[format]
+
+    checkpoint = db.query(models.ImportCheckpoint).filter(models.ImportCheckpoint.source == path).first()
+    if checkpoint is None:
+        checkpoint = models.ImportCheckpoint(source=path, format=format, position=0, messages=0, imported=0, duplicates=0)
+        db.add(checkpoint)
+    files = format != "maildir"
+    if files and checkpoint.position and (
+        os.path.getsize(path) < checkpoint.position
+        or checkpoint.fingerprint != _fingerprint(path, checkpoint.position)
+    ):
+        # Rewritten file: read it from the start (dedup keeps this idempotent)
+        checkpoint.position = 0
+    checkpoint.format = format
+
+    stats = {"messages": 0, "imported": 0, "duplicates": 0, "errors": 0, "bytes": 0, "threaded": 0}
+    started = time.perf_counter()
+    start = checkpoint.position or 0
+    batch, position = [], start
+
+    def flush():
+        rows = _new_rows(db, batch)
+        if rows:
+            db.bulk_insert_mappings(models.Email, rows)
+            # Threads are indexed in the same transaction as the batch they come from
+            stats["threaded"] += threads.index_emails(db)
+        stats["imported"] += len(rows)
+        stats["duplicates"] += len(batch) - len(rows)
+        checkpoint.position = position
+        if files:
+            checkpoint.fingerprint = _fingerprint(path, position)
+        checkpoint.messages += len(batch)
+        checkpoint.imported += len(rows)
+        checkpoint.duplicates += len(batch) - len(rows)
+        checkpoint.updated_at = datetime.utcnow()
+        db.commit()
+        batch.clear()
+        if progress:
+            progress(stats)
+
+    for raw, position in iterate(path, start):
+        stats["messages"] += 1
+        stats["bytes"] += len(raw)
+        try:
+            row = parse(raw)
+        except Exception as e:
+            logger.warning("Skipping unparseable message in %s: %s", path, e)
+            stats["errors"] += 1
+            continue
+        # Hashed on the parsed Date (None when missing) so re-reading a message gives the
+        # same key; the import time stands in for a missing Date only after that
+        row["content_hash"] = content_hash(row["sender"], row["subject"], row["body"], row["timestamp"])
+        row["timestamp"] = row["timestamp"] or datetime.utcnow()
+        row["category"] = "Uncategorized"
+        row["is_read"] = False
+        row["action_items"] = "[]"
+        batch.append(row)
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+
+    elapsed = time.perf_counter() - started
+    stats["seconds"] = round(elapsed, 3)
+    stats["messages_per_second"] = round(stats["messages"] / elapsed, 1) if elapsed else None
+    stats["mb_per_second"] = round(stats["bytes"] / 1e6 / elapsed, 2) if elapsed else None
+    return stats
+
+
+if __name__ == "__main__":
+    # python -m backend.services.mail_import <path> [mbox|maildir|jsonl]
+    if len(sys.argv) not in (2, 3):
+        print("usage: python -m backend.services.mail_import <path> [mbox|maildir|jsonl]")
+        sys.exit(1)
+    from ..database import SessionLocal, engine
+    from .. import migrations
+    migrations.migrate(engine)
+    db = SessionLocal()
+    try:
+        print(import_mailbox(db, sys.argv[1], sys.argv[2] if len(sys.argv) == 3 else None))
+        # Embed the new mail for /chat retrieval now rather than on the next chat
+        from . import vector_index
+        print({"indexed": vector_index.sync(db)})
+    finally:
+        db.close()
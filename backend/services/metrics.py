@@ -0,0 +1,246 @@
+import contextvars
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# In-process metrics. Histograms keep cumulative bucket counts plus a bounded window
+# of recent samples for percentile estimates. Everything registered in REGISTRY is
+# exported in the Prometheus text format by render() (GET /metrics).
+#
+# Per-request timing: while a request has timing enabled (see start_timing), every
+# span() and LLM call made on its behalf is collected and logged as one JSON line.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+logger = logging.getLogger(__name__)
+
+
+class Histogram:
+    def __init__(self, name: str, description: str = "", buckets=DEFAULT_BUCKETS, window: int = 1000):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self.bucket_counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self._recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self.count += 1
+            self.sum += value
+            self._recent.append(value)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.bucket_counts[i] += 1
+
+    def percentile(self, q: float):
+        with self._lock:
+            samples = sorted(self._recent)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(q * (len(samples) - 1))))
+        return samples[index]
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def samples(self, labels: str = ""):
+        sep = "," if labels else ""
+        for bound, count in zip(self.buckets, self.bucket_counts):
+            yield f'{self.name}_bucket{{{labels}{sep}le="{bound}"}}', count
+        yield f'{self.name}_bucket{{{labels}{sep}le="+Inf"}}', self.count
+        yield f"{self.name}_sum{{{labels}}}" if labels else f"{self.name}_sum", self.sum
+        yield f"{self.name}_count{{{labels}}}" if labels else f"{self.name}_count", self.count
+
+    def snapshot(self) -> dict:
+        p50, p95 = self.percentile(0.5), self.percentile(0.95)
+        return {
+            "count": self.count,
+            "avg": round(self.sum / self.count, 4) if self.count else None,
+            "p50": round(p50, 4) if p50 is not None else None,
+            "p95": round(p95, 4) if p95 is not None else None,
+        }
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values) -> str:
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+class Counter:
+    def __init__(self, name: str, description: str = "", labels=()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(labels)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self.values.get(tuple(labels.get(name, "") for name in self.label_names), 0)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.description}"
+        yield f"# TYPE {self.name} counter"
+        for key, value in sorted(self.values.items()):
+            yield f"{self.name}{{{_labels(self.label_names, key)}}} {value}" if key else f"{self.name} {value}"
+
+
+class HistogramFamily:
+    # One Histogram per label combination
+    def __init__(self, name: str, description: str = "", labels=(), buckets=DEFAULT_BUCKETS, window: int = 1000):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(labels)
+        self.buckets = buckets
+        self.window = window
+        self.children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, **labels) -> Histogram:
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        child = self.children.get(key)
+        if child is None:
+            with self._lock:
+                child = self.children.setdefault(
+                    key, Histogram(self.name, self.description, self.buckets, self.window)
+                )
+        return child
+
+    def render(self):
+        yield f"# HELP {self.name} {self.description}"
+        yield f"# TYPE {self.name} histogram"
+        for key, child in sorted(self.children.items()):
+            for sample, value in child.samples(_labels(self.label_names, key)):
+                yield f"{sample} {value}"
+
+    def snapshot(self) -> dict:
+        return {",".join(key): child.snapshot() for key, child in sorted(self.children.items())}
+
+
+class Gauge:
+    # Read at scrape time: collect() returns a number or a {label value: number} dict.
+    # kind="counter" exports a monotonic value kept elsewhere (e.g. cache hit counts).
+    def __init__(self, name: str, description: str, collect, label: str = None, kind: str = "gauge"):
+        self.name = name
+        self.description = description
+        self.collect = collect
+        self.label = label
+        self.kind = kind
+
+    def render(self):
+        try:
+            value = self.collect()
+        except Exception as e:
+            logger.warning("Metric %s failed: %s", self.name, e)
+            return
+        if value is None:
+            return
+        yield f"# HELP {self.name} {self.description}"
+        yield f"# TYPE {self.name} {self.kind}"
+        if isinstance(value, dict):
+            for key, item in sorted(value.items()):
+                yield f"{self.name}{{{_labels((self.label,), (key,))}}} {item}"
+        else:
+            yield f"{self.name} {value}"
+
+
+REGISTRY = []
+
+
+def register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+def _render_histogram(histogram: Histogram):
+    yield f"# HELP {histogram.name} {histogram.description}"
+    yield f"# TYPE {histogram.name} histogram"
+    for sample, value in histogram.samples():
+        yield f"{sample} {value}"
+
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(_render_histogram(metric) if isinstance(metric, Histogram) else metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Per-request timing: a list of spans while enabled for the current request, else None
+_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def start_timing():
+    return _timings.set([])
+
+
+def finish_timing(token, **fields) -> dict:
+    spans = _timings.get()
+    _timings.reset(token)
+    record = {**fields, "spans": spans or []}
+    logger.info(json.dumps(record))
+    return record
+
+
+def record_span(name: str, seconds: float, **fields):
+    spans = _timings.get()
+    if spans is not None:
+        spans.append({"name": name, "ms": round(seconds * 1000, 2), **fields})
+
+
+@contextmanager
+def span(name: str, histogram: Histogram = None):
+    # Times a block into `histogram` and, when enabled, the current request's timing log
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        if histogram is not None:
+            histogram.observe(elapsed)
+        record_span(name, elapsed)
+
+
+http_request_duration = register(HistogramFamily(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status")
+))
+ingest_stage_duration = register(HistogramFamily(
+    "ingest_stage_duration_seconds", "Time spent per ingestion stage and email", ("stage",)
+))
+llm_requests = register(Counter(
+    "llm_requests_total", "LLM completions by provider, model and outcome (ok, error, cancelled)",
+    ("provider", "model", "outcome")
+))
+llm_request_duration = register(HistogramFamily(
+    "llm_request_duration_seconds", "Successful LLM completion latency", ("provider", "model")
+))
+llm_tokens = register(Counter(
+    "llm_tokens_total", "Estimated LLM tokens (~4 chars/token) by direction", ("provider", "model", "direction")
+))
+
+chat_time_to_first_token = Histogram(
+    "chat_time_to_first_token_seconds", "Time from /chat/stream request to the first streamed token"
+)
+chat_stream_duration = Histogram(
+    "chat_stream_duration_seconds", "Total duration of streamed /chat responses"
+)
+register(chat_time_to_first_token)
+register(chat_stream_duration)
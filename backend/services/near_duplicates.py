@@ -0,0 +1,263 @@
+import difflib
+import hashlib
+import json
+import os
+import re
+import sys
+import zlib
+import numpy as np
+from sqlalchemy import bindparam, func, insert, select
+from sqlalchemy.orm import Session
+from .. import models
+from . import preprocess, tasks
+
+# Near-duplicate reuse for the waves of almost identical mail (notifications, invoices,
+# newsletters). Each email gets a MinHash signature over word shingles of its subject
+# and cleaned body, with digits folded so "BE-404" and "BE-405" shingle alike. The
+# signature is cut into LSH bands stored in minhash_bands, so candidates come from an
+# index lookup instead of a scan. Only emails that matched nothing get bands: a wave of
+# a thousand notifications keeps a single candidate, its first one. A candidate is accepted when it has already been
+# processed, comes from the same sender domain and its exact shingle Jaccard similarity
+# reaches NEAR_DUP_THRESHOLD. The email then takes its category and action items
+# without an LLM call; the action items are rebound to this email's own values (issue
+# numbers, amounts, dates that differ between the two texts). Drafts are still generated.
+
+NEAR_DUP_ENABLED = os.getenv("NEAR_DUP", "1") != "0"
+NEAR_DUP_THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD", "0.8"))
+
+# Changing these invalidates stored signatures (rebuild with "index --rebuild")
+PERMUTATIONS = 64
+BANDS = 16
+ROWS = PERMUTATIONS // BANDS
+SHINGLE_WORDS = 2
+MAX_CANDIDATES = 5
+
+_TOKEN_RE = re.compile(r"[a-z0-9$%']+")
+_DIGITS_RE = re.compile(r"\d+")
+_VALUE_RE = re.compile(r"[\w$%@/.'-]+")
+
+_rng = np.random.RandomState(20240101)
+_A = (_rng.randint(1, 2 ** 31, PERMUTATIONS, dtype=np.int64).astype(np.uint64) << np.uint64(32)) | (
+    _rng.randint(1, 2 ** 31, PERMUTATIONS, dtype=np.int64).astype(np.uint64) * np.uint64(2) + np.uint64(1)
+)
+_B = _rng.randint(0, 2 ** 31, PERMUTATIONS, dtype=np.int64).astype(np.uint64) << np.uint64(16)
+
+metrics = {"seen": 0, "matched": 0, "reused": 0, "indexed": 0}
+
+# Emails sharing the most bands with the given keys, built once and reused with new parameters
+_CANDIDATES = (
+    select(models.Email)
+    .join(models.MinhashBand, models.MinhashBand.email_id == models.Email.id)
+    .where(
+        models.MinhashBand.band.in_(bindparam("keys", expanding=True)),
+        models.Email.id != bindparam("email_id"),
+        models.Email.sender.like(bindparam("sender")),
+    )
+    .group_by(models.Email.id)
+    .order_by(func.count().desc(), models.Email.id.desc())
+    .limit(MAX_CANDIDATES)
+)
+
+
+def _text(email) -> str:
+    return f"{email.subject or ''}\n{preprocess.clean_body(email)}"
+
+
+def shingles(email) -> set:
+    tokens = [_DIGITS_RE.sub("0", token) for token in _TOKEN_RE.findall(_text(email).lower())]
+    if len(tokens) < SHINGLE_WORDS:
+        return {zlib.crc32(" ".join(tokens).encode("utf-8"))} if tokens else set()
+    return {
+        zlib.crc32(" ".join(tokens[i:i + SHINGLE_WORDS]).encode("utf-8"))
+        for i in range(len(tokens) - SHINGLE_WORDS + 1)
+    }
+
+
+def signature(shingle_set: set) -> np.ndarray:
+    # PERMUTATIONS minimums of multiply-shift hashes over the 32-bit shingle hashes
+    if not shingle_set:
+        return np.full(PERMUTATIONS, 0xFFFFFFFF, dtype=np.uint32)
+    values = np.fromiter(shingle_set, dtype=np.uint64, count=len(shingle_set))
+    with np.errstate(over="ignore"):
+        # uint64 arithmetic wraps, which is the "mod 2^64" of multiply-shift hashing
+        hashed = (_A[:, None] * values[None, :] + _B[:, None]) >> np.uint64(32)
+    return hashed.min(axis=1).astype(np.uint32)
+
+
+def band_keys(sig: np.ndarray) -> list:
+    keys = []
+    for band in range(BANDS):
+        digest = hashlib.blake2b(sig[band * ROWS:(band + 1) * ROWS].tobytes(), digest_size=8, key=bytes([band])).digest()
+        keys.append(int.from_bytes(digest, "big") >> 1)
+    return keys
+
+
+def jaccard(a: set, b: set) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def _domain(email) -> str:
+    return (email.sender or "").lower().rpartition("@")[2]
+
+
+def index_email(db: Session, email, sig: np.ndarray = None):
+    # Stores the email's signature and LSH bands (the caller commits); idempotent
+    if email.minhash is not None:
+        return
+    sig = signature(shingles(email)) if sig is None else sig
+    email.minhash = sig.tobytes()
+    # One executemany in the session's transaction, not sixteen ORM objects to flush
+    db.execute(insert(models.MinhashBand), [{"band": key, "email_id": email.id} for key in set(band_keys(sig))])
+    metrics["indexed"] += 1
+
+
+def find(db: Session, email, threshold: float = None):
+    # The most similar already processed email, as (email, similarity), or None.
+    # Without a match `email` is indexed as a side effect so later arrivals can match it.
+    threshold = NEAR_DUP_THRESHOLD if threshold is None else threshold
+    metrics["seen"] += 1
+    own = shingles(email)
+    sig = signature(own)
+    # Checked below rather than in SQL: emails processed earlier in this session carry
+    # their results in memory, there is no need to flush them first
+    with db.no_autoflush:
+        candidates = db.scalars(
+            _CANDIDATES, {"keys": band_keys(sig), "email_id": email.id, "sender": f"%@{_domain(email)}"}
+        ).all()
+    best, score = None, 0.0
+    for candidate in candidates:
+        if candidate.category == "Uncategorized" or candidate.duplicate_of is not None or _domain(candidate) != _domain(email):
+            continue
+        similarity = jaccard(own, shingles(candidate))
+        if similarity > score:
+            best, score = candidate, similarity
+    if best is None or score < threshold:
+        with db.no_autoflush:
+            index_email(db, email, sig)
+        return None
+    metrics["matched"] += 1
+    return best, score
+
+
+def cluster(emails, threshold: float = None) -> dict:
+    # Groups near-duplicates among not yet processed emails: {follower id: leader id},
+    # the leader being the first email of its group in the given order
+    threshold = NEAR_DUP_THRESHOLD if threshold is None else threshold
+    buckets, leaders, followers = {}, {}, {}
+    for email in emails:
+        own = shingles(email)
+        sig = signature(own)
+        keys = band_keys(sig)
+        match = None
+        for leader_id in dict.fromkeys(leader for key in keys for leader in buckets.get(key, [])):
+            leader, leader_shingles = leaders[leader_id]
+            if _domain(leader) == _domain(email) and jaccard(own, leader_shingles) >= threshold:
+                match = leader_id
+                break
+        if match is not None:
+            followers[email.id] = match
+            continue
+        leaders[email.id] = (email, own)
+        for key in keys:
+            buckets.setdefault(key, []).append(email.id)
+    return followers
+
+
+def _value_map(source, email) -> dict:
+    # Source token -> this email's token, for the single words that differ between texts
+    source_tokens = [token.strip(".,;:'") for token in _VALUE_RE.findall(_text(source))]
+    tokens = [token.strip(".,;:'") for token in _VALUE_RE.findall(_text(email))]
+    mapping, ambiguous = {}, set()
+    matcher = difflib.SequenceMatcher(None, source_tokens, tokens, autojunk=False)
+    for op, i1, i2, j1, j2 in matcher.get_opcodes():
+        if op != "replace" or i2 - i1 != j2 - j1:
+            continue
+        for old, new in zip(source_tokens[i1:i2], tokens[j1:j2]):
+            if mapping.get(old, new) != new:
+                ambiguous.add(old)
+            mapping[old] = new
+    return {old: new for old, new in mapping.items() if old and old not in ambiguous}
+
+
+def rebind_actions(action_items: str, source, email) -> str:
+    # The source's action items with its differing values replaced by this email's
+    items = tasks.parse_items(action_items)
+    if not items:
+        return "[]"
+    mapping = _value_map(source, email)
+
+    def substitute(match):
+        token = match.group(0)
+        value = token.strip(".,;:'")
+        return token.replace(value, mapping[value], 1) if value in mapping else token
+
+    def rebind(text):
+        return _VALUE_RE.sub(substitute, text) if text else text
+
+    return json.dumps([{"task": rebind(task), "deadline": rebind(deadline)} for task, deadline in items])
+
+
+def reused_results(source, email) -> dict:
+    # What `email` takes over from the processed `source`, as Email column values
+    metrics["reused"] += 1
+    return {
+        "category": source.category,
+        "category_version_id": source.category_version_id,
+        "action_items": rebind_actions(source.action_items, source, email),
+        "actions_version_id": source.actions_version_id,
+        "duplicate_of": source.duplicate_of or source.id,
+    }
+
+
+def reuse(email, source):
+    # Applies `source`'s results to `email` (the caller commits)
+    results = reused_results(source, email)
+    tasks.set_action_items(email, results.pop("action_items"))
+    for name, value in results.items():
+        setattr(email, name, value)
+
+
+def stats() -> dict:
+    seen = metrics["seen"]
+    return {
+        "enabled": NEAR_DUP_ENABLED,
+        "threshold": NEAR_DUP_THRESHOLD,
+        **metrics,
+        "dedup_ratio": round(metrics["reused"] / seen, 4) if seen else 0.0,
+    }
+
+
+def backfill(db: Session, rebuild: bool = False, batch_size: int = 500) -> int:
+    # Indexes processed emails that predate near-duplicate detection
+    if rebuild:
+        db.query(models.MinhashBand).delete()
+        db.query(models.Email).update({models.Email.minhash: None})
+        db.commit()
+    ids = [
+        email_id for (email_id,) in db.query(models.Email.id)
+        .filter(models.Email.minhash.is_(None), models.Email.category != "Uncategorized",
+                models.Email.duplicate_of.is_(None))
+        .order_by(models.Email.id)
+    ]
+    for start in range(0, len(ids), batch_size):
+        for email in db.query(models.Email).filter(models.Email.id.in_(ids[start:start + batch_size])):
+            index_email(db, email)
+        db.commit()
+    return len(ids)
+
+
+if __name__ == "__main__":
+    # python -m backend.services.near_duplicates index [--rebuild]
+    if sys.argv[1:2] != ["index"] or sys.argv[2:] not in ([], ["--rebuild"]):
+        print("usage: python -m backend.services.near_duplicates index [--rebuild]")
+        sys.exit(1)
+    from ..database import SessionLocal, engine
+    from .. import migrations
+    migrations.migrate(engine)
+    db = SessionLocal()
+    try:
+        print({"emails": backfill(db, rebuild=sys.argv[2:] == ["--rebuild"])})
+    finally:
+        db.close()
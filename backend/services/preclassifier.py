@@ -0,0 +1,196 @@
+import json
+import math
+import os
+import random
+import re
+import sys
+import zlib
+from collections import namedtuple
+from .. import models
+
+# CPU-only first stage in front of the LLM: a hashed-feature logistic regression
+# trained on emails that already have a category, optionally preceded by sender rules.
+# Confident predictions skip the categorization call; confident Spam/Newsletter
+# predictions skip the LLM entirely. Everything else is escalated unchanged. The
+# sender rules are opt-in (PRECLASSIFIER_SENDER_RULES=1): addresses like sales@ or
+# news@ also send mail people want, and a rule hit is never seen by the LLM.
+
+PRECLASSIFIER_ENABLED = os.getenv("PRECLASSIFIER", "1") != "0"
+PRECLASSIFIER_PATH = os.getenv("PRECLASSIFIER_PATH", "./preclassifier.json")
+PRECLASSIFIER_THRESHOLD = float(os.getenv("PRECLASSIFIER_THRESHOLD", "0.9"))
+PRECLASSIFIER_MIN_EXAMPLES = int(os.getenv("PRECLASSIFIER_MIN_EXAMPLES", "20"))
+PRECLASSIFIER_MAX_EXAMPLES = int(os.getenv("PRECLASSIFIER_MAX_EXAMPLES", "20000"))
+PRECLASSIFIER_SENDER_RULES = os.getenv("PRECLASSIFIER_SENDER_RULES", "0") == "1"
+
+# Categories that need no action extraction or draft
+NO_LLM_CATEGORIES = ["Spam", "Newsletter"]
+
+RULE_CONFIDENCE = 0.99
+SENDER_RULES = [
+    ("Spam", re.compile(r"^(spam|offers?|promos?|promotions|deals|marketing|sales)@")),
+    ("Newsletter", re.compile(r"^(newsletters?|news|digest|weekly|bulletin)@")),
+]
+
+BUCKETS = 2 ** 18
+_TOKEN_RE = re.compile(r"[a-z0-9$%']+")
+
+Prediction = namedtuple("Prediction", ["category", "confidence", "source"])
+
+metrics = {"seen": 0, "rule_hits": 0, "model_hits": 0, "escalated": 0, "short_circuited": 0}
+
+
+def features(email) -> list:
+    sender = (email.sender or "").lower()
+    local, _, domain = sender.partition("@")
+    feats = [f"from:{sender}", f"local:{local}", f"domain:{domain}"]
+    feats += [f"s:{t}" for t in _TOKEN_RE.findall((email.subject or "").lower())]
+    feats += [f"b:{t}" for t in _TOKEN_RE.findall((email.body or "").lower())[:300]]
+    return sorted({zlib.crc32(f.encode("utf-8")) % BUCKETS for f in feats})
+
+
+class LinearModel:
+    def __init__(self, classes, weights=None, bias=None, trained_on=0):
+        self.classes = list(classes)
+        # class -> {bucket: weight}
+        self.weights = weights or {c: {} for c in self.classes}
+        self.bias = bias or {c: 0.0 for c in self.classes}
+        self.trained_on = trained_on
+
+    def _scores(self, feats):
+        scale = 1 / math.sqrt(len(feats)) if feats else 0.0
+        return {
+            c: self.bias[c] + scale * sum(self.weights[c].get(f, 0.0) for f in feats)
+            for c in self.classes
+        }
+
+    def probabilities(self, feats) -> dict:
+        scores = self._scores(feats)
+        top = max(scores.values())
+        exp = {c: math.exp(s - top) for c, s in scores.items()}
+        total = sum(exp.values())
+        return {c: v / total for c, v in exp.items()}
+
+    def fit(self, examples, epochs: int = 8, lr: float = 0.5, l2: float = 1e-4, seed: int = 0):
+        rng = random.Random(seed)
+        examples = list(examples)
+        for _ in range(epochs):
+            rng.shuffle(examples)
+            for feats, label in examples:
+                probs = self.probabilities(feats)
+                scale = 1 / math.sqrt(len(feats)) if feats else 0.0
+                for c in self.classes:
+                    grad = probs[c] - (1.0 if c == label else 0.0)
+                    self.bias[c] -= lr * grad
+                    weights = self.weights[c]
+                    for f in feats:
+                        w = weights.get(f, 0.0)
+                        weights[f] = w - lr * (grad * scale + l2 * w)
+        self.trained_on = len(examples)
+        return self
+
+    def to_dict(self) -> dict:
+        return {
+            "classes": self.classes,
+            "bias": self.bias,
+            "weights": {c: {str(k): round(v, 6) for k, v in w.items() if abs(v) > 1e-6} for c, w in self.weights.items()},
+            "trained_on": self.trained_on,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        weights = {c: {int(k): v for k, v in w.items()} for c, w in data["weights"].items()}
+        return cls(data["classes"], weights, data["bias"], data.get("trained_on", 0))
+
+
+_model = None
+_model_loaded = False
+
+
+def get_model():
+    global _model, _model_loaded
+    if not _model_loaded:
+        _model_loaded = True
+        if os.path.exists(PRECLASSIFIER_PATH):
+            with open(PRECLASSIFIER_PATH) as f:
+                _model = LinearModel.from_dict(json.load(f))
+    return _model
+
+
+def retrain(db) -> dict:
+    global _model, _model_loaded
+    from .ingestion_service import CATEGORIES
+
+    rows = (
+        db.query(models.Email)
+        .filter(models.Email.category.in_(CATEGORIES))
+        .order_by(models.Email.id.desc())
+        .limit(PRECLASSIFIER_MAX_EXAMPLES)
+        .all()
+    )
+    labels = {row.category for row in rows}
+    if len(rows) < PRECLASSIFIER_MIN_EXAMPLES or len(labels) < 2:
+        return {"trained": False, "examples": len(rows), "reason": "not enough categorized emails"}
+
+    model = LinearModel(sorted(labels)).fit([(features(row), row.category) for row in rows])
+    with open(PRECLASSIFIER_PATH, "w") as f:
+        json.dump(model.to_dict(), f)
+    _model, _model_loaded = model, True
+    return {"trained": True, "examples": len(rows), "classes": model.classes}
+
+
+def predict(email):
+    if PRECLASSIFIER_SENDER_RULES:
+        sender = (email.sender or "").lower()
+        for category, pattern in SENDER_RULES:
+            if pattern.search(sender):
+                return Prediction(category, RULE_CONFIDENCE, "rule")
+
+    model = get_model()
+    if model is None:
+        return None
+    probs = model.probabilities(features(email))
+    category = max(probs, key=probs.get)
+    return Prediction(category, probs[category], "model")
+
+
+def preclassify(email, threshold: float = None):
+    # Returns a confident Prediction, or None to escalate the email to the LLM
+    if not PRECLASSIFIER_ENABLED:
+        return None
+    threshold = PRECLASSIFIER_THRESHOLD if threshold is None else threshold
+    metrics["seen"] += 1
+    prediction = predict(email)
+    if prediction is None or prediction.confidence < threshold:
+        metrics["escalated"] += 1
+        return None
+    metrics["rule_hits" if prediction.source == "rule" else "model_hits"] += 1
+    if prediction.category in NO_LLM_CATEGORIES:
+        metrics["short_circuited"] += 1
+    return prediction
+
+
+def stats() -> dict:
+    model = get_model()
+    seen = metrics["seen"]
+    return {
+        "enabled": PRECLASSIFIER_ENABLED,
+        "threshold": PRECLASSIFIER_THRESHOLD,
+        "sender_rules": PRECLASSIFIER_SENDER_RULES,
+        "model_trained_on": model.trained_on if model else 0,
+        **metrics,
+        "short_circuit_rate": round(metrics["short_circuited"] / seen, 4) if seen else 0.0,
+        "resolved_rate": round((metrics["rule_hits"] + metrics["model_hits"]) / seen, 4) if seen else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    # python -m backend.services.preclassifier retrain
+    if sys.argv[1:] != ["retrain"]:
+        print("usage: python -m backend.services.preclassifier retrain")
+        sys.exit(1)
+    from ..database import SessionLocal
+    db = SessionLocal()
+    try:
+        print(retrain(db))
+    finally:
+        db.close()
@@ -0,0 +1,213 @@
+import html
+import os
+import re
+from html.parser import HTMLParser
+
+# Prompt-side cleanup of email bodies: HTML is reduced to text, quoted reply history,
+# signatures and legal footers are dropped, and what is left is truncated to a
+# per-prompt token budget. The cleaned body and its token counts are cached on the
+# Email row (clean_body, body_tokens, clean_tokens), so each email is cleaned once no
+# matter how many prompts it goes through.
+#
+# Token counts use tiktoken when it is installed (TOKENIZER_ENCODING, default
+# cl100k_base) and the ~4 chars/token estimate otherwise.
+
+PREPROCESS_ENABLED = os.getenv("PREPROCESS", "1") != "0"
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "cl100k_base")
+
+# Max body tokens per prompt; override with e.g. PROMPT_BODY_TOKENS="categorization=300,auto_reply=2000"
+BODY_TOKEN_BUDGETS = {
+    "categorization": 400,
+    "action_extraction": 1500,
+    "auto_reply": 1500,
+    "fused": 1500,
+    "batch": 250,
+}
+for _item in os.getenv("PROMPT_BODY_TOKENS", "").split(","):
+    if "=" in _item:
+        _name, _value = _item.split("=", 1)
+        BODY_TOKEN_BUDGETS[_name.strip()] = int(_value)
+
+TRUNCATION_MARKER = "\n[... truncated]"
+
+metrics = {"emails": 0, "body_tokens": 0, "clean_tokens": 0, "prompts": 0, "prompt_body_tokens": 0, "raw_prompt_body_tokens": 0}
+
+_HTML_RE = re.compile(r"<(html|body|div|p|br|table|span|font)\b", re.IGNORECASE)
+_QUOTE_HEADER_RES = [
+    re.compile(r"^\s*On .{5,200}wrote:\s*$", re.IGNORECASE),
+    re.compile(r"^\s*-{2,}\s*Original Message\s*-{2,}", re.IGNORECASE),
+    re.compile(r"^\s*-{2,}\s*Forwarded message\s*-{2,}", re.IGNORECASE),
+    re.compile(r"^\s*_{20,}\s*$"),
+    re.compile(r"^\s*From:\s.+$", re.IGNORECASE),  # Outlook style header block, checked below
+]
+_SIGNATURE_RES = [
+    re.compile(r"^--\s?$"),
+    re.compile(r"^\s*Sent from my \w+", re.IGNORECASE),
+    re.compile(r"^\s*Get Outlook for \w+", re.IGNORECASE),
+    re.compile(r"^\s*(CONFIDENTIALITY NOTICE|DISCLAIMER)\b", re.IGNORECASE),
+    re.compile(r"^\s*This (e-?mail|message) and any (files|attachments)", re.IGNORECASE),
+]
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+_SPACES_RE = re.compile(r"[ \t\u00a0]+")
+
+
+class _TextExtractor(HTMLParser):
+    BLOCK_TAGS = {"p", "div", "br", "tr", "li", "h1", "h2", "h3", "h4", "table", "blockquote"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ("script", "style", "head"):
+            self._skip += 1
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in ("script", "style", "head"):
+            self._skip = max(0, self._skip - 1)
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.parts.append(data)
+
+
+def html_to_text(text: str) -> str:
+    if not _HTML_RE.search(text):
+        return text
+    extractor = _TextExtractor()
+    try:
+        extractor.feed(text)
+        extractor.close()
+    except Exception:
+        return html.unescape(re.sub(r"<[^>]+>", " ", text))
+    return "".join(extractor.parts)
+
+
+def _is_quote_header(lines, i: int) -> bool:
+    line = lines[i]
+    for pattern in _QUOTE_HEADER_RES[:-1]:
+        if pattern.match(line):
+            return True
+    # "From: ..." only counts when followed by Sent:/Date:/To: (a forwarded header block)
+    if _QUOTE_HEADER_RES[-1].match(line):
+        following = " ".join(lines[i + 1:i + 4]).lower()
+        return "sent:" in following or "date:" in following
+    return False
+
+
+def strip_quoted(text: str) -> str:
+    lines = text.split("\n")
+    kept = []
+    for i, line in enumerate(lines):
+        if _is_quote_header(lines, i):
+            break
+        if line.lstrip().startswith(">"):
+            continue
+        kept.append(line)
+    return "\n".join(kept)
+
+
+def strip_signature(text: str) -> str:
+    lines = text.split("\n")
+    for i, line in enumerate(lines):
+        # Never cut the first lines: a one-line mail that starts with "--" is content
+        if i >= 2 and any(pattern.match(line) for pattern in _SIGNATURE_RES):
+            return "\n".join(lines[:i])
+    return text
+
+
+def _normalize_space(text: str) -> str:
+    text = "\n".join(_SPACES_RE.sub(" ", line).strip() for line in text.split("\n"))
+    return _BLANK_LINES_RE.sub("\n\n", text).strip()
+
+
+def clean_text(text: str) -> str:
+    text = html_to_text(text or "").replace("\r\n", "\n")
+    cleaned = _normalize_space(strip_signature(strip_quoted(text)))
+    # Bodies that are nothing but quoted text (e.g. a bare forward) keep their content
+    return cleaned or _normalize_space(text)
+
+
+_encoding = None
+_encoding_loaded = False
+
+
+def _get_encoding():
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+        except Exception:
+            _encoding = None
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return max(1, len(text) // 4) if text else 0
+
+
+def truncate_tokens(text: str, budget: int) -> str:
+    if budget is None or count_tokens(text) <= budget:
+        return text
+    encoding = _get_encoding()
+    if encoding is not None:
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:budget]) + TRUNCATION_MARKER
+    cut = text[:budget * 4]
+    space = cut.rfind(" ", len(cut) // 2)
+    return (cut[:space] if space > 0 else cut) + TRUNCATION_MARKER
+
+
+def clean_body(email) -> str:
+    # Cleaned once per email and cached on the row (persisted with the next commit)
+    if not PREPROCESS_ENABLED:
+        return email.body or ""
+    if email.clean_body is None:
+        email.clean_body = clean_text(email.body)
+        email.body_tokens = count_tokens(email.body or "")
+        email.clean_tokens = count_tokens(email.clean_body)
+        metrics["emails"] += 1
+        metrics["body_tokens"] += email.body_tokens
+        metrics["clean_tokens"] += email.clean_tokens
+    return email.clean_body
+
+
+def prompt_body(email, prompt_name: str = None) -> str:
+    # The email body as it should appear in `prompt_name`'s prompt
+    if not PREPROCESS_ENABLED:
+        return email.body or ""
+    body = truncate_tokens(clean_body(email), BODY_TOKEN_BUDGETS.get(prompt_name))
+    metrics["prompts"] += 1
+    metrics["raw_prompt_body_tokens"] += email.body_tokens or 0
+    metrics["prompt_body_tokens"] += count_tokens(body)
+    return body
+
+
+def body_cost(email, prompt_name: str = None) -> int:
+    # Token cost of prompt_body() without rendering it, for packing batches
+    if not PREPROCESS_ENABLED:
+        return count_tokens(email.body or "")
+    clean_body(email)
+    budget = BODY_TOKEN_BUDGETS.get(prompt_name)
+    return min(email.clean_tokens, budget) if budget else email.clean_tokens
+
+
+def stats() -> dict:
+    saved = metrics["raw_prompt_body_tokens"] - metrics["prompt_body_tokens"]
+    return {
+        "enabled": PREPROCESS_ENABLED,
+        "tokenizer": TOKENIZER_ENCODING if _get_encoding() is not None else "chars/4",
+        "budgets": BODY_TOKEN_BUDGETS,
+        **metrics,
+        "tokens_saved": saved,
+        "tokens_saved_per_email": round(saved / metrics["emails"], 1) if metrics["emails"] else 0.0,
+    }
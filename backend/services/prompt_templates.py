@@ -0,0 +1,165 @@
+import json
+import logging
+import re
+from types import MappingProxyType
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from .. import models
+
+# Prompt templates are compiled once per immutable PromptVersion: placeholders are
+# parsed and validated up front, and rendering just joins the precomputed pieces.
+# Saving a changed template adds a new version and moves the prompt's version_id;
+# results record the version that produced them, so stale ones can be found later.
+
+# Variables a template may use. Anything else in {braces} that is not a plain
+# identifier (e.g. a JSON example) is left as literal text.
+VARIABLES = {
+    "email_body": "the cleaned, token-budgeted email body",
+    "subject": "the email subject",
+    "sender": "the sender address",
+    "date": "when the email was received",
+}
+REQUIRED_VARIABLES = {
+    "categorization": {"email_body"},
+    "action_extraction": {"email_body"},
+    "auto_reply": {"email_body"},
+}
+
+logger = logging.getLogger(__name__)
+
+_VARIABLE_RE = re.compile(r"\{(\w+)\}")
+
+
+class TemplateError(ValueError):
+    pass
+
+
+class CompiledTemplate:
+    __slots__ = ("name", "template", "variables", "version_id", "version", "_parts")
+
+    def __init__(self, name: str, template: str, version_id: int = None, version: int = None):
+        self.name = name
+        self.template = template
+        self.version_id = version_id
+        self.version = version
+        parts, variables, last = [], [], 0
+        for match in _VARIABLE_RE.finditer(template):
+            variable = match.group(1)
+            if variable not in VARIABLES:
+                raise TemplateError(
+                    f"Unknown variable {{{variable}}} in prompt '{name}'; allowed: {', '.join(sorted(VARIABLES))}"
+                )
+            parts.append((template[last:match.start()], variable))
+            if variable not in variables:
+                variables.append(variable)
+            last = match.end()
+        parts.append((template[last:], None))
+        missing = REQUIRED_VARIABLES.get(name, set()) - set(variables)
+        if missing:
+            raise TemplateError(f"Prompt '{name}' must use {', '.join('{' + v + '}' for v in sorted(missing))}")
+        self.variables = tuple(variables)
+        self._parts = tuple(parts)
+
+    def render(self, **values) -> str:
+        out = []
+        for literal, variable in self._parts:
+            out.append(literal)
+            if variable is not None:
+                out.append(values[variable])
+        return "".join(out)
+
+
+# version id -> CompiledTemplate. Versions never change, so entries never go stale.
+_compiled = {}
+
+
+def _compile_version(version: models.PromptVersion) -> CompiledTemplate:
+    compiled = _compiled.get(version.id)
+    if compiled is None:
+        compiled = CompiledTemplate(version.prompt_name, version.template, version.id, version.version)
+        _compiled[version.id] = compiled
+    return compiled
+
+
+def _add_version(db: Session, name: str, template: str, compiled: CompiledTemplate) -> models.PromptVersion:
+    latest = db.query(func.max(models.PromptVersion.version)).filter(models.PromptVersion.prompt_name == name).scalar()
+    version = models.PromptVersion(
+        prompt_name=name, version=(latest or 0) + 1, template=template, variables=json.dumps(list(compiled.variables))
+    )
+    db.add(version)
+    db.flush()
+    return version
+
+
+def save_prompt(db: Session, name: str, template: str, description: str = None):
+    # Creates or updates a prompt; returns (prompt, template_changed). Raises TemplateError.
+    compiled = CompiledTemplate(name, template)
+    prompt = db.query(models.Prompt).filter(models.Prompt.name == name).first()
+    changed = prompt is None or prompt.template != template or prompt.version_id is None
+    if prompt is None:
+        prompt = models.Prompt(name=name)
+        db.add(prompt)
+    if changed:
+        prompt.version_id = _add_version(db, name, template, compiled).id
+    prompt.template = template
+    prompt.description = description
+    db.commit()
+    db.refresh(prompt)
+    return prompt, changed
+
+
+def _current_versions(db: Session):
+    return (
+        db.query(models.Prompt, models.PromptVersion)
+        .outerjoin(models.PromptVersion, models.Prompt.version_id == models.PromptVersion.id)
+        .all()
+    )
+
+
+def sync_versions(db: Session) -> int:
+    # Gives prompts saved before versioning (or edited in the table directly) a version
+    # for their current template, and commits. Returns the number of versions added.
+    added = 0
+    for prompt, version in _current_versions(db):
+        if version is not None and version.template == prompt.template:
+            continue
+        try:
+            compiled = CompiledTemplate(prompt.name, prompt.template)
+        except TemplateError as e:
+            logger.warning("Skipping prompt %s: %s", prompt.name, e)
+            continue
+        prompt.version_id = _add_version(db, prompt.name, prompt.template, compiled).id
+        added += 1
+    if added:
+        db.commit()
+    return added
+
+
+def load_prompts(db: Session):
+    # Read-only snapshot name -> CompiledTemplate of every prompt's current version;
+    # never writes. A template without a version yet (see sync_versions) is compiled
+    # with version_id None.
+    prompts = {}
+    for prompt, version in _current_versions(db):
+        if version is not None and version.template == prompt.template:
+            prompts[prompt.name] = _compile_version(version)
+            continue
+        try:
+            prompts[prompt.name] = CompiledTemplate(prompt.name, prompt.template)
+        except TemplateError as e:
+            logger.warning("Skipping prompt %s: %s", prompt.name, e)
+    return MappingProxyType(prompts)
+
+
+def list_versions(db: Session, name: str):
+    versions = (
+        db.query(models.PromptVersion)
+        .filter(models.PromptVersion.prompt_name == name)
+        .order_by(models.PromptVersion.version.desc())
+        .all()
+    )
+    return [
+        {"id": v.id, "prompt_name": v.prompt_name, "version": v.version, "template": v.template,
+         "variables": json.loads(v.variables or "[]"), "created_at": v.created_at}
+        for v in versions
+    ]
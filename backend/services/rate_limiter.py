@@ -0,0 +1,86 @@
+import asyncio
+import os
+import threading
+import time
+
+# Per-provider request and token limits (GROQ_RPM / GROQ_TPM, GEMINI_RPM, ...). The
+# router applies them to the provider it actually sends each request to, so they hold
+# for routed ("auto") traffic, failover and hedged requests alike.
+
+
+class RateLimiter:
+    # Token buckets for requests/min and tokens/min. None means unlimited. Shared by
+    # every event loop in the process (job worker threads each run their own, the API
+    # server another), so the buckets are guarded by a threading lock. acquire() (and
+    # acquire_blocking() off the event loop) reserves its share up front, letting the
+    # buckets go negative, and sleeps until the reservation is covered without holding
+    # the lock; callers are served in order.
+    def __init__(self, requests_per_minute: float = None, tokens_per_minute: float = None):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = requests_per_minute or 0.0
+        self._tokens = tokens_per_minute or 0.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        if self.requests_per_minute:
+            self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60)
+        if self.tokens_per_minute:
+            self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60)
+
+    def _wait_time(self, tokens: int) -> float:
+        wait = 0.0
+        if self.requests_per_minute and self._requests < 1:
+            wait = max(wait, (1 - self._requests) * 60 / self.requests_per_minute)
+        if self.tokens_per_minute:
+            # A single request larger than the whole bucket only waits for a full bucket
+            needed = min(tokens, self.tokens_per_minute)
+            if self._tokens < needed:
+                wait = max(wait, (needed - self._tokens) * 60 / self.tokens_per_minute)
+        return wait
+
+    def reserve(self, tokens: int = 1) -> float:
+        # Takes one request and `tokens` from the buckets; returns the seconds to wait
+        # before sending it
+        with self._lock:
+            self._refill()
+            wait = self._wait_time(tokens)
+            if self.requests_per_minute:
+                self._requests -= 1
+            if self.tokens_per_minute:
+                self._tokens -= min(tokens, self.tokens_per_minute)
+            return wait
+
+    def acquire_blocking(self, tokens: int = 1):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire(self, tokens: int = 1):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def _env_limit(name: str):
+    value = os.getenv(name)
+    return float(value) if value else None
+
+
+def get_rate_limiter(provider: str) -> RateLimiter:
+    # e.g. GROQ_RPM=30 GROQ_TPM=6000
+    with _rate_limiters_lock:
+        if provider not in _rate_limiters:
+            _rate_limiters[provider] = RateLimiter(
+                requests_per_minute=_env_limit(f"{provider.upper()}_RPM"),
+                tokens_per_minute=_env_limit(f"{provider.upper()}_TPM"),
+            )
+        return _rate_limiters[provider]
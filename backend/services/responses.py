@@ -0,0 +1,52 @@
+import hashlib
+import json
+import os
+from datetime import date, datetime
+from fastapi import Request, Response
+
+# JSON responses serialized in one step (orjson when installed, ORJSON=0 to opt out)
+# with a strong ETag over the body: a client that sends the ETag back in If-None-Match
+# gets an empty 304 while the page is unchanged. Handlers that return these skip
+# FastAPI's response_model validation pass, so they must build the payload themselves.
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+ORJSON_ENABLED = orjson is not None and os.getenv("ORJSON", "1") != "0"
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dumps(content) -> bytes:
+    if ORJSON_ENABLED:
+        return orjson.dumps(content)
+    return json.dumps(content, default=_default, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def _matches(if_none_match: str, tag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as RFC 9110 requires for If-None-Match
+    tags = {value.strip().removeprefix("W/") for value in if_none_match.split(",")}
+    return tag in tags
+
+
+def json_response(request: Request, content, headers: dict = None) -> Response:
+    body = dumps(content)
+    tag = etag(body)
+    headers = {**(headers or {}), "ETag": tag, "Cache-Control": "no-cache"}
+    if _matches(request.headers.get("if-none-match"), tag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
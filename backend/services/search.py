@@ -0,0 +1,112 @@
+import os
+import re
+from sqlalchemy import text, inspect, bindparam
+from sqlalchemy.orm import Session
+from .. import models
+
+# Full-text search over emails backed by an SQLite FTS5 external-content table. Triggers
+# on `emails` keep the index in sync with every insert/update/delete, so ingestion needs
+# no extra step. Other databases fall back to a (slow) LIKE scan.
+#
+# bm25 ranking costs time proportional to the number of matches, so only the most
+# recent SEARCH_RANK_CANDIDATES matches (cheap to find in rowid order) are ranked.
+# That keeps common-term queries fast on large mailboxes and favours recent mail.
+
+SEARCH_RANK_CANDIDATES = int(os.getenv("SEARCH_RANK_CANDIDATES", "5000"))
+
+FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS emails_fts USING fts5("
+    "subject, body, sender, content='emails', content_rowid='id', tokenize='porter unicode61')",
+    "CREATE TRIGGER IF NOT EXISTS emails_fts_ai AFTER INSERT ON emails BEGIN "
+    "INSERT INTO emails_fts(rowid, subject, body, sender) VALUES (new.id, new.subject, new.body, new.sender); END",
+    "CREATE TRIGGER IF NOT EXISTS emails_fts_ad AFTER DELETE ON emails BEGIN "
+    "INSERT INTO emails_fts(emails_fts, rowid, subject, body, sender) VALUES ('delete', old.id, old.subject, old.body, old.sender); END",
+    # Only re-index when searchable columns change, not on category/is_read updates
+    "CREATE TRIGGER IF NOT EXISTS emails_fts_au AFTER UPDATE OF subject, body, sender ON emails BEGIN "
+    "INSERT INTO emails_fts(emails_fts, rowid, subject, body, sender) VALUES ('delete', old.id, old.subject, old.body, old.sender); "
+    "INSERT INTO emails_fts(rowid, subject, body, sender) VALUES (new.id, new.subject, new.body, new.sender); END",
+]
+
+# bm25 column weights: subject, body, sender (stored as the table's default `rank`)
+RANK_CONFIG = "INSERT INTO emails_fts(emails_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0, 5.0)')"
+
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def fts_available(bind) -> bool:
+    return bind.dialect.name == "sqlite"
+
+
+def install(engine):
+    if not fts_available(engine):
+        return
+    existed = inspect(engine).has_table("emails_fts")
+    with engine.begin() as conn:
+        for statement in FTS_DDL:
+            conn.execute(text(statement))
+        if not existed:
+            conn.execute(text(RANK_CONFIG))
+            # Index rows that were inserted before the triggers existed
+            conn.execute(text("INSERT INTO emails_fts(emails_fts) VALUES ('rebuild')"))
+
+
+def to_match_query(query: str, any_term: bool = False, prefix: bool = False) -> str:
+    # Free text -> FTS5 query: every term must match (or any, ranked by bm25). With
+    # prefix the last term also matches as a prefix, for search-as-you-type; it is
+    # noticeably slower on common terms so it is opt-in.
+    terms = _TERM_RE.findall(query)
+    if not terms:
+        return ""
+    quoted = [f'"{t}"' for t in terms]
+    if prefix:
+        quoted[-1] += "*"
+    return (" OR " if any_term else " ").join(quoted)
+
+
+def search_emails(db: Session, query: str, limit: int = 20, offset: int = 0, category: str = None,
+                  any_term: bool = False, prefix: bool = False):
+    match = to_match_query(query, any_term, prefix)
+    if not match:
+        return []
+
+    if not fts_available(db.get_bind()):
+        like = f"%{query}%"
+        q = db.query(models.Email).filter(models.Email.subject.ilike(like) | models.Email.body.ilike(like))
+        if category:
+            q = q.filter(models.Email.category == category)
+        rows = q.order_by(models.Email.timestamp.desc()).offset(offset).limit(limit).all()
+        return [
+            {"id": e.id, "sender": e.sender, "subject": e.subject, "timestamp": e.timestamp,
+             "category": e.category, "snippet": (e.body or "")[:200], "rank": 0.0}
+            for e in rows
+        ]
+
+    category_join = " JOIN emails e ON e.id = emails_fts.rowid AND e.category = :category" if category else ""
+    params = {"match": match, "limit": limit, "offset": offset, "cap": SEARCH_RANK_CANDIDATES - 1}
+    if category:
+        params["category"] = category
+
+    # Oldest rowid among the most recent candidates; None means fewer matches than the cap
+    min_rowid = db.execute(text(
+        "SELECT emails_fts.rowid FROM emails_fts" + category_join
+        + " WHERE emails_fts MATCH :match ORDER BY emails_fts.rowid DESC LIMIT 1 OFFSET :cap"
+    ), params).scalar()
+    params["min_rowid"] = min_rowid or 0
+
+    # Rank only the candidates, then fetch rows and snippets for the page alone
+    ranked = db.execute(text(
+        "SELECT emails_fts.rowid, emails_fts.rank FROM emails_fts" + category_join
+        + " WHERE emails_fts MATCH :match AND emails_fts.rowid >= :min_rowid"
+        " ORDER BY emails_fts.rank LIMIT :limit OFFSET :offset"
+    ), params).all()
+    if not ranked:
+        return []
+
+    details = db.execute(text(
+        "SELECT e.id, e.sender, e.subject, e.timestamp, e.category, "
+        "snippet(emails_fts, 1, '[', ']', '…', 16) AS snippet "
+        "FROM emails_fts JOIN emails e ON e.id = emails_fts.rowid "
+        "WHERE emails_fts MATCH :match AND emails_fts.rowid IN :ids"
+    ).bindparams(bindparam("ids", expanding=True)), {"match": match, "ids": [row[0] for row in ranked]})
+    by_id = {row.id: dict(row._mapping) for row in details}
+    return [{**by_id[rowid], "rank": rank} for rowid, rank in ranked if rowid in by_id]
@@ -0,0 +1,248 @@
+import base64
+import calendar
+import json
+import re
+import sys
+from datetime import date, datetime, timedelta
+from sqlalchemy import and_, exists, func, or_, tuple_
+from sqlalchemy.orm import Session
+from .. import models
+
+# Action items live in their own table (models.ActionItem) so task queries never load
+# or parse email bodies. Email.action_items keeps the raw JSON list as a compatibility
+# view; set_action_items() writes both. Deadlines are normalized to a date relative to
+# the email's timestamp when the LLM's wording allows ("2025-03-14", "Oct 3", "Friday",
+# "tomorrow", "end of month"...), and the original text is kept in deadline_text.
+# Placeholders for no deadline ("None", "N/A", "TBD"...) are stored as NULL.
+
+BACKFILL_BATCH = 500
+
+_WEEKDAYS = {name.lower(): i for i, name in enumerate(calendar.day_name)}
+_WEEKDAYS.update({name.lower(): i for i, name in enumerate(calendar.day_abbr)})
+_MONTHS = {name.lower(): i for i, name in enumerate(calendar.month_name) if name}
+_MONTHS.update({name.lower(): i for i, name in enumerate(calendar.month_abbr) if name})
+_MONTHS["sept"] = 9
+
+_NO_DEADLINE = {"", "none", "null", "n/a", "na", "no deadline", "not specified", "unspecified", "tbd", "unknown"}
+_ISO_RE = re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b")
+_SLASH_RE = re.compile(r"\b(\d{1,2})/(\d{1,2})(?:/(\d{2,4}))?\b")
+_MONTH_DAY_RE = re.compile(r"\b([a-z]{3,9})\.?\s+(\d{1,2})(?:st|nd|rd|th)?(?:,?\s+(\d{4}))?\b")
+_DAY_MONTH_RE = re.compile(r"\b(\d{1,2})(?:st|nd|rd|th)?\s+(?:of\s+)?([a-z]{3,9})\.?(?:,?\s+(\d{4}))?\b")
+_IN_RE = re.compile(r"\bin\s+(\d+|a|one|two|three)\s+(day|week)s?\b")
+_WEEKDAY_RE = re.compile(r"\b(next\s+)?(" + "|".join(sorted(_WEEKDAYS, key=len, reverse=True)) + r")\b")
+_NUMBER_WORDS = {"a": 1, "one": 1, "two": 2, "three": 3}
+
+
+def _date(year: int, month: int, day: int):
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None
+
+
+def _upcoming(month: int, day: int, year, today: date):
+    # A date without a year is the next one on or after the email was received
+    if year:
+        return _date(int(year) + (2000 if int(year) < 100 else 0), month, day)
+    found = _date(today.year, month, day)
+    if found and found < today - timedelta(days=7):
+        found = _date(today.year + 1, month, day)
+    return found
+
+
+def parse_deadline(text, reference: datetime = None):
+    # Normalizes a free-form deadline to a date, or None when it names no date
+    if not isinstance(text, str):
+        return None
+    value = text.strip().lower()
+    if value in _NO_DEADLINE:
+        return None
+    today = (reference or datetime.utcnow()).date()
+
+    match = _ISO_RE.search(value)
+    if match:
+        return _date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+    match = _SLASH_RE.search(value)
+    if match:
+        # US order (month/day) like the mail this app is demoed with
+        return _upcoming(int(match.group(1)), int(match.group(2)), match.group(3), today)
+    for pattern, month_group, day_group in ((_MONTH_DAY_RE, 1, 2), (_DAY_MONTH_RE, 2, 1)):
+        for match in pattern.finditer(value):
+            month = _MONTHS.get(match.group(month_group))
+            if month:
+                return _upcoming(month, int(match.group(day_group)), match.group(3), today)
+
+    if "tomorrow" in value:
+        return today + timedelta(days=1)
+    if re.search(r"\b(today|tonight|eod|end of (the )?day|asap)\b", value):
+        return today
+    match = _IN_RE.search(value)
+    if match:
+        count = _NUMBER_WORDS.get(match.group(1)) or int(match.group(1))
+        return today + timedelta(days=count * (7 if match.group(2) == "week" else 1))
+    if re.search(r"\b(end of (the )?week|eow|this week)\b", value):
+        return today + timedelta(days=(4 - today.weekday()) % 7)
+    if "next week" in value:
+        return today + timedelta(days=7 - today.weekday())
+    if re.search(r"\b(end of (the )?month|eom)\b", value):
+        return date(today.year, today.month, calendar.monthrange(today.year, today.month)[1])
+    match = _WEEKDAY_RE.search(value)
+    if match:
+        ahead = (_WEEKDAYS[match.group(2)] - today.weekday()) % 7
+        if match.group(1) and ahead == 0:
+            ahead = 7
+        return today + timedelta(days=ahead)
+    return None
+
+
+def parse_items(text: str):
+    # [(task, deadline_text)] from the stored JSON list; malformed entries are skipped
+    try:
+        raw = json.loads(text or "[]")
+    except (TypeError, ValueError):
+        return []
+    if not isinstance(raw, list):
+        return []
+    items = []
+    for entry in raw:
+        if isinstance(entry, dict):
+            task = entry.get("task") or entry.get("action") or entry.get("description")
+            deadline = entry.get("deadline") or entry.get("due")
+        else:
+            task, deadline = entry, None
+        if deadline is not None:
+            deadline = str(deadline).strip()
+            if deadline.lower() in _NO_DEADLINE:
+                deadline = None
+        if isinstance(task, str) and task.strip():
+            items.append((task.strip(), deadline))
+    return items
+
+
+def set_action_items(email, text: str):
+    # Stores the JSON list and replaces the email's ActionItem rows (the caller commits).
+    # Tasks that survive a re-extraction keep their status.
+    email.action_items = text
+    items = parse_items(text)
+    if [(item.task, item.deadline_text) for item in email.tasks] == items:
+        return
+    previous = {item.task: item.status for item in email.tasks}
+    email.tasks = [
+        models.ActionItem(
+            task=task,
+            deadline=parse_deadline(deadline, email.timestamp),
+            deadline_text=deadline,
+            status=previous.get(task, "open"),
+            position=position,
+        )
+        for position, (task, deadline) in enumerate(items)
+    ]
+
+
+def encode_cursor(item) -> str:
+    raw = f"{item.deadline.isoformat() if item.deadline else ''}|{item.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    try:
+        deadline, item_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return (date.fromisoformat(deadline) if deadline else None), int(item_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def _task_query(db: Session):
+    # Only the email's subject, sender and category are read, never its body
+    return db.query(models.ActionItem, models.Email.subject, models.Email.sender, models.Email.category).join(
+        models.Email, models.Email.id == models.ActionItem.email_id
+    )
+
+
+def _task_dict(row) -> dict:
+    task, subject, sender, category = row
+    return {
+        "id": task.id, "email_id": task.email_id, "task": task.task, "deadline": task.deadline,
+        "deadline_text": task.deadline_text, "status": task.status,
+        "email_subject": subject, "email_sender": sender, "email_category": category,
+    }
+
+
+def get_task(db: Session, task_id: int):
+    row = _task_query(db).filter(models.ActionItem.id == task_id).first()
+    return _task_dict(row) if row else None
+
+
+def list_tasks(db: Session, limit: int = 100, cursor: str = None, status: str = None, due_from: date = None,
+               due_to: date = None, email_id: int = None, category: str = None):
+    # Returns (tasks, next_cursor), ordered by deadline (undated last) then id
+    limit = max(1, limit)
+    item = models.ActionItem
+    query = _task_query(db)
+    if status is not None:
+        query = query.filter(item.status == status)
+    if due_from is not None:
+        query = query.filter(item.deadline >= due_from)
+    if due_to is not None:
+        query = query.filter(item.deadline <= due_to)
+    if email_id is not None:
+        query = query.filter(item.email_id == email_id)
+    if category is not None:
+        query = query.filter(models.Email.category == category)
+    if cursor:
+        deadline, item_id = decode_cursor(cursor)
+        if deadline is None:
+            query = query.filter(item.deadline.is_(None), item.id > item_id)
+        else:
+            query = query.filter(or_(
+                and_(item.deadline.isnot(None), tuple_(item.deadline, item.id) > (deadline, item_id)),
+                item.deadline.is_(None),
+            ))
+    query = query.order_by(item.deadline.is_(None), item.deadline, item.id)
+
+    rows = query.limit(limit + 1).all()
+    next_cursor = encode_cursor(rows[limit - 1][0]) if len(rows) > limit else None
+    return [_task_dict(row) for row in rows[:limit]], next_cursor
+
+
+def backfill(db: Session, batch_size: int = BACKFILL_BATCH) -> int:
+    # Creates rows for emails whose action items predate the action_items table
+    missing = (
+        db.query(models.Email.id)
+        .filter(models.Email.action_items.isnot(None), models.Email.action_items.notin_(["", "[]"]))
+        .filter(~exists().where(models.ActionItem.email_id == models.Email.id))
+        .order_by(models.Email.id)
+    )
+    ids = [email_id for (email_id,) in missing]
+    for start in range(0, len(ids), batch_size):
+        emails = db.query(models.Email).filter(models.Email.id.in_(ids[start:start + batch_size])).all()
+        for email in emails:
+            set_action_items(email, email.action_items)
+        db.commit()
+    return len(ids)
+
+
+def clear_placeholder_deadlines(db: Session) -> int:
+    # NULLs the deadline_text of rows stored before placeholders were normalized
+    cleared = (
+        db.query(models.ActionItem)
+        .filter(func.lower(func.trim(models.ActionItem.deadline_text)).in_(sorted(_NO_DEADLINE)))
+        .update({models.ActionItem.deadline_text: None}, synchronize_session=False)
+    )
+    db.commit()
+    return cleared
+
+
+if __name__ == "__main__":
+    # python -m backend.services.tasks backfill
+    if sys.argv[1:] != ["backfill"]:
+        print("usage: python -m backend.services.tasks backfill")
+        sys.exit(1)
+    from ..database import SessionLocal, engine
+    from .. import migrations
+    migrations.migrate(engine)
+    db = SessionLocal()
+    try:
+        print({"emails": backfill(db), "placeholder_deadlines": clear_placeholder_deadlines(db)})
+    finally:
+        db.close()
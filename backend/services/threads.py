@@ -0,0 +1,371 @@
+import base64
+import os
+import re
+import sys
+from datetime import datetime, timedelta
+from sqlalchemy import exists, insert, or_, select, tuple_, update
+from sqlalchemy.orm import Session, aliased, object_session
+from .. import models
+from . import preprocess
+
+# Conversation threads, maintained incrementally: every email without a thread is
+# attached to one as it arrives (index_emails). A reply joins the thread of the
+# nearest message it names in In-Reply-To / References. Without usable headers, a
+# "Re:"/"Fwd:" email joins a thread with the same normalized subject that shares a
+# participant and was active in the last THREAD_SUBJECT_WINDOW_DAYS. When a message
+# arrives after replies to it were already threaded, their threads are merged into it.
+#
+# Ingestion works per thread: only the newest message of a thread is sent to the LLM,
+# with the earlier messages as context (history()), and the older messages take the
+# category it gets (inherit()).
+
+THREAD_INDEX_BATCH = int(os.getenv("THREAD_INDEX_BATCH", "1000"))
+THREAD_SUBJECT_WINDOW_DAYS = int(os.getenv("THREAD_SUBJECT_WINDOW_DAYS", "30"))
+# Earlier messages included in the newest message's prompts, and their token budget
+THREAD_CONTEXT_MESSAGES = int(os.getenv("THREAD_CONTEXT_MESSAGES", "3"))
+THREAD_CONTEXT_TOKENS = int(os.getenv("THREAD_CONTEXT_TOKENS", "600"))
+
+MAX_PARTICIPANTS = 50
+# SQLite's bound parameter limit is far above this on current versions
+_IN_CHUNK = 500
+
+_REPLY_PREFIX_RE = re.compile(r"^\s*(re|fwd?|aw|wg|sv|antw|rif|tr)\s*(\[\d+\])?\s*:\s*", re.IGNORECASE)
+_TAG_PREFIX_RE = re.compile(r"^\s*\[[^\]]*\]\s*")
+_SPACES_RE = re.compile(r"\s+")
+
+
+def normalize_subject(subject: str):
+    # -> (key, is_reply): "Re: [team] Fwd: Budget  Q3" -> ("budget q3", True)
+    text, is_reply = subject or "", False
+    while True:
+        match = _REPLY_PREFIX_RE.match(text)
+        if match:
+            is_reply = True
+        else:
+            match = _TAG_PREFIX_RE.match(text)
+        if not match:
+            break
+        text = text[match.end():]
+    return _SPACES_RE.sub(" ", text).strip().lower(), is_reply
+
+
+def participants(email) -> set:
+    found = set((email.recipients or "").split())
+    if email.sender:
+        found.add(email.sender.lower())
+    return found
+
+
+def _references(email) -> list:
+    # Referenced Message-IDs, nearest ancestor first
+    ids = (email.references or "").split()
+    if email.in_reply_to:
+        ids.append(email.in_reply_to)
+    return list(dict.fromkeys(reversed(ids)))
+
+
+# Columns the index reads; whole rows (bodies included) are never loaded for it
+_INDEX_COLUMNS = (
+    models.Email.id, models.Email.timestamp, models.Email.sender, models.Email.subject,
+    models.Email.recipients, models.Email.message_id, models.Email.in_reply_to, models.Email.references,
+)
+
+
+def _when(email):
+    return email.timestamp or datetime.utcnow()
+
+
+def is_latest():
+    # SQL condition: the email is the newest message of its thread (or not threaded yet)
+    return or_(
+        models.Email.thread_id.is_(None),
+        exists().where(models.Thread.id == models.Email.thread_id, models.Thread.last_email_id == models.Email.id),
+    )
+
+
+class _Thread:
+    # A thread's row while a batch is indexed; written back in bulk at the end
+    _COLUMNS = ("subject", "subject_key", "participants", "message_count", "first_timestamp",
+                "last_timestamp", "last_email_id")
+    __slots__ = ("id", "changed") + _COLUMNS
+
+    def __init__(self, id=None, participants="", message_count=0, **values):
+        self.id = id
+        self.changed = id is None
+        self.participants = set(participants.split()) if isinstance(participants, str) else participants
+        self.message_count = message_count or 0
+        for name in ("subject", "subject_key", "first_timestamp", "last_timestamp", "last_email_id"):
+            setattr(self, name, values.get(name))
+
+    def add(self, email):
+        when = _when(email)
+        self.message_count += 1
+        if self.first_timestamp is None or when < self.first_timestamp:
+            self.first_timestamp = when
+            self.subject = email.subject
+        if self.last_email_id is None or (when, email.id) > (self.last_timestamp, self.last_email_id):
+            self.last_timestamp = when
+            self.last_email_id = email.id
+        self.participants |= participants(email)
+        self.changed = True
+
+    def absorb(self, other):
+        self.message_count += other.message_count
+        if other.first_timestamp < self.first_timestamp:
+            self.first_timestamp = other.first_timestamp
+            self.subject = other.subject
+        if (other.last_timestamp, other.last_email_id) > (self.last_timestamp, self.last_email_id):
+            self.last_timestamp = other.last_timestamp
+            self.last_email_id = other.last_email_id
+        self.participants |= other.participants
+        self.changed = True
+
+    def row(self) -> dict:
+        values = {name: getattr(self, name) for name in self._COLUMNS}
+        values["participants"] = " ".join(sorted(self.participants)[:MAX_PARTICIPANTS])
+        return values
+
+
+class _Batch:
+    def __init__(self, db: Session):
+        self.db = db
+        self.loaded = {}  # thread id -> _Thread
+        self.created = {}  # subject key -> [_Thread] new in this batch
+        self.merged = {}  # dropped _Thread -> the one it was merged into
+        self.deleted = []
+
+    def load(self, thread_ids):
+        missing = [thread_id for thread_id in set(thread_ids) if thread_id not in self.loaded]
+        for start in range(0, len(missing), _IN_CHUNK):
+            for row in self.db.query(models.Thread.id, *[getattr(models.Thread, name) for name in _Thread._COLUMNS]).filter(
+                models.Thread.id.in_(missing[start:start + _IN_CHUNK])
+            ):
+                self.loaded[row.id] = _Thread(**row._asdict())
+
+    def resolve(self, thread):
+        while thread in self.merged:
+            thread = self.merged[thread]
+        return thread
+
+    def new(self, email):
+        key, _ = normalize_subject(email.subject)
+        thread = _Thread(subject=email.subject, subject_key=key)
+        self.created.setdefault(key, []).append(thread)
+        return thread
+
+    def merge(self, a, b):
+        # One conversation after all; a stored thread survives over a new one
+        survivor, dropped = (b, a) if a.id is None and b.id is not None else (a, b)
+        if dropped.id is not None:
+            self.db.query(models.Email).filter(models.Email.thread_id == dropped.id).update(
+                {models.Email.thread_id: survivor.id}, synchronize_session=False
+            )
+            self.deleted.append(dropped.id)
+        survivor.absorb(dropped)
+        self.merged[dropped] = survivor
+        return survivor
+
+    def by_subject(self, email):
+        key, is_reply = normalize_subject(email.subject)
+        if not is_reply or not key:
+            return None
+        people = participants(email)
+        since = _when(email) - timedelta(days=THREAD_SUBJECT_WINDOW_DAYS)
+        stored = [
+            thread_id for (thread_id,) in self.db.query(models.Thread.id)
+            .filter(models.Thread.subject_key == key, models.Thread.last_timestamp >= since)
+            .order_by(models.Thread.last_timestamp.desc())
+            .limit(10)
+        ]
+        self.load(stored)
+        for thread in map(self.resolve, self.created.get(key, []) + [self.loaded[thread_id] for thread_id in stored]):
+            # Threads created earlier in this batch are held to the same window
+            if people & thread.participants and thread.last_timestamp >= since:
+                return thread
+        return None
+
+    def save(self, assigned: dict):
+        threads = {self.resolve(thread) for thread in assigned.values()}
+        new = [thread for thread in threads if thread.id is None]
+        if new:
+            ids = self.db.execute(
+                insert(models.Thread).returning(models.Thread.id, sort_by_parameter_order=True),
+                [thread.row() for thread in new],
+            ).scalars().all()
+            for thread, thread_id in zip(new, ids):
+                thread.id = thread_id
+        changed = [{"id": thread.id, **thread.row()} for thread in threads if thread not in new and thread.changed]
+        if changed:
+            self.db.execute(update(models.Thread), changed)
+        if self.deleted:
+            self.db.query(models.Thread).filter(models.Thread.id.in_(self.deleted)).delete(synchronize_session=False)
+        self.db.execute(update(models.Email), [
+            {"id": email_id, "thread_id": self.resolve(thread).id} for email_id, thread in assigned.items()
+        ])
+        return [thread.id for thread in threads]
+
+
+def _index_batch(db: Session, pending) -> list:
+    # Threads one batch of emails; returns the ids of the threads it touched
+    batch = _Batch(db)
+    # Threads of the already indexed messages this batch refers to, and of already
+    # indexed replies to messages in this batch (replies that arrived first)
+    references, children = {}, {}
+    wanted = list({ref for email in pending for ref in _references(email)})
+    for start in range(0, len(wanted), _IN_CHUNK):
+        references.update(db.query(models.Email.message_id, models.Email.thread_id).filter(
+            models.Email.message_id.in_(wanted[start:start + _IN_CHUNK]), models.Email.thread_id.isnot(None)
+        ))
+    own = [email.message_id for email in pending if email.message_id]
+    for start in range(0, len(own), _IN_CHUNK):
+        for parent, thread_id in db.query(models.Email.in_reply_to, models.Email.thread_id).filter(
+            models.Email.in_reply_to.in_(own[start:start + _IN_CHUNK]), models.Email.thread_id.isnot(None)
+        ).distinct():
+            children.setdefault(parent, []).append(thread_id)
+    batch.load(list(references.values()) + [thread_id for ids in children.values() for thread_id in ids])
+    known = {message_id: batch.loaded[thread_id] for message_id, thread_id in references.items()}
+    children = {parent: [batch.loaded[thread_id] for thread_id in ids] for parent, ids in children.items()}
+
+    assigned = {}
+    for email in pending:
+        thread = next((batch.resolve(known[ref]) for ref in _references(email) if ref in known), None)
+        thread = thread or batch.by_subject(email) or batch.new(email)
+        thread.add(email)
+        assigned[email.id] = thread
+        if email.message_id:
+            for child in children.pop(email.message_id, []):
+                child = batch.resolve(child)
+                if child is not thread:
+                    thread = batch.merge(thread, child)
+            known[email.message_id] = thread
+        if email.in_reply_to and email.in_reply_to not in known:
+            children.setdefault(email.in_reply_to, []).append(thread)
+    return batch.save(assigned)
+
+
+def index_emails(db: Session, batch_size: int = None) -> int:
+    # Threads every email that has no thread yet, oldest first; the caller commits.
+    # Returns the number of emails indexed.
+    batch_size = batch_size or THREAD_INDEX_BATCH
+    total = 0
+    while True:
+        pending = (
+            db.query(*_INDEX_COLUMNS)
+            .filter(models.Email.thread_id.is_(None))
+            .order_by(models.Email.timestamp, models.Email.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not pending:
+            return total
+        touched = _index_batch(db, pending)
+        # A late-arriving older message takes the category its thread already has
+        inherit(db, touched)
+        total += len(pending)
+
+
+def inherit(db: Session, thread_ids) -> int:
+    # Gives the still Uncategorized older messages of these threads the category of
+    # the thread's newest message, once that one is processed. The caller commits.
+    ids = [thread_id for thread_id in set(thread_ids) if thread_id is not None]
+    if not ids:
+        return 0
+    # The newest messages' categories may still be pending in the session
+    db.flush()
+    last = aliased(models.Email)
+    category = (
+        select(last.category)
+        .join(models.Thread, models.Thread.last_email_id == last.id)
+        .where(models.Thread.id == models.Email.thread_id)
+        .scalar_subquery()
+    )
+    updated = 0
+    for start in range(0, len(ids), _IN_CHUNK):
+        updated += db.query(models.Email).filter(
+            models.Email.thread_id.in_(ids[start:start + _IN_CHUNK]),
+            models.Email.category == "Uncategorized",
+            category != "Uncategorized",
+        ).update({models.Email.category: category}, synchronize_session=False)
+    return updated
+
+
+def history(email) -> str:
+    # The messages before `email` in its thread, oldest first, within THREAD_CONTEXT_TOKENS
+    thread = email.thread
+    if THREAD_CONTEXT_MESSAGES <= 0 or thread is None or (thread.message_count or 0) < 2:
+        return ""
+    earlier = (
+        object_session(email).query(models.Email)
+        .filter(
+            models.Email.thread_id == thread.id,
+            tuple_(models.Email.timestamp, models.Email.id) < (email.timestamp, email.id),
+        )
+        .order_by(models.Email.timestamp.desc(), models.Email.id.desc())
+        .limit(THREAD_CONTEXT_MESSAGES)
+        .all()
+    )
+    if not earlier:
+        return ""
+    budget = max(1, THREAD_CONTEXT_TOKENS // len(earlier))
+    return "\n".join(
+        f"From {message.sender}: {preprocess.truncate_tokens(preprocess.clean_body(message), budget)}"
+        for message in reversed(earlier)
+    )
+
+
+def encode_cursor(thread) -> str:
+    raw = f"{thread.last_timestamp.isoformat()}|{thread.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    try:
+        timestamp, thread_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(timestamp), int(thread_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def _thread_dict(row) -> dict:
+    thread, sender, category, is_read = row
+    return {
+        "id": thread.id, "subject": thread.subject, "participants": (thread.participants or "").split(),
+        "message_count": thread.message_count, "first_timestamp": thread.first_timestamp,
+        "last_timestamp": thread.last_timestamp, "last_email_id": thread.last_email_id,
+        "last_sender": sender, "category": category, "is_read": is_read,
+    }
+
+
+def list_threads(db: Session, limit: int = 100, cursor: str = None, category: str = None):
+    # Returns (threads, next_cursor), most recently active first. category and is_read
+    # are those of the newest message.
+    limit = max(1, limit)
+    query = db.query(models.Thread, models.Email.sender, models.Email.category, models.Email.is_read).join(
+        models.Email, models.Email.id == models.Thread.last_email_id
+    )
+    if category is not None:
+        query = query.filter(models.Email.category == category)
+    if cursor:
+        timestamp, thread_id = decode_cursor(cursor)
+        query = query.filter(tuple_(models.Thread.last_timestamp, models.Thread.id) < (timestamp, thread_id))
+    query = query.order_by(models.Thread.last_timestamp.desc(), models.Thread.id.desc())
+
+    rows = query.limit(limit + 1).all()
+    next_cursor = encode_cursor(rows[limit - 1][0]) if len(rows) > limit else None
+    return [_thread_dict(row) for row in rows[:limit]], next_cursor
+
+
+if __name__ == "__main__":
+    # python -m backend.services.threads index
+    if sys.argv[1:] != ["index"]:
+        print("usage: python -m backend.services.threads index")
+        sys.exit(1)
+    from ..database import SessionLocal, engine
+    from .. import migrations
+    migrations.migrate(engine)
+    db = SessionLocal()
+    try:
+        print({"emails": index_emails(db)})
+        db.commit()
+    finally:
+        db.close()
@@ -0,0 +1,284 @@
+import logging
+import os
+import re
+import threading
+import zlib
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from .. import database, models
+
+# Embedding index over email bodies for /chat retrieval. Vectors live in one float32
+# matrix searched by brute-force dot product; above VECTOR_IVF_MIN rows an optional
+# IVF (k-means buckets) structure narrows the scan. The index is persisted to
+# VECTOR_INDEX_PATH and synced incrementally: only emails newer than the last indexed
+# id are embedded. Syncing runs where emails arrive (mock ingest, ingest jobs, the
+# importer) or in the background; retrieval never embeds or saves.
+
+VECTOR_INDEX_PATH = os.getenv("VECTOR_INDEX_PATH", "./vector_index.npz")
+VECTOR_DIM = int(os.getenv("VECTOR_DIM", "256"))
+VECTOR_ANN = os.getenv("VECTOR_ANN", "")  # "" (brute force) | "ivf"
+VECTOR_IVF_MIN = int(os.getenv("VECTOR_IVF_MIN", "50000"))
+VECTOR_IVF_PROBES = int(os.getenv("VECTOR_IVF_PROBES", "8"))
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def hashing_embedder(texts, dim: int = VECTOR_DIM) -> np.ndarray:
+    # Local, dependency-free embedding: signed feature hashing of unigrams and bigrams
+    out = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        tokens = _TOKEN_RE.findall((text or "").lower())
+        for feature in tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]:
+            h = zlib.crc32(feature.encode("utf-8"))
+            out[row, h % dim] += 1.0 if h & 0x80000000 else -1.0
+    norms = np.linalg.norm(out, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return out / norms
+
+
+_embedder = None
+_embedder_name = None
+_embedder_dim = None
+
+
+def set_embedder(fn, name: str, dim: int):
+    # fn(list[str]) -> (n, dim) float32 array of unit vectors. The name is stored with
+    # the persisted index so switching embedders triggers a rebuild.
+    global _embedder, _embedder_name, _embedder_dim, _index
+    _embedder, _embedder_name, _embedder_dim = fn, name, dim
+    _index = None
+
+
+def _default_embedder():
+    # EMBEDDING_MODEL=<sentence-transformers model> uses a local neural model instead
+    model_name = os.getenv("EMBEDDING_MODEL")
+    if model_name:
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(model_name)
+        set_embedder(
+            lambda texts: model.encode(texts, normalize_embeddings=True).astype(np.float32),
+            f"st:{model_name}",
+            model.get_sentence_embedding_dimension(),
+        )
+    else:
+        set_embedder(hashing_embedder, f"hashing:{VECTOR_DIM}", VECTOR_DIM)
+
+
+def embed(texts) -> np.ndarray:
+    if _embedder is None:
+        _default_embedder()
+    return _embedder(list(texts))
+
+
+def embedding_dim() -> int:
+    if _embedder is None:
+        _default_embedder()
+    return _embedder_dim
+
+
+def email_text(email) -> str:
+    return f"{email.subject or ''}\n{email.body or ''}"
+
+
+class VectorIndex:
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.size = 0
+        self.centroids = None
+        self.assignments = None
+
+    def add(self, ids, vectors: np.ndarray):
+        n = len(ids)
+        if self.size + n > len(self.ids):
+            # Grow geometrically so incremental adds stay amortised O(1)
+            capacity = max(self.size + n, 2 * len(self.ids), 1024)
+            self.ids = np.resize(self.ids, capacity)
+            grown = np.zeros((capacity, self.dim), dtype=np.float32)
+            grown[:self.size] = self.vectors[:self.size]
+            self.vectors = grown
+        self.ids[self.size:self.size + n] = ids
+        self.vectors[self.size:self.size + n] = vectors
+        self.size += n
+        if self.centroids is not None:
+            new = self._assign(vectors)
+            self.assignments = np.concatenate([self.assignments[:self.size - n], new])
+
+    def max_id(self) -> int:
+        return int(self.ids[:self.size].max()) if self.size else 0
+
+    def build_ivf(self, nlist: int = None, iterations: int = 10, seed: int = 0):
+        if self.size == 0:
+            return
+        nlist = nlist or max(1, int(np.sqrt(self.size)))
+        rng = np.random.default_rng(seed)
+        data = self.vectors[:self.size]
+        centroids = data[rng.choice(self.size, size=min(nlist, self.size), replace=False)].copy()
+        for _ in range(iterations):
+            assignments = np.argmax(data @ centroids.T, axis=1)
+            for c in range(len(centroids)):
+                members = data[assignments == c]
+                if len(members):
+                    mean = members.mean(axis=0)
+                    centroids[c] = mean / (np.linalg.norm(mean) or 1.0)
+        self.centroids = centroids
+        self.assignments = self._assign(data)
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        return np.argmax(vectors @ self.centroids.T, axis=1)
+
+    def search(self, query: np.ndarray, k: int = 5, probes: int = VECTOR_IVF_PROBES):
+        if self.size == 0:
+            return []
+        if self.centroids is not None:
+            lists = np.argsort(-(self.centroids @ query))[:probes]
+            candidates = np.nonzero(np.isin(self.assignments, lists))[0]
+            if len(candidates) == 0:
+                return []
+            scores = self.vectors[candidates] @ query
+        else:
+            candidates = None
+            scores = self.vectors[:self.size] @ query
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        rows = top if candidates is None else candidates[top]
+        return [(int(self.ids[row]), float(scores[i])) for row, i in zip(rows, top)]
+
+    def save(self, path: str):
+        np.savez(path, ids=self.ids[:self.size], vectors=self.vectors[:self.size],
+                 embedder=np.array(_embedder_name))
+
+    @classmethod
+    def load(cls, path: str):
+        data = np.load(path)
+        if str(data["embedder"]) != _embedder_name:
+            return None
+        index = cls(data["vectors"].shape[1])
+        index.add(data["ids"], data["vectors"])
+        if VECTOR_ANN == "ivf" and index.size >= VECTOR_IVF_MIN:
+            index.build_ivf()
+        return index
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def get_index() -> VectorIndex:
+    global _index
+    if _index is None:
+        dim = embedding_dim()
+        if os.path.exists(VECTOR_INDEX_PATH):
+            _index = VectorIndex.load(VECTOR_INDEX_PATH)
+        if _index is None:
+            _index = VectorIndex(dim)
+    return _index
+
+
+def sync(db: Session, batch_size: int = 2000) -> int:
+    # Embed emails added since the last sync; returns the number of new vectors.
+    # _lock only guards the index itself: under the async API a session query hands
+    # the thread back to the event loop, and a request waiting on the lock meanwhile
+    # would stall the loop. Concurrent syncs may embed the same rows, only one adds them.
+    global _index
+    newest = db.query(models.Email.id).order_by(models.Email.id.desc()).first()
+    with _lock:
+        index = get_index()
+        if newest is None or newest[0] < index.max_id():
+            # Inbox was reset, start over
+            _index = index = VectorIndex(embedding_dim())
+            if newest is None:
+                return 0
+        last_id = index.max_id()
+
+    added = 0
+    while True:
+        rows = (
+            db.query(models.Email.id, models.Email.subject, models.Email.body)
+            .filter(models.Email.id > last_id)
+            .order_by(models.Email.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            break
+        vectors = embed(email_text(r) for r in rows)
+        with _lock:
+            if _index is not index:
+                break
+            indexed = index.max_id()
+            fresh = [i for i, r in enumerate(rows) if r.id > indexed]
+            if fresh:
+                index.add([rows[i].id for i in fresh], vectors[fresh])
+                added += len(fresh)
+        last_id = rows[-1].id
+
+    if added:
+        with _lock:
+            if VECTOR_ANN == "ivf" and index.centroids is None and index.size >= VECTOR_IVF_MIN:
+                index.build_ivf()
+            index.save(VECTOR_INDEX_PATH)
+    return added
+
+
+_sync_lock = threading.Lock()
+_sync_state = {"running": False, "again": False}
+
+
+def sync_in_background():
+    # Runs sync() on a worker thread with its own session and returns at once. If a
+    # sync is already running it runs once more when done, to pick up the newest rows.
+    with _sync_lock:
+        if _sync_state["running"]:
+            _sync_state["again"] = True
+            return
+        _sync_state["running"] = True
+    threading.Thread(target=_sync_worker, name="vector-index-sync", daemon=True).start()
+
+
+def _sync_worker():
+    while True:
+        db = database.SessionLocal()
+        try:
+            sync(db)
+        except Exception:
+            logger.exception("Vector index sync failed")
+        finally:
+            db.close()
+        with _sync_lock:
+            if not _sync_state["again"]:
+                _sync_state["running"] = False
+                return
+            _sync_state["again"] = False
+
+
+def retrieve(db: Session, query: str, k: int = 8, token_budget: int = 1500):
+    # Top-k emails most similar to the query that fit in token_budget. Read-only: an
+    # index that is behind the inbox (e.g. mail imported by another process) is
+    # synced in the background, and answers use what is indexed so far.
+    from .llm_service import estimate_tokens
+    from .preprocess import clean_body
+
+    index = get_index()
+    if (db.query(func.max(models.Email.id)).scalar() or 0) != index.max_id():
+        sync_in_background()
+    hits = index.search(embed([query])[0], k)
+    if not hits:
+        return []
+    emails = {e.id: e for e in db.query(models.Email).filter(models.Email.id.in_([i for i, _ in hits]))}
+    selected, used = [], 0
+    for email_id, _score in hits:
+        email = emails.get(email_id)
+        if email is None:
+            continue
+        cost = estimate_tokens(f"{email.subject or ''}\n{clean_body(email)}")
+        if used + cost > token_budget:
+            continue
+        selected.append(email)
+        used += cost
+    return selected
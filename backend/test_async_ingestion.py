@@ -0,0 +1,182 @@
+import asyncio
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+import pytest
+from backend import models
+from backend.services import async_ingestion, fake_llm, mock_data, rate_limiter
+from backend.services.async_ingestion import process_all_emails_async
+from backend.services.rate_limiter import RateLimiter
+
+# Bodies the fake LLM's default responder answers deterministically; "ref-N" tells the
+# responder which email a prompt is about
+TODO = "Please review the attached report and send your comments. ref-{}"
+NEWSLETTER = "Top stories this week in the newsletter, unsubscribe anytime. ref-{}"
+
+
+def _stage(prompt: str) -> str:
+    lowered = prompt.lower()
+    if lowered.startswith("categorize"):
+        return "categorization"
+    if lowered.startswith("extract action"):
+        return "action_extraction"
+    if lowered.startswith("draft"):
+        return "auto_reply"
+    raise AssertionError(f"unexpected prompt: {prompt[:60]}")
+
+
+def _ref(prompt: str) -> int:
+    return int(re.search(r"ref-(\d+)", prompt).group(1))
+
+
+def recording_responder(calls: list, fail=None):
+    # Records (ref, stage) per call; raises for the (ref, stage) in `fail`
+    def respond(prompt):
+        call = (_ref(prompt), _stage(prompt))
+        calls.append(call)
+        if call == fail:
+            raise RuntimeError("provider down")
+        return fake_llm.default_responder(prompt)
+    return respond
+
+
+def add_emails(db, bodies) -> list:
+    mock_data.create_default_prompts(db)
+    start = datetime(2024, 5, 1)
+    emails = [
+        models.Email(sender=f"sender{n}@example.com", subject=f"Subject {n}", body=body.format(n),
+                     timestamp=start + timedelta(minutes=n))
+        for n, body in enumerate(bodies)
+    ]
+    db.add_all(emails)
+    db.commit()
+    return emails
+
+
+def test_runs_categorization_then_actions_then_draft(db, fake_provider):
+    calls = []
+    fake_provider(responder=recording_responder(calls))
+    emails = add_emails(db, [TODO, NEWSLETTER, TODO])
+
+    stats = asyncio.run(process_all_emails_async(db, concurrency=4))
+
+    assert stats["processed"] == 3
+    assert stats["failed"] == 0
+    assert stats["llm_calls"] == len(calls) == 8
+    for email in emails:
+        stages = [stage for ref, stage in calls if ref == emails.index(email)]
+        if email.category == "To-Do":
+            assert stages == ["categorization", "action_extraction", "auto_reply"]
+        else:
+            assert stages == ["categorization", "action_extraction"]
+
+    db.expire_all()
+    assert [email.category for email in emails] == ["To-Do", "Newsletter", "To-Do"]
+    assert all(email.category_version_id is not None for email in emails)
+    assert len(emails[0].tasks) == 1
+    drafts = db.query(models.Draft).order_by(models.Draft.email_id).all()
+    assert [draft.email_id for draft in drafts] == [emails[0].id, emails[2].id]
+
+
+@pytest.mark.parametrize("stage", ["categorization", "action_extraction", "auto_reply"])
+def test_failed_llm_call_leaves_the_email_unprocessed(db, fake_provider, stage):
+    fake_provider(responder=recording_responder([], fail=(1, stage)))
+    emails = add_emails(db, [TODO, TODO, NEWSLETTER])
+
+    stats = asyncio.run(process_all_emails_async(db, concurrency=2))
+
+    assert stats["processed"] == 2
+    assert stats["failed"] == 1
+    db.expire_all()
+    # Nothing of a failed email is written, so the next run retries it
+    failed = emails[1]
+    assert failed.category == "Uncategorized"
+    assert failed.category_version_id is None
+    assert failed.tasks == []
+    assert db.query(models.Draft).filter(models.Draft.email_id == failed.id).count() == 0
+    assert [emails[0].category, emails[2].category] == ["To-Do", "Newsletter"]
+
+
+def test_stage_queues_stay_within_queue_size(db, fake_provider):
+    fake_provider(latency=0.002)
+    add_emails(db, [TODO, NEWSLETTER] * 15)
+    depths = []
+
+    async def run():
+        async def sample():
+            while True:
+                depths.append(async_ingestion._queue_depth())
+                await asyncio.sleep(0)
+
+        sampler = asyncio.ensure_future(sample())
+        try:
+            return await process_all_emails_async(db, concurrency=2, queue_size=2)
+        finally:
+            sampler.cancel()
+
+    stats = asyncio.run(run())
+
+    assert stats["processed"] == 30
+    # The producer is held back by the full categorize queue instead of enqueueing all 30
+    assert max(depth["categorize"] for depth in depths) == 2
+    assert all(value <= 2 for depth in depths for value in depth.values())
+    assert async_ingestion._queue_depth() == {"categorize": 0, "action_extraction": 0, "auto_reply": 0}
+
+
+def test_ingestion_calls_wait_for_the_rate_limiter(db, fake_provider, monkeypatch):
+    fake_provider()
+    add_emails(db, [TODO, NEWSLETTER])
+    limiter = RateLimiter(requests_per_minute=600)
+    # Start from an empty bucket: every call waits its 0.1s turn
+    while limiter.reserve() == 0:
+        pass
+    monkeypatch.setitem(rate_limiter._rate_limiters, "fake", limiter)
+
+    started = time.monotonic()
+    stats = asyncio.run(process_all_emails_async(db, concurrency=4))
+    elapsed = time.monotonic() - started
+
+    assert stats["llm_calls"] == 5
+    # The reservation above waits 0.1s, then one more 0.1s per call
+    assert elapsed >= 0.1 * stats["llm_calls"]
+
+
+def test_rate_limiter_spaces_requests_once_the_bucket_is_empty():
+    limiter = RateLimiter(requests_per_minute=60)
+    assert [limiter.reserve() for _ in range(60)] == [0] * 60
+    assert limiter.reserve() == pytest.approx(1, abs=0.05)
+    assert limiter.reserve() == pytest.approx(2, abs=0.05)
+
+
+def test_rate_limiter_waits_for_tokens():
+    limiter = RateLimiter(tokens_per_minute=600)
+    assert limiter.reserve(600) == 0
+    assert limiter.reserve(60) == pytest.approx(6, abs=0.05)
+    # Larger than the whole bucket: waits for a full bucket, not forever
+    fresh = RateLimiter(tokens_per_minute=600)
+    assert fresh.reserve(6000) == 0
+    assert fresh.reserve(6000) == pytest.approx(60, abs=0.05)
+
+
+def test_rate_limiter_hands_out_each_slot_once_across_threads():
+    limiter = RateLimiter(requests_per_minute=60)
+    waits = []
+    lock = threading.Lock()
+
+    def worker():
+        for _ in range(25):
+            wait = limiter.reserve()
+            with lock:
+                waits.append(wait)
+
+    workers = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+    # 60 requests from the full bucket, then one per second, none handed out twice
+    waits.sort()
+    assert waits[:60] == [0] * 60
+    assert waits[60:] == pytest.approx(list(range(1, 41)), abs=0.05)
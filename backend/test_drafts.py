@@ -0,0 +1,35 @@
+from backend import models
+from backend.services import drafts
+
+
+def add_drafts(db, count: int) -> list:
+    rows = [models.Draft(subject=f"Re: {n}", body="Thanks!", status="sent" if n % 3 == 0 else "draft")
+            for n in range(count)]
+    db.add_all(rows)
+    db.commit()
+    return [row.id for row in rows]
+
+
+def test_drafts_are_unpaginated_without_a_limit_or_cursor(db, client):
+    ids = add_drafts(db, 120)
+
+    response = client.get("/drafts")
+
+    assert [draft["id"] for draft in response.json()] == ids[::-1]
+    assert "X-Next-Cursor" not in response.headers
+    sent = client.get("/drafts", params={"status": "sent"}).json()
+    assert [draft["id"] for draft in sent] == ids[117::-3]
+
+
+def test_drafts_page_with_a_limit_or_cursor(db, client, monkeypatch):
+    ids = add_drafts(db, 5)
+
+    first = client.get("/drafts", params={"limit": 2})
+    assert [draft["id"] for draft in first.json()] == [ids[4], ids[3]]
+    # A cursor alone pages by DRAFT_PAGE_SIZE
+    monkeypatch.setattr(drafts, "DRAFT_PAGE_SIZE", 2)
+    second = client.get("/drafts", params={"cursor": first.headers["X-Next-Cursor"]})
+    assert [draft["id"] for draft in second.json()] == [ids[2], ids[1]]
+    last = client.get("/drafts", params={"cursor": second.headers["X-Next-Cursor"], "limit": 2})
+    assert [draft["id"] for draft in last.json()] == [ids[0]]
+    assert "X-Next-Cursor" not in last.headers
@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta
+from backend import models
+from backend.services import email_query
+
+
+def add_emails(db, dated: int, undated: int) -> list:
+    start = datetime(2024, 5, 1)
+    emails = [
+        models.Email(sender="a@example.com", subject=f"Subject {n}", body="", category="Work",
+                     timestamp=start + timedelta(minutes=n))
+        for n in range(dated + undated)
+    ]
+    db.add_all(emails)
+    db.commit()
+    # The column default fills in a timestamp on insert, so clear it afterwards
+    undated_ids = [email.id for email in emails[dated:]]
+    db.query(models.Email).filter(models.Email.id.in_(undated_ids)).update(
+        {models.Email.timestamp: None}, synchronize_session=False
+    )
+    db.commit()
+    return emails
+
+
+def all_pages(page, limit: int) -> list:
+    ids, cursor = [], None
+    while True:
+        rows, cursor = page(limit=limit, cursor=cursor)
+        ids += [row.id if hasattr(row, "id") else row["id"] for row in rows]
+        if cursor is None:
+            return ids
+
+
+def test_undated_emails_follow_the_dated_ones_across_pages(db):
+    emails = add_emails(db, dated=5, undated=4)
+    dated = [email.id for email in reversed(emails[:5])]
+    undated = [email.id for email in reversed(emails[5:])]
+
+    for limit in (1, 2, 3, 5, 9):
+        assert all_pages(lambda **page: email_query.list_emails(db, **page), limit) == dated + undated
+        assert all_pages(lambda **page: email_query.list_email_columns(db, **page), limit) == dated + undated
+    # Filtered lists page the same way
+    assert all_pages(lambda **page: email_query.list_emails(db, category="Work", **page), 4) == dated + undated
+
+
+def test_cursor_round_trips_an_undated_email(db):
+    emails = add_emails(db, dated=1, undated=2)
+    rows, cursor = email_query.list_emails(db, limit=2)
+
+    assert [row.id for row in rows] == [emails[0].id, emails[2].id]
+    assert email_query.decode_cursor(cursor) == (None, emails[2].id)
+    rows, cursor = email_query.list_emails(db, limit=2, cursor=cursor)
+    assert ([row.id for row in rows], cursor) == ([emails[1].id], None)
+    # Offset paging orders them the same way
+    rows, _ = email_query.list_emails(db, limit=10, skip=1)
+    assert [row.id for row in rows] == [emails[2].id, emails[1].id]
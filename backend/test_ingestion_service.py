@@ -0,0 +1,26 @@
+import pytest
+from backend import models
+from backend.services import ingestion_service
+from test_async_ingestion import NEWSLETTER, TODO, add_emails, recording_responder
+
+
+@pytest.mark.parametrize("stage", ["action_extraction", "auto_reply"])
+def test_failed_later_prompt_rolls_back_the_email(db, fake_provider, stage):
+    fake_provider(responder=recording_responder([], fail=(1, stage)))
+    emails = add_emails(db, [TODO, TODO, NEWSLETTER])
+
+    stats = ingestion_service.process_all_emails(db)
+
+    assert (stats["processed"], stats["failed"]) == (2, 1)
+    db.expire_all()
+    # Categorization (and action items, when the draft failed) were applied before the
+    # failure; none of it is committed
+    failed = emails[1]
+    assert failed.category == "Uncategorized"
+    assert failed.category_version_id is None
+    assert failed.actions_version_id is None
+    assert failed.action_items == "[]"
+    assert db.query(models.ActionItem).filter(models.ActionItem.email_id == failed.id).count() == 0
+    assert db.query(models.Draft).filter(models.Draft.email_id == failed.id).count() == 0
+    assert [emails[0].category, emails[2].category] == ["To-Do", "Newsletter"]
+    assert len(emails[0].tasks) == 1
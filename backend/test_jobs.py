@@ -0,0 +1,85 @@
+import asyncio
+from datetime import datetime, timedelta
+from backend import models
+from backend.services import async_ingestion, jobs, mock_data
+
+
+def add_job(db, status="running", owner=None, heartbeat_age=None) -> models.Job:
+    heartbeat_at = datetime.utcnow() - timedelta(seconds=heartbeat_age) if heartbeat_age is not None else None
+    job = models.Job(kind="ingest", status=status, params="{}", processed=0, failed=0, owner=owner,
+                     heartbeat_at=heartbeat_at)
+    db.add(job)
+    db.commit()
+    return job
+
+
+def leased_email(db, job) -> models.Email:
+    email = models.Email(sender="a@example.com", subject="s", body="b", lease_owner=f"job:{job.id}:old",
+                         lease_expires_at=datetime.utcnow() + timedelta(seconds=5))
+    db.add(email)
+    db.commit()
+    return email
+
+
+def test_live_owner_keeps_its_job(db):
+    job = add_job(db, owner="other-replica", heartbeat_age=5)
+    email = leased_email(db, job)
+
+    assert jobs.orphaned_jobs(db) == []
+    assert not jobs.claim_job(db, job.id)
+    db.expire_all()
+    assert job.owner == "other-replica"
+    assert email.lease_owner == f"job:{job.id}:old"
+
+
+def test_stale_owner_is_taken_over_and_its_leases_released(db):
+    job = add_job(db, owner="dead-replica", heartbeat_age=jobs.JOB_STALE_SECONDS + 5)
+    email = leased_email(db, job)
+
+    assert jobs.orphaned_jobs(db) == [job.id]
+    assert jobs.claim_job(db, job.id)
+    db.expire_all()
+    assert job.owner == jobs.PROCESS_ID
+    assert email.lease_owner is None
+    # Now owned by a live process: a second claim (e.g. a duplicate submit) is refused
+    assert not jobs.claim_job(db, job.id)
+
+
+def test_unowned_jobs_are_resumable_and_finished_ones_are_not(db):
+    queued = add_job(db, status="queued")
+    add_job(db, status="completed", owner="dead-replica", heartbeat_age=jobs.JOB_STALE_SECONDS + 5)
+    assert jobs.orphaned_jobs(db) == [queued.id]
+
+
+def test_heartbeat_extends_the_jobs_email_leases(db):
+    job = add_job(db, owner=jobs.PROCESS_ID, heartbeat_age=20)
+    email = leased_email(db, job)
+
+    jobs.heartbeat(db, job.id)
+
+    db.expire_all()
+    assert (datetime.utcnow() - job.heartbeat_at).total_seconds() < 5
+    assert email.lease_expires_at > datetime.utcnow() + timedelta(seconds=jobs.JOB_LEASE_SECONDS - 5)
+
+
+def test_ingest_job_runs_every_batch_on_one_event_loop(db, fake_provider, monkeypatch):
+    fake_provider()
+    mock_data.create_default_prompts(db)
+    db.add_all([models.Email(sender=f"s{n}@example.com", subject=f"Subject {n}", body="Please review.")
+                for n in range(3)])
+    db.commit()
+    job = add_job(db, owner=jobs.PROCESS_ID, heartbeat_age=0)
+    monkeypatch.setattr(jobs, "JOB_CLAIM_BATCH", 1)
+    loops = []
+    process = async_ingestion.process_all_emails_async
+
+    async def recording(*args, **kwargs):
+        loops.append(asyncio.get_running_loop())
+        return await process(*args, **kwargs)
+
+    monkeypatch.setattr(async_ingestion, "process_all_emails_async", recording)
+    jobs._run_ingest(db, job, {})
+
+    assert len(loops) == 3
+    assert len(set(map(id, loops))) == 1
+    assert job.processed == 3
@@ -0,0 +1,106 @@
+import pytest
+from backend.services import llm_cache
+from backend.services.llm_cache import LLMCache, make_key
+
+
+class Clock:
+    # Stands in for time.time so entries age without sleeping
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm_cache.time, "time", clock)
+    return clock
+
+
+def cache(tmp_path, **options) -> LLMCache:
+    return LLMCache(path=str(tmp_path / "llm_cache.db"), **options)
+
+
+def test_keys_depend_on_provider_model_and_prompt():
+    key = make_key("groq", "llama3", "hi")
+    assert key == make_key("groq", "llama3", "hi")
+    assert len({key, make_key("gemini", "llama3", "hi"), make_key("groq", "other", "hi"),
+                make_key("groq", "llama3", "hi!")}) == 4
+
+
+def test_memory_tier_evicts_the_least_recently_used(tmp_path, clock):
+    responses = cache(tmp_path, memory_entries=2)
+    responses.set("a", "A")
+    responses.set("b", "B")
+    assert responses.get("a") == "A"
+    responses.set("c", "C")
+
+    # "b" was used least recently, so it left memory but is still served from disk
+    assert list(responses._memory) == ["a", "c"]
+    assert responses.get("b") == "B"
+    assert (responses.memory_hits, responses.disk_hits) == (1, 1)
+
+
+def test_disk_tier_evicts_the_least_recently_used_past_the_size_cap(tmp_path, clock):
+    responses = cache(tmp_path, max_entries=2)
+    responses.set("a", "A")
+    clock.now += 1
+    responses.set("b", "B")
+    clock.now += 1
+    # The hit on "a" is only batched in memory, and is written before evicting
+    assert responses.get("a") == "A"
+    clock.now += 1
+    responses.set("c", "C")
+
+    reopened = cache(tmp_path)
+    assert [reopened.get(key) for key in ("a", "b", "c")] == ["A", None, "C"]
+    assert responses.stats()["disk_entries"] == 2
+
+
+def test_entries_expire_after_the_ttl(tmp_path, clock):
+    responses = cache(tmp_path, ttl=60)
+    responses.set("a", "A")
+    clock.now += 59
+    assert responses.get("a") == "A"
+
+    clock.now += 2
+    assert responses.get("a") is None
+    # The expired row is deleted rather than served to the next process
+    assert cache(tmp_path, ttl=0).get("a") is None
+    assert responses.stats()["disk_entries"] == 0
+
+
+def test_disk_hit_is_promoted_to_memory(tmp_path, clock):
+    cache(tmp_path).set("a", "A")
+    # A new process starts with an empty memory tier over the same file
+    responses = cache(tmp_path)
+    assert responses.stats()["memory_entries"] == 0
+
+    assert responses.get("a") == "A"
+    assert responses.get("a") == "A"
+    assert (responses.disk_hits, responses.memory_hits) == (1, 1)
+    assert list(responses._memory) == ["a"]
+
+
+def test_invalidate_tag_drops_both_tiers(tmp_path, clock):
+    responses = cache(tmp_path)
+    responses.set("a", "A", tag="categorization")
+    responses.set("b", "B", tag="categorization")
+    responses.set("c", "C", tag="auto_reply")
+
+    assert responses.invalidate_tag("categorization") == 2
+    assert [responses.get(key) for key in ("a", "b", "c")] == [None, None, "C"]
+    assert [cache(tmp_path).get(key) for key in ("a", "b", "c")] == [None, None, "C"]
+    assert responses.stats()["disk_entries"] == 1
+
+
+def test_clear_empties_the_cache(tmp_path, clock):
+    responses = cache(tmp_path)
+    responses.set("a", "A", tag="categorization")
+    responses.clear()
+
+    assert responses.get("a") is None
+    assert cache(tmp_path).get("a") is None
+    assert (responses.stats()["memory_entries"], responses.stats()["disk_entries"]) == (0, 0)
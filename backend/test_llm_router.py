@@ -0,0 +1,143 @@
+import asyncio
+import time
+import pytest
+from backend.services import rate_limiter
+from backend.services.fake_llm import FakeLLM
+from backend.services.llm_router import FakeProvider, ProviderUnavailable, Router
+
+
+class Switch:
+    # Responder that fails while `down` is set, counting every call it receives
+    def __init__(self, down: bool = False):
+        self.down = down
+        self.calls = 0
+
+    def __call__(self, prompt: str) -> str:
+        self.calls += 1
+        if self.down:
+            raise RuntimeError("provider down")
+        return "ok"
+
+
+def provider(name: str, responder=None, latency: float = 0.0) -> FakeProvider:
+    return FakeProvider(name, FakeLLM(latency=latency, responder=responder or Switch()))
+
+
+def test_fails_over_to_the_next_provider():
+    primary = Switch(down=True)
+    router = Router([provider("a", primary), provider("b")], default=["a", "b"])
+
+    assert router.complete("hi").provider == "b"
+    assert asyncio.run(router.acomplete("hi")).provider == "b"
+    assert "".join(router.stream("hi")) == "ok"
+    assert primary.calls == 3
+    assert router.stats["a"].errors == 3
+    assert router.stats["b"].requests == 3
+
+
+def test_raises_when_every_provider_fails():
+    router = Router([provider("a", Switch(down=True)), provider("b", Switch(down=True))], default=["a", "b"])
+    with pytest.raises(RuntimeError):
+        router.complete("hi")
+
+
+def test_breaker_opens_after_consecutive_failures():
+    primary = Switch(down=True)
+    router = Router([provider("a", primary), provider("b")], default=["a", "b"], breaker_failures=3)
+
+    for _ in range(3):
+        assert router.complete("hi").provider == "b"
+    assert router.breakers["a"].state == "open"
+    assert router.candidates() == ["b"]
+
+    # An open provider is skipped without being called
+    router.complete("hi")
+    assert primary.calls == 3
+    with pytest.raises(ProviderUnavailable):
+        router.complete("hi", providers="a")
+
+
+def test_half_open_breaker_closes_after_a_successful_trial():
+    primary = Switch(down=True)
+    router = Router([provider("a", primary), provider("b")], default=["a", "b"], breaker_failures=2,
+                    breaker_cooldown=0.05)
+    router.complete("hi")
+    router.complete("hi")
+    assert router.breakers["a"].state == "open"
+
+    time.sleep(0.06)
+    assert router.breakers["a"].state == "half_open"
+    primary.down = False
+    assert router.complete("hi").provider == "a"
+    assert router.breakers["a"].state == "closed"
+    assert router.breakers["a"].consecutive_failures == 0
+
+
+def test_half_open_breaker_reopens_after_a_failed_trial():
+    primary = Switch(down=True)
+    router = Router([provider("a", primary), provider("b")], default=["a", "b"], breaker_failures=2,
+                    breaker_cooldown=0.05)
+    router.complete("hi")
+    router.complete("hi")
+    time.sleep(0.06)
+
+    assert router.complete("hi").provider == "b"
+    assert primary.calls == 3
+    assert router.breakers["a"].state == "open"
+    assert router.breakers["a"].trips == 2
+
+
+def test_half_open_breaker_lets_one_trial_through():
+    router = Router([provider("a", Switch(down=True))], default=["a"], breaker_failures=1, breaker_cooldown=0.05)
+    with pytest.raises(RuntimeError):
+        router.complete("hi")
+    time.sleep(0.06)
+
+    breaker = router.breakers["a"]
+    assert breaker.allow()
+    # Others wait for the trial's outcome
+    assert not breaker.allow()
+    assert router.candidates() == []
+
+
+def test_hedged_request_cancels_the_slower_provider():
+    slow, fast = Switch(), Switch()
+    router = Router([provider("a", slow, latency=1.0), provider("b", fast)], default=["a", "b"], hedge_after_ms=20)
+
+    started = time.monotonic()
+    completion = asyncio.run(router.acomplete("hi"))
+
+    assert completion.provider == "b"
+    assert time.monotonic() - started < 0.5
+    assert (router.hedged, router.hedge_wins) == (1, 1)
+    # The loser was cancelled mid-request: never answered, and counted as neither
+    # a success nor a failure
+    assert slow.calls == 0
+    assert router.stats["a"].requests == 0
+    assert router.breakers["a"].consecutive_failures == 0
+    assert router.breakers["a"].state == "closed"
+
+
+def test_fast_primary_is_not_hedged():
+    router = Router([provider("a"), provider("b")], default=["a", "b"], hedge_after_ms=200)
+    assert asyncio.run(router.acomplete("hi")).provider == "a"
+    assert router.hedged == 0
+
+
+def test_routed_calls_wait_for_the_picked_providers_limit(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "_rate_limiters", {})
+    monkeypatch.setenv("GROQ_RPM", "600")
+    router = Router([provider("groq"), provider("gemini")], default=["groq", "gemini"])
+    # Start from an empty bucket: each call waits its 0.1s turn
+    limiter = rate_limiter.get_rate_limiter("groq")
+    while limiter.reserve() == 0:
+        pass
+
+    started = time.monotonic()
+    assert router.complete("hi").provider == "groq"
+    assert asyncio.run(router.acomplete("hi")).provider == "groq"
+    assert "".join(router.stream("hi")) == "ok"
+
+    # The drained reservation plus one 0.1s slot per call
+    assert time.monotonic() - started >= 0.3
+    assert rate_limiter.get_rate_limiter("gemini").requests_per_minute is None
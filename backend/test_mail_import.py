@@ -0,0 +1,83 @@
+import json
+from backend import models
+from backend.services import mail_import
+
+
+def message(subject: str, body: str = "Hello there.", message_id: str = None, date: str = None,
+            sender: str = "alice@example.com") -> str:
+    headers = [f"From: Alice <{sender}>", "To: bob@example.com", f"Subject: {subject}"]
+    if date:
+        headers.append(f"Date: {date}")
+    if message_id:
+        headers.append(f"Message-ID: {message_id}")
+    return "\n".join(headers) + f"\n\n{body}\n"
+
+
+def mbox(*messages) -> str:
+    return "".join(f"From alice@example.com Mon May  6 09:00:00 2024\n{text}\n" for text in messages)
+
+
+def subjects(db) -> list:
+    return [subject for (subject,) in db.query(models.Email.subject).order_by(models.Email.id)]
+
+
+def test_resumes_an_appended_mbox_from_the_checkpoint(db, tmp_path):
+    path = tmp_path / "inbox.mbox"
+    path.write_text(mbox(message("one", message_id="<1@x>"), message("two", message_id="<2@x>")))
+    assert mail_import.import_mailbox(db, str(path))["imported"] == 2
+
+    with open(path, "a") as f:
+        f.write(mbox(message("three", message_id="<3@x>")))
+    stats = mail_import.import_mailbox(db, str(path))
+
+    # Only the appended message is read
+    assert (stats["messages"], stats["imported"], stats["duplicates"]) == (1, 1, 0)
+    assert subjects(db) == ["one", "two", "three"]
+    checkpoint = db.query(models.ImportCheckpoint).one()
+    assert checkpoint.position == path.stat().st_size
+    assert (checkpoint.messages, checkpoint.imported) == (3, 3)
+
+
+def test_rewritten_mbox_is_read_again_from_the_start(db, tmp_path):
+    path = tmp_path / "inbox.mbox"
+    path.write_text(mbox(message("one", message_id="<1@x>"), message("two", message_id="<2@x>")))
+    mail_import.import_mailbox(db, str(path))
+
+    # Same size or larger, different head: the fingerprint no longer matches
+    path.write_text(mbox(message("zero", message_id="<0@x>"), message("one", message_id="<1@x>"),
+                         message("two", message_id="<2@x>")))
+    stats = mail_import.import_mailbox(db, str(path))
+
+    assert (stats["messages"], stats["imported"], stats["duplicates"]) == (3, 1, 2)
+    assert sorted(subjects(db)) == ["one", "two", "zero"]
+
+
+def test_deduplicates_on_message_id_and_content_hash(db, tmp_path):
+    path = tmp_path / "export.jsonl"
+    records = [
+        {"sender": "a@example.com", "subject": "same id", "body": "first", "message_id": "<1@x>"},
+        {"sender": "a@example.com", "subject": "same id", "body": "edited", "message_id": "<1@x>"},
+        {"sender": "b@example.com", "subject": "no id", "body": "text", "timestamp": "2024-05-06T09:00:00"},
+        {"sender": "b@example.com", "subject": "no id", "body": "text", "timestamp": "2024-05-06T09:00:00"},
+    ]
+    path.write_text("".join(json.dumps(record) + "\n" for record in records))
+
+    stats = mail_import.import_mailbox(db, str(path))
+
+    assert (stats["imported"], stats["duplicates"]) == (2, 2)
+    assert db.query(models.Email).count() == 2
+
+
+def test_dateless_message_is_imported_once(db, tmp_path):
+    maildir = tmp_path / "Maildir"
+    for sub in ("new", "cur", "tmp"):
+        (maildir / sub).mkdir(parents=True)
+    (maildir / "new" / "1.eml").write_text(message("no date, no id"))
+
+    results = [mail_import.import_mailbox(db, str(maildir))["imported"] for _ in range(3)]
+
+    # The file at the watermark mtime is re-read every run and must dedup
+    assert results == [1, 0, 0]
+    email = db.query(models.Email).one()
+    assert email.timestamp is not None
+    assert email.content_hash == mail_import.content_hash("alice@example.com", "no date, no id", "Hello there.\n", None)
@@ -0,0 +1,70 @@
+import pytest
+from backend import migrations, models
+from backend.services import ingestion_service, prompt_templates
+from test_async_ingestion import NEWSLETTER, TODO, add_emails
+
+CATEGORIZATION = "Categorize this email as Important, Newsletter, Spam or To-Do.\n\nEmail Body:\n{email_body}"
+
+
+def versions(db, name: str) -> list:
+    return [version["version"] for version in prompt_templates.list_versions(db, name)]
+
+
+def test_changed_template_adds_a_version(db):
+    prompt, changed = prompt_templates.save_prompt(db, "categorization", CATEGORIZATION)
+    first = prompt.version_id
+    assert changed and versions(db, "categorization") == [1]
+
+    # Same template, new description: same version
+    prompt, changed = prompt_templates.save_prompt(db, "categorization", CATEGORIZATION, "Sorts the inbox")
+    assert not changed and prompt.version_id == first
+
+    prompt, changed = prompt_templates.save_prompt(db, "categorization", "Label it: {email_body}")
+    assert changed and prompt.version_id != first
+    assert versions(db, "categorization") == [2, 1]
+    assert prompt_templates.load_prompts(db)["categorization"].version == 2
+
+    with pytest.raises(prompt_templates.TemplateError):
+        prompt_templates.save_prompt(db, "categorization", "No body: {subject}")
+    assert versions(db, "categorization") == [2, 1]
+
+
+def test_reading_prompts_never_writes_a_version(db, client):
+    add_emails(db, [TODO])
+    db.query(models.Prompt).filter(models.Prompt.name == "categorization").update(
+        {models.Prompt.template: CATEGORIZATION}
+    )
+    db.commit()
+
+    prompts = prompt_templates.load_prompts(db)
+    assert prompts["categorization"].version_id is None
+    assert client.get("/ingest/stale").status_code == 200
+    assert versions(db, "categorization") == [1]
+    assert not db.dirty and not db.new
+
+    # The migration versions it, as does the next ingestion run
+    assert migrations.migrate(db.get_bind())["prompt_versions"] == 1
+    assert versions(db, "categorization") == [2, 1]
+    assert "prompt_versions" not in migrations.migrate(db.get_bind())
+    assert prompt_templates.load_prompts(db)["categorization"].version == 2
+
+
+def test_stale_counts_follow_prompt_versions(db, client, fake_provider):
+    fake_provider()
+    add_emails(db, [TODO, NEWSLETTER, TODO])
+    ingestion_service.process_all_emails(db)
+    nothing_stale = {"categorization": 0, "action_extraction": 0, "auto_reply": 0, "emails": 0}
+    assert client.get("/ingest/stale").json() == nothing_stale
+
+    prompt_templates.save_prompt(db, "auto_reply", "Reply briefly to this email.\n\nEmail Body:\n{email_body}")
+    # Only the two To-Do emails have generated drafts
+    assert client.get("/ingest/stale").json() == {**nothing_stale, "auto_reply": 2, "emails": 2}
+
+    prompt_templates.save_prompt(db, "categorization", CATEGORIZATION)
+    assert client.get("/ingest/stale").json() == {
+        "categorization": 3, "action_extraction": 0, "auto_reply": 2, "emails": 3
+    }
+
+    stats = ingestion_service.reprocess_stale(db)
+    assert stats["processed"] == 3
+    assert client.get("/ingest/stale").json() == nothing_stale
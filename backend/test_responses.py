@@ -0,0 +1,44 @@
+from datetime import datetime
+from backend import models
+
+
+def add_emails(db, count: int) -> list:
+    emails = [models.Email(sender="a@example.com", subject=f"Subject {n}", body="Hello.",
+                           timestamp=datetime(2024, 5, 1, 9, n)) for n in range(count)]
+    db.add_all(emails)
+    db.commit()
+    return emails
+
+
+def test_unchanged_page_answers_if_none_match_with_304(db, client):
+    add_emails(db, 3)
+    first = client.get("/emails", params={"limit": 2})
+    tag = first.headers["ETag"]
+    assert first.status_code == 200
+    assert len(first.json()) == 2
+
+    again = client.get("/emails", params={"limit": 2}, headers={"If-None-Match": tag})
+    assert again.status_code == 304
+    assert again.content == b""
+    # The headers a client needs to keep paging are still sent
+    assert again.headers["ETag"] == tag
+    assert again.headers["X-Next-Cursor"] == first.headers["X-Next-Cursor"]
+
+    # Weak and listed tags match too
+    for header in (f"W/{tag}", f'"other", {tag}', "*"):
+        assert client.get("/emails", params={"limit": 2}, headers={"If-None-Match": header}).status_code == 304
+
+
+def test_changed_page_gets_a_new_etag(db, client):
+    emails = add_emails(db, 2)
+    tag = client.get("/emails").headers["ETag"]
+
+    emails[0].is_read = True
+    db.commit()
+    changed = client.get("/emails", headers={"If-None-Match": tag})
+
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != tag
+    assert {email["id"]: email["is_read"] for email in changed.json()}[emails[0].id] is True
+    # A different page of the same data has its own tag
+    assert client.get("/emails", params={"limit": 1}, headers={"If-None-Match": tag}).status_code == 200
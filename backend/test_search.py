@@ -0,0 +1,76 @@
+from datetime import datetime
+from sqlalchemy import text
+from backend import models
+from backend.services import search
+
+
+def matches(db, query: str) -> list:
+    return [rowid for (rowid,) in db.execute(
+        text("SELECT rowid FROM emails_fts WHERE emails_fts MATCH :match ORDER BY rowid"),
+        {"match": search.to_match_query(query)},
+    )]
+
+
+def add_email(db, subject: str, body: str, sender: str = "alice@example.com", category: str = "Work"):
+    email = models.Email(sender=sender, subject=subject, body=body, category=category,
+                         timestamp=datetime(2024, 5, 1))
+    db.add(email)
+    db.commit()
+    return email
+
+
+def test_triggers_keep_the_index_in_sync(db):
+    email = add_email(db, "Quarterly budget", "Numbers attached.")
+    assert matches(db, "budget") == [email.id]
+
+    email.subject = "Quarterly forecast"
+    db.commit()
+    assert matches(db, "budget") == []
+    assert matches(db, "forecast") == [email.id]
+
+    # Updates to columns that aren't indexed leave the entry as it was
+    email.category = "Important"
+    email.is_read = True
+    db.commit()
+    assert matches(db, "forecast") == [email.id]
+
+    db.delete(email)
+    db.commit()
+    assert matches(db, "forecast") == []
+    # The external-content index still agrees with the emails table
+    db.execute(text("INSERT INTO emails_fts(emails_fts) VALUES ('integrity-check')"))
+
+
+def test_search_endpoint_ranks_subject_matches_first(db, client):
+    in_body = add_email(db, "Team lunch", "Bring the invoice for the offsite to the meeting.")
+    in_subject = add_email(db, "Invoice overdue", "Please pay this week.")
+    add_email(db, "Weekly digest", "Nothing about billing here.", category="Newsletter")
+
+    results = client.get("/emails/search", params={"q": "invoice"}).json()
+
+    # The subject column weighs 10x the body in bm25
+    assert [result["id"] for result in results] == [in_subject.id, in_body.id]
+    assert results[0]["rank"] < results[1]["rank"] < 0
+    assert results[0]["snippet"] == "Please pay this week."
+    assert results[1]["snippet"] == "Bring the [invoice] for the offsite to the meeting."
+    assert {key: results[0][key] for key in ("sender", "subject", "category")} == {
+        "sender": "alice@example.com", "subject": "Invoice overdue", "category": "Work"
+    }
+
+
+def test_search_endpoint_filters_and_pages(db, client):
+    emails = [add_email(db, f"Report {n}", "Quarterly report attached.", category=category)
+              for n, category in enumerate(["Work", "Newsletter", "Work"])]
+
+    work = client.get("/emails/search", params={"q": "report", "category": "Work"}).json()
+    assert sorted(result["id"] for result in work) == [emails[0].id, emails[2].id]
+
+    pages = [client.get("/emails/search", params={"q": "report", "limit": 2, "offset": offset}).json()
+             for offset in (0, 2)]
+    assert [len(page) for page in pages] == [2, 1]
+    assert sorted(result["id"] for page in pages for result in page) == [email.id for email in emails]
+
+    # Prefix matching is opt-in, and a query without terms matches nothing
+    assert client.get("/emails/search", params={"q": "quarter"}).json() == []
+    assert len(client.get("/emails/search", params={"q": "quarter", "prefix": True}).json()) == 3
+    assert client.get("/emails/search", params={"q": "?!"}).json() == []
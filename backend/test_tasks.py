@@ -0,0 +1,69 @@
+import json
+from datetime import date, datetime
+import pytest
+from backend import models
+from backend.services import tasks
+from backend.services.tasks import parse_deadline
+
+# A Wednesday
+RECEIVED = datetime(2024, 5, 15, 9, 30)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("2024-06-01", date(2024, 6, 1)),
+    ("by 6/3", date(2024, 6, 3)),
+    ("Oct 3", date(2024, 10, 3)),
+    ("3rd of June", date(2024, 6, 3)),
+    # A month-day more than a week past is next year's
+    ("Jan 5", date(2025, 1, 5)),
+    ("tomorrow", date(2024, 5, 16)),
+    ("EOD", date(2024, 5, 15)),
+    ("ASAP", date(2024, 5, 15)),
+    ("in 3 days", date(2024, 5, 18)),
+    ("in two weeks", date(2024, 5, 29)),
+    ("end of week", date(2024, 5, 17)),
+    ("next week", date(2024, 5, 20)),
+    ("end of the month", date(2024, 5, 31)),
+    ("Friday", date(2024, 5, 17)),
+    ("by Monday", date(2024, 5, 20)),
+    # The same weekday is today, unless it says "next"
+    ("wed", date(2024, 5, 15)),
+    ("next Wednesday", date(2024, 5, 22)),
+])
+def test_parses_dates_relative_to_the_email(text, expected):
+    assert parse_deadline(text, RECEIVED) == expected
+
+
+@pytest.mark.parametrize("text", [None, 42, "", "None", "null", "N/A", "  TBD ", "no deadline", "soon", "Feb 30"])
+def test_no_date_parses_to_none(text):
+    assert parse_deadline(text, RECEIVED) is None
+
+
+def test_placeholder_deadlines_are_stored_as_null(db):
+    email = models.Email(sender="a@example.com", subject="Report", body="", timestamp=RECEIVED)
+    db.add(email)
+    items = [
+        {"task": "Send the report", "deadline": "Friday"},
+        {"task": "Book a room", "deadline": None},
+        {"task": "Call Bob", "deadline": "None"},
+        {"task": "Reply", "deadline": " n/a "},
+        {"task": "Review", "deadline": "sometime soon"},
+    ]
+    tasks.set_action_items(email, json.dumps(items))
+    db.commit()
+
+    stored = [(item.deadline_text, item.deadline) for item in email.tasks]
+    assert stored == [("Friday", date(2024, 5, 17)), (None, None), (None, None), (None, None),
+                      ("sometime soon", None)]
+
+
+def test_clears_placeholders_stored_by_earlier_versions(db):
+    email = models.Email(sender="a@example.com", subject="Report", body="", timestamp=RECEIVED)
+    email.tasks = [models.ActionItem(task=f"Task {n}", deadline_text=text, position=n)
+                   for n, text in enumerate(["None", " TBD", "Friday"])]
+    db.add(email)
+    db.commit()
+
+    assert tasks.clear_placeholder_deadlines(db) == 2
+    db.expire_all()
+    assert [item.deadline_text for item in email.tasks] == [None, None, "Friday"]
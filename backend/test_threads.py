@@ -0,0 +1,121 @@
+import asyncio
+from datetime import datetime, timedelta
+import pytest
+from backend import models
+from backend.services import fake_llm, ingestion_service, mock_data, threads
+from backend.services.async_ingestion import process_all_emails_async
+
+START = datetime(2024, 5, 1, 9, 0)
+
+
+def add_email(db, minutes: int, subject: str, body: str = "Sounds good.", sender: str = "alice@example.com",
+              recipients: str = "bob@example.com", message_id: str = None, in_reply_to: str = None,
+              references: str = None):
+    email = models.Email(sender=sender, recipients=recipients, subject=subject, body=body,
+                         timestamp=START + timedelta(minutes=minutes), message_id=message_id,
+                         in_reply_to=in_reply_to, references=references)
+    db.add(email)
+    db.commit()
+    return email
+
+
+def index(db) -> int:
+    indexed = threads.index_emails(db)
+    db.commit()
+    db.expire_all()
+    return indexed
+
+
+def test_replies_join_the_thread_they_name(db):
+    root = add_email(db, 0, "Budget Q3", message_id="<1@x>")
+    reply = add_email(db, 5, "Re: Budget Q3", sender="bob@example.com", message_id="<2@x>", in_reply_to="<1@x>")
+    # References alone are enough, whatever the subject says
+    renamed = add_email(db, 10, "Numbers for next week", sender="carol@example.com", message_id="<3@x>",
+                        references="<1@x> <2@x>")
+    # Same subject without reply headers or a Re: prefix starts its own thread
+    unrelated = add_email(db, 15, "Budget Q3", sender="dave@example.com", recipients="erin@example.com")
+
+    assert index(db) == 4
+
+    assert root.thread_id == reply.thread_id == renamed.thread_id != unrelated.thread_id
+    thread = root.thread
+    assert (thread.subject, thread.message_count, thread.last_email_id) == ("Budget Q3", 3, renamed.id)
+    assert thread.participants.split() == ["alice@example.com", "bob@example.com", "carol@example.com"]
+    assert db.query(models.Thread).count() == 2
+
+
+def test_reply_indexed_before_its_parent_is_merged_into_it(db):
+    reply = add_email(db, 5, "Re: Offsite", sender="bob@example.com", message_id="<2@x>", in_reply_to="<1@x>")
+    index(db)
+    root = add_email(db, 0, "Offsite", message_id="<1@x>")
+    index(db)
+
+    assert root.thread_id == reply.thread_id
+    assert db.query(models.Thread).count() == 1
+    assert (root.thread.message_count, root.thread.last_email_id, root.thread.subject) == (2, reply.id, "Offsite")
+
+
+def test_subject_fallback_needs_a_shared_participant(db):
+    root = add_email(db, 0, "Lunch?")
+    # No reply headers: the Re: prefix, subject and a shared address join the thread
+    reply = add_email(db, 5, "RE: [team] Lunch?", sender="bob@example.com", recipients="alice@example.com")
+    stranger = add_email(db, 10, "Re: Lunch?", sender="zed@example.com", recipients="yan@example.com")
+    index(db)
+
+    assert root.thread_id == reply.thread_id != stranger.thread_id
+
+
+def test_reply_outside_the_subject_window_starts_a_new_thread(db):
+    root = add_email(db, 0, "Lunch?")
+    late = add_email(db, 60 * 24 * (threads.THREAD_SUBJECT_WINDOW_DAYS + 1), "Re: Lunch?", sender="bob@example.com",
+                     recipients="alice@example.com")
+    index(db)
+
+    assert root.thread_id != late.thread_id
+
+
+def sync_ingest(db):
+    return ingestion_service.process_all_emails(db)
+
+
+def async_ingest(db):
+    return asyncio.run(process_all_emails_async(db, concurrency=2))
+
+
+@pytest.mark.parametrize("ingest", [sync_ingest, async_ingest])
+def test_older_messages_inherit_the_newest_messages_results(db, fake_provider, ingest):
+    prompts = []
+
+    def respond(prompt):
+        prompts.append(prompt)
+        return fake_llm.default_responder(prompt)
+
+    fake_provider(responder=respond)
+    mock_data.create_default_prompts(db)
+    root = add_email(db, 0, "Report", message_id="<1@x>")
+    reply = add_email(db, 5, "Re: Report", sender="bob@example.com", message_id="<2@x>", in_reply_to="<1@x>")
+    latest = add_email(db, 10, "Re: Report", body="Please review the attached report and send your comments.",
+                       message_id="<3@x>", in_reply_to="<2@x>")
+    index(db)
+
+    stats = ingest(db)
+
+    # Only the newest message is sent to the LLM, with the earlier ones as context
+    assert stats["processed"] == 1
+    categorize = [prompt for prompt in prompts if prompt.lower().startswith("categorize")]
+    assert len(categorize) == 1
+    assert "Earlier in this thread:" in categorize[0]
+    db.expire_all()
+    assert [email.category for email in (root, reply, latest)] == ["To-Do"] * 3
+    # Action items and drafts stay with the message they came from
+    assert (len(root.tasks), len(reply.tasks), len(latest.tasks)) == (0, 0, 1)
+    assert [draft.email_id for draft in db.query(models.Draft)] == [latest.id]
+
+    # A message older than the thread's newest, arriving late, takes its category
+    # as it is threaded, without another LLM call
+    calls = len(prompts)
+    late = add_email(db, 2, "Re: Report", sender="carol@example.com", message_id="<4@x>", in_reply_to="<1@x>")
+    index(db)
+    assert late.category == "To-Do"
+    assert ingest(db)["processed"] == 0
+    assert len(prompts) == calls
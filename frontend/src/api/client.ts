@@ -24,9 +24,20 @@ export const loadMockData = async () => {
     return response.data;
 };
 
-export const processInbox = async () => {
-    const response = await client.post('/ingest/process');
+export const getJob = async (jobId: number) => {
+    const response = await client.get(`/jobs/${jobId}`);
     return response.data;
 };
 
+// Ingestion runs as a background job; resolve once it has finished
+export const processInbox = async (pollMs = 1000) => {
+    const response = await client.post('/ingest/process');
+    let job = response.data;
+    while (job.status === 'queued' || job.status === 'running') {
+        await new Promise((resolve) => setTimeout(resolve, pollMs));
+        job = await getJob(job.id);
+    }
+    return job;
+};
+
 export default client;
@@ -1,9 +1,9 @@
-from backend.database import SessionLocal, engine
-from backend import models
+from backend.database import SessionLocal
+from backend import migrations, models
 from backend.services import mock_data
 
 # Ensure tables exist
-models.Base.metadata.create_all(bind=engine)
+migrations.migrate()
 
 db = SessionLocal()
 try: